@@ -0,0 +1,342 @@
+# analytics.py
+
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import numpy as np
+from config import (
+    ANALYTICS_ENABLED,
+    ANALYTICS_SQLITE_PATH,
+    ANALYTICS_MIN_COHORT,
+    ANALYTICS_TOP_GROUPS,
+    SESSION_STORE_BACKEND,
+)
+from evaluation import EVALUATION_DIMENSIONS, summarize_scores
+from metrics import registry, timed
+from sentiment import SentimentAggregate, fold
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Agrupaciones admitidas en las consultas: nombre -> expresión SQL de la clave del grupo
+GROUP_BY = {
+    "position": "position_key",
+    "ubicacion": "ubicacion",
+    "modalidad": "modalidad",
+    "month": "month",
+}
+# Métricas por respuesta guardadas como arrays float32 (columna BLOB)
+SERIES = ("scores", "polarity")
+
+_COLUMNS = (
+    "session_id", "finished_at", "month", "position", "position_key", "modalidad", "ubicacion",
+    "num_questions", "num_answers", "avg_score", "avg_polarity", "polarity_variance", "polarity_trend",
+    *EVALUATION_DIMENSIONS, "summary",
+)
+_SERIES_COLUMNS = ("session_id", *SERIES)
+# Columnas que se agregan: los índices las incluyen para que las consultas de cohortes
+# se resuelvan leyendo solo el índice (covering index), sin acceder a la tabla
+_METRICS = ("avg_score", "avg_polarity", *EVALUATION_DIMENSIONS)
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS interviews (
+    session_id TEXT PRIMARY KEY,
+    finished_at REAL NOT NULL,
+    month TEXT NOT NULL,
+    position TEXT NOT NULL,
+    position_key TEXT NOT NULL,
+    modalidad TEXT NOT NULL DEFAULT '',
+    ubicacion TEXT NOT NULL DEFAULT '',
+    num_questions INTEGER NOT NULL,
+    num_answers INTEGER NOT NULL,
+    avg_score REAL,
+    avg_polarity REAL,
+    polarity_variance REAL,
+    polarity_trend REAL,
+    {dimensions},
+    summary TEXT NOT NULL DEFAULT ''
+);
+CREATE TABLE IF NOT EXISTS interview_series (
+    session_id TEXT PRIMARY KEY,
+    scores BLOB NOT NULL,
+    polarity BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_interviews_position ON interviews (position_key, finished_at, position, {metrics});
+CREATE INDEX IF NOT EXISTS idx_interviews_ubicacion ON interviews (ubicacion, finished_at, {metrics});
+CREATE INDEX IF NOT EXISTS idx_interviews_finished ON interviews (finished_at, {metrics});
+CREATE INDEX IF NOT EXISTS idx_interviews_month ON interviews (month, {metrics});
+""".format(
+    dimensions=", ".join(f"{name} REAL" for name in EVALUATION_DIMENSIONS),
+    metrics=", ".join(_METRICS),
+)
+
+
+def position_key(position):
+    """Clave de agrupación del puesto: sin tildes, en minúsculas y con los espacios normalizados."""
+    return " ".join(fold(position or "").split())
+
+
+def _pack(values):
+    return np.asarray(values, dtype=np.float32).tobytes()
+
+
+def _unpack(blob):
+    return np.frombuffer(blob, dtype=np.float32)
+
+
+def compact_summary(state, scores=None):
+    """
+    Resumen de una línea a partir de los campos tipados del estado, sin repetir el
+    historial: número de respuestas, nota media, dimensión más fuerte y más débil y tono.
+    """
+    scores = scores or summarize_scores(state.evaluation_results)
+    parts = [f"{len(state.polarity_list)} respuestas para {state.position}"]
+    if scores["mean"] is not None:
+        parts.append(f"puntuación media {scores['mean']:.1f}/10")
+    if len(scores["dimensions"]) > 1:
+        ranked = sorted(scores["dimensions"].items(), key=lambda item: item[1])
+        parts.append(f"mejor en {ranked[-1][0]}, a reforzar {ranked[0][0]}")
+    if state.polarity_list:
+        parts.append(f"tono medio {state.avg_polarity:+.2f}")
+    return ", ".join(parts) + "."
+
+
+def interview_row(state):
+    """Fila del almacén a partir de un InterviewState finalizado."""
+    scores = summarize_scores(state.evaluation_results)
+    sentiment = SentimentAggregate.from_dict(state.sentiment_stats) if state.sentiment_stats \
+        else SentimentAggregate.from_values(state.polarity_list)
+    # Las evaluaciones sin nota se guardan como NaN para conservar la posición de cada respuesta
+    per_answer = [result.get("score") for result in state.evaluation_results]
+    row = {
+        "session_id": state.session_id,
+        "finished_at": state.updated_at,
+        "month": time.strftime("%Y-%m", time.localtime(state.updated_at)),
+        "position": state.position,
+        "position_key": position_key(state.position),
+        "modalidad": state.modalidad or "",
+        "ubicacion": state.ubicacion or "",
+        "num_questions": state.num_questions,
+        "num_answers": len(state.polarity_list),
+        "avg_score": scores["mean"],
+        "avg_polarity": sentiment.mean if sentiment.count else None,
+        "polarity_variance": sentiment.variance if sentiment.count else None,
+        "polarity_trend": sentiment.trend if sentiment.count else None,
+        "scores": _pack([np.nan if score is None else score for score in per_answer]),
+        "polarity": _pack(state.polarity_list),
+        "summary": compact_summary(state, scores),
+    }
+    for name in EVALUATION_DIMENSIONS:
+        row[name] = scores["dimensions"].get(name)
+    return row
+
+
+class AnalyticsStore:
+    """
+    Almacén en sqlite de las entrevistas finalizadas de todas las sesiones: una fila
+    por entrevista con columnas tipadas (nota, polaridad y rúbrica ya agregadas) y, en
+    una tabla aparte para que las filas que recorren las agregaciones sean estrechas,
+    los valores por respuesta en arrays float32. Las consultas de cohortes (por puesto,
+    ubicación, modalidad o mes) se resuelven con GROUP BY sobre esas columnas y nunca
+    leen las transcripciones, que siguen solo en el almacén de sesiones.
+    """
+    def __init__(self, path=ANALYTICS_SQLITE_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+        self._lock = threading.Lock()
+
+    def record_many(self, states):
+        """Añade (o actualiza) las entrevistas finalizadas de 'states' en una sola transacción."""
+        rows = [interview_row(state) for state in states if state.finished]
+        if not rows:
+            return 0
+        with self._lock:
+            for table, columns in (("interviews", _COLUMNS), ("interview_series", _SERIES_COLUMNS)):
+                self._conn.executemany(
+                    f"INSERT OR REPLACE INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                    [tuple(row[name] for name in columns) for row in rows],
+                )
+            self._conn.commit()
+        registry.inc("analytics_recorded_total", len(rows))
+        return len(rows)
+
+    def record(self, state):
+        return self.record_many([state])
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM interviews").fetchone()[0]
+
+    @staticmethod
+    def _where(position=None, ubicacion=None, modalidad=None, since=None, until=None):
+        clauses, params = [], []
+        if position:
+            clauses.append("position_key = ?")
+            params.append(position_key(position))
+        if ubicacion:
+            clauses.append("ubicacion = ?")
+            params.append(ubicacion)
+        if modalidad:
+            clauses.append("modalidad = ?")
+            params.append(modalidad)
+        if since is not None:
+            clauses.append("finished_at >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("finished_at < ?")
+            params.append(until)
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    @timed("analytics_query")
+    def aggregate(self, by="position", min_count=1, limit=None, **filters):
+        """
+        Agregados por grupo ('position', 'ubicacion', 'modalidad' o 'month'), de mayor a
+        menor número de entrevistas: count, avg_score, avg_polarity y la media de cada
+        dimensión de la rúbrica. Los filtros son los de _where (position, ubicacion,
+        modalidad, since, until).
+        """
+        if by not in GROUP_BY:
+            raise ValueError(f"Agrupación desconocida '{by}': usa una de {', '.join(GROUP_BY)}")
+        where, params = self._where(**filters)
+        # Un mismo puesto puede estar escrito de varias formas: se muestra la primera en orden alfabético
+        label = "MIN(position)" if by == "position" else GROUP_BY[by]
+        dimensions = "".join(f", AVG({name})" for name in EVALUATION_DIMENSIONS)
+        sql = (f"SELECT {label}, COUNT(*), AVG(avg_score), AVG(avg_polarity){dimensions} FROM interviews{where} "
+               f"GROUP BY {GROUP_BY[by]} HAVING COUNT(*) >= ? ORDER BY COUNT(*) DESC")
+        params.append(min_count)
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        fields = ("group", "count", "avg_score", "avg_polarity", *EVALUATION_DIMENSIONS)
+        return [dict(zip(fields, row)) for row in rows]
+
+    @timed("analytics_query")
+    def turn_profile(self, series="polarity", max_turns=10, **filters):
+        """
+        Media de 'series' ('scores' o 'polarity') por número de respuesta (1..max_turns)
+        en la cohorte filtrada, calculada con NumPy sobre los arrays de cada entrevista.
+        Devuelve {"mean": [...], "count": [...]} (None donde no hay datos).
+        """
+        if series not in SERIES:
+            raise ValueError(f"Serie desconocida '{series}': usa una de {', '.join(SERIES)}")
+        where, params = self._where(**filters)
+        with self._lock:
+            blobs = [row[0] for row in self._conn.execute(
+                f"SELECT {series} FROM interviews JOIN interview_series USING (session_id){where}", params)]
+        # Todos los arrays en uno solo y, para cada valor, su número de respuesta (0, 1, ...)
+        lengths = np.fromiter((len(blob) // 4 for blob in blobs), dtype=np.int64, count=len(blobs))
+        values = np.frombuffer(b"".join(blobs), dtype=np.float32)
+        turns = np.arange(len(values)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        keep = (turns < max_turns) & ~np.isnan(values)
+        counts = np.bincount(turns[keep], minlength=max_turns)[:max_turns]
+        totals = np.bincount(turns[keep], weights=values[keep], minlength=max_turns)[:max_turns]
+        means = np.divide(totals, counts, out=np.full(max_turns, np.nan), where=counts > 0)
+        return {"mean": [None if np.isnan(value) else round(float(value), 4) for value in means],
+                "count": counts.tolist()}
+
+    def cohort(self, state, min_count=ANALYTICS_MIN_COHORT):
+        """
+        Agregados de las demás entrevistas del mismo puesto, para comparar con 'state'.
+        Devuelve None si hay menos de 'min_count'.
+        """
+        where, params = self._where(position=state.position)
+        where += (" AND" if where else " WHERE") + " session_id != ?"
+        with self._lock:
+            row = self._conn.execute(f"SELECT COUNT(*), AVG(avg_score), AVG(avg_polarity) FROM interviews{where}",
+                                     params + [state.session_id]).fetchone()
+        if row[0] < min_count:
+            return None
+        return {"count": row[0], "avg_score": row[1], "avg_polarity": row[2]}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_default_store = None
+_default_lock = threading.Lock()
+
+
+def get_analytics_store():
+    """Devuelve el almacén analítico del proceso, o None si ANALYTICS_ENABLED está desactivado."""
+    global _default_store
+    if not ANALYTICS_ENABLED:
+        return None
+    with _default_lock:
+        if _default_store is None:
+            _default_store = AnalyticsStore()
+        return _default_store
+
+
+def record_finished(state):
+    """Registra una entrevista finalizada; los errores se registran en el log y no interrumpen la aplicación."""
+    try:
+        store = get_analytics_store()
+        if store is not None:
+            store.record(state)
+    except Exception as e:
+        logging.error(f"Error registrando la entrevista {state.session_id} en el almacén analítico: {e}")
+
+
+# ==============================
+# Línea de comandos: carga desde el almacén de sesiones y consultas
+# ==============================
+
+def backfill(records, store, batch_size=500):
+    """Carga en 'store' las entrevistas finalizadas de 'records' (diccionarios de estado)."""
+    from interview_session import InterviewState
+    batch, total = [], 0
+    for data in records:
+        if data.get("finished"):
+            batch.append(InterviewState.from_dict(data))
+        if len(batch) >= batch_size:
+            total += store.record_many(batch)
+            batch = []
+    return total + store.record_many(batch)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Almacén analítico de las entrevistas finalizadas.")
+    parser.add_argument("--path", default=ANALYTICS_SQLITE_PATH, help="Fichero sqlite del almacén")
+    commands = parser.add_subparsers(dest="command", required=True)
+    load = commands.add_parser("backfill", help="Carga las entrevistas finalizadas ya guardadas")
+    load.add_argument("--input", help="JSONL con estados de entrevista (por defecto, el almacén de sesiones)")
+    load.add_argument("--backend", default=SESSION_STORE_BACKEND, help="Almacén de sesiones: file, sqlite o redis")
+    query = commands.add_parser("query", help="Agregados por grupo")
+    query.add_argument("--by", choices=sorted(GROUP_BY), default="position")
+    query.add_argument("--position")
+    query.add_argument("--ubicacion")
+    query.add_argument("--modalidad")
+    query.add_argument("--min-count", type=int, default=1)
+    query.add_argument("--limit", type=int, default=ANALYTICS_TOP_GROUPS)
+    args = parser.parse_args(argv)
+
+    store = AnalyticsStore(args.path)
+    if args.command == "backfill":
+        from report_export import iter_jsonl_records, iter_store_records
+        if args.input:
+            records = iter_jsonl_records(args.input)
+        else:
+            from session_store import create_session_store
+            records = iter_store_records(create_session_store(args.backend))
+        start = time.perf_counter()
+        loaded = backfill(records, store)
+        print(json.dumps({"loaded": loaded, "total": store.count(),
+                          "elapsed": round(time.perf_counter() - start, 3)}))
+    else:
+        start = time.perf_counter()
+        rows = store.aggregate(by=args.by, min_count=args.min_count, limit=args.limit, position=args.position,
+                               ubicacion=args.ubicacion, modalidad=args.modalidad)
+        print(json.dumps({"rows": rows, "elapsed": round(time.perf_counter() - start, 4)}, ensure_ascii=False))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -2,25 +2,27 @@
 
 import logging
 import urllib.parse
-import requests
-import time
 import streamlit as st
-import plotly.express as px
-from streamlit_lottie import st_lottie
-from interviewer import Interviewer
+from invocation import ModelInvocationError
+from bedrock_client import get_client_stats
+from interview_session import SessionError
+from session_store import get_session_manager
+from countries import get_country_index
+from config import METRICS_ADMIN_PANEL, LOTTIE_HEADER_URL, ANALYTICS_ENABLED, ANALYTICS_TOP_GROUPS
+from startup import warm_up_in_background
+import pdf_report
+import metrics
 from helpers import (
-    get_countries_data,
-    upload_and_parse_cv,
-    sentiment_analysis,
-    load_lottieurl,
-    generate_final_summary
+    parse_cv,
+    load_lottieurl
 )
-import io
-from fpdf import FPDF
 
 # Configuración del logging (opcional si ya lo configuras globalmente)
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# Exportadores de métricas (endpoint /metrics y volcado JSON, si están configurados)
+metrics.start_exporters()
+
 # ==============================
 # ESTILOS Y ASPECTO CORPORATIVO
 # ==============================
@@ -81,40 +83,71 @@ st.markdown(
 )
 
 # ==============================
-# Función para exportar el PDF en memoria
+# Renderizado de respuestas en streaming
 # ==============================
 
-def export_to_pdf_in_memory(content: str) -> io.BytesIO:
-    """Genera un PDF en memoria a partir de texto plano."""
-    # 1. Reemplazar caracteres conflictivos (comillas, guiones largos, etc.)
-    #   por sus equivalentes ASCII.
-    content_cleaned = (content
-                       .replace("“", '"')
-                       .replace("”", '"')
-                       .replace("’", "'")
-                       .replace("‘", "'")
-                       .replace("–", "-")
-                       .replace("—", "-")
-                       .replace("…", "..."))
-
-    # 2. Crear objeto FPDF
-    pdf = FPDF()
-    pdf.add_page()
-    pdf.set_font("Arial", size=12)
-    pdf.multi_cell(0, 10, content_cleaned)
+def render_stream(placeholder, chunks, prefix=""):
+    """Muestra los fragmentos de texto según llegan y devuelve el texto completo."""
+    parts = []
+    for chunk in chunks:
+        parts.append(chunk)
+        placeholder.markdown(prefix + "".join(parts) + "▌")
+    text = "".join(parts).strip()
+    placeholder.markdown(prefix + text)
+    return text
 
-    # 3. Generar string del PDF en memoria
-    pdf_str = pdf.output(dest='S')  # Dependiendo de la versión, puede devolver str o bytes
+def get_current_session():
+    """
+    Devuelve la sesión de entrevista del usuario. En st.session_state solo se guarda su id;
+    el estado vive en el almacén de sesiones, y el id se refleja en la URL (?sesion=...)
+    para poder retomar la entrevista tras un reinicio o desde otro worker.
+    """
+    manager = get_session_manager()
+    query_params = getattr(st, "query_params", None)  # Disponible desde Streamlit 1.30
+    session_id = st.session_state.get("session_id")
+    if session_id is None and query_params is not None:
+        session_id = query_params.get("sesion")
+    session = manager.get_or_create(session_id)
+    if session.session_id != session_id:
+        logging.info(f"Nueva sesión de entrevista {session.session_id}.")
+    st.session_state.session_id = session.session_id
+    if query_params is not None and query_params.get("sesion") != session.session_id:
+        query_params["sesion"] = session.session_id
+    return manager, session
 
-    # 4. Asegurarnos de que 'pdf_str' sea bytes
-    if isinstance(pdf_str, str):
-        # encode() a latin-1 ignorando caracteres no representables
-        pdf_str = pdf_str.encode('latin-1', 'ignore')
+def render_cohort_comparison(state):
+    """
+    Compara la entrevista con las demás del mismo puesto y muestra la puntuación y la
+    polaridad medias de los puestos con más entrevistas. Solo lee los agregados del
+    almacén analítico, nunca las transcripciones.
+    """
+    try:
+        import analytics  # Importación diferida: solo al terminar una entrevista
+        store = analytics.get_analytics_store()
+        cohort = store.cohort(state)
+        groups = store.aggregate(by="position", limit=ANALYTICS_TOP_GROUPS)
+    except Exception as e:
+        logging.error(f"Error consultando el almacén analítico: {e}")
+        return
+    st.markdown("### Comparativa con Otras Entrevistas")
+    if cohort:
+        if state.avg_score is not None and cohort["avg_score"] is not None:
+            st.write(f"**Puntuación media:** {state.avg_score:.1f}/10 frente a {cohort['avg_score']:.1f}/10 "
+                     f"en {cohort['count']} entrevistas para el mismo puesto.")
+        if cohort["avg_polarity"] is not None:
+            st.write(f"**Tono medio:** {state.avg_polarity:+.2f} frente a {cohort['avg_polarity']:+.2f}.")
+    else:
+        st.info("Todavía no hay suficientes entrevistas para este puesto como para compararlas.")
+    if len(groups) > 1:
+        data = {"Puesto": [group["group"] for group in groups],
+                "Puntuación media": [group["avg_score"] for group in groups],
+                "Polaridad media": [group["avg_polarity"] for group in groups],
+                "Entrevistas": [group["count"] for group in groups]}
+        import plotly.express as px
+        fig = px.bar(data, x="Puesto", y="Puntuación media", color="Polaridad media", hover_data=["Entrevistas"],
+                     range_y=[0, 10], title="Puntuación y Polaridad Medias por Puesto")
+        st.plotly_chart(fig)
 
-    # 5. Crear buffer BytesIO y retornarlo
-    pdf_buffer = io.BytesIO(pdf_str)
-    pdf_buffer.seek(0)
-    return pdf_buffer
 # ==============================
 # MAIN APP
 # ==============================
@@ -122,73 +155,44 @@ def main():
     # Encabezado profesional con animación Lottie
     st.markdown("<div class='header'><h1>Entrevistador Virtual</h1><p>Soluciones de Inteligencia Artificial para potenciar tu carrera</p></div>", unsafe_allow_html=True)
     
-    # Animación Lottie
-    lottie_animation = load_lottieurl("https://assets1.lottiefiles.com/packages/lf20_jcikwtux.json")
+    # Animación Lottie (desde el caché local; la primera vez se descarga en segundo plano)
+    lottie_animation = load_lottieurl(LOTTIE_HEADER_URL, background=True)
     if lottie_animation:
+        from streamlit_lottie import st_lottie
         st_lottie(lottie_animation, height=150, key="initial")
 
     st.write("Sube tu CV y especifica el puesto al que deseas postular. El sistema generará preguntas de entrevista y evaluará tus respuestas, brindándote un análisis profundo y recomendaciones.")
 
     # --------------------------
-    # Inicialización de variables en session_state
+    # Motor de la entrevista (todo el estado vive en InterviewSession, persistido en el almacén)
     # --------------------------
-    if "conversation_history" not in st.session_state:
-        st.session_state.conversation_history = ""
-    if "cv_text" not in st.session_state:
-        st.session_state.cv_text = ""
-    if "position" not in st.session_state:
-        st.session_state.position = ""
-    if "modalidad" not in st.session_state:
-        st.session_state.modalidad = ""
-    if "ubicacion" not in st.session_state:
-        st.session_state.ubicacion = ""
-    if "num_questions" not in st.session_state:
-        st.session_state.num_questions = 0
-    if "interview_finished" not in st.session_state:
-        st.session_state.interview_finished = False
-    if "last_question" not in st.session_state:
-        st.session_state.last_question = ""
-    if "polarity_list" not in st.session_state:
-        st.session_state.polarity_list = []
-    if "final_summary" not in st.session_state:
-        st.session_state.final_summary = ""
-    if "avg_polarity" not in st.session_state:
-        st.session_state.avg_polarity = 0.0
-    if "final_summary_generated" not in st.session_state:
-        st.session_state.final_summary_generated = False
-    if "evaluations" not in st.session_state:
-        st.session_state.evaluations = []  # Se almacena la evaluación de cada respuesta
+    manager, session = get_current_session()
+    state = session.state
+    logging.debug(f"Cliente de Bedrock: {get_client_stats()}")
 
     # Barra de progreso
-    progress = st.progress(0)
-
-    # --------------------------
-    # Inicialización del entrevistador
-    # --------------------------
-    interviewer = Interviewer()
+    progress = st.progress(state.progress)
 
     # --------------------------
     # Subida del CV y configuración inicial
     # --------------------------
-    if not st.session_state.cv_text or not st.session_state.position:
+    if not state.started:
         uploaded_file = st.file_uploader("Sube tu CV en formato PDF", type=["pdf"])
         position = st.text_input("Ingresa el puesto al que deseas postular")
         modalidad = st.radio("Selecciona la modalidad de trabajo:", ("Remoto", "Presencial", "Ambos"))
         
         st.markdown("### Selecciona la ubicación usando la API")
-        countries_data = get_countries_data()
-        if not countries_data:
+        country_index = get_country_index()
+        ubicacion = ""
+        if not country_index.countries:
             st.error("No se pudieron cargar los datos de países y ciudades.")
         else:
-            list_countries = sorted([country["country"] for country in countries_data])
-            selected_countries = st.multiselect("Selecciona uno o varios países:", list_countries)
-            ubicacion = ""
+            selected_countries = st.multiselect("Selecciona uno o varios países:", country_index.countries)
             if selected_countries:
                 ubicacion_parts = []
                 for country in selected_countries:
-                    country_info = next((item for item in countries_data if item["country"] == country), None)
-                    if country_info:
-                        opciones_ciudades = ["Todos"] + sorted(country_info["cities"])
+                    if country in country_index:
+                        opciones_ciudades = ("Todos",) + country_index.cities(country)
                         selected_cities = st.multiselect(f"Selecciona la(s) ciudad(es) para {country}:", opciones_ciudades, default=["Todos"])
                         if "Todos" in selected_cities or not selected_cities:
                             ubicacion_parts.append(country)
@@ -206,108 +210,95 @@ def main():
                 st.error("Por favor, ingresa el puesto al que deseas postular.")
                 return
             with st.spinner("Procesando tu CV..."):
-                cv_content = upload_and_parse_cv(uploaded_file)
-            if cv_content == "":
-                st.error("No se pudo extraer texto del CV. Revisa el formato del archivo.")
+                cv_content, cv_compact = parse_cv(uploaded_file)
+            try:
+                state = session.start(cv_content, position, modalidad, ubicacion,
+                                      cv_prompt=cv_compact.render() if cv_compact else None)
+            except SessionError as e:
+                st.error(f"{e} Revisa el formato del archivo.")
                 return
-            st.session_state.cv_text = cv_content
-            st.session_state.position = position
-            st.session_state.modalidad = modalidad
-            st.session_state.ubicacion = ubicacion
-
-            # Inicia el historial de la entrevista
-            st.session_state.conversation_history = f"Inicio de la entrevista para el puesto '{position}' - Modalidad: {modalidad}"
-            if ubicacion:
-                st.session_state.conversation_history += f", Ubicación: {ubicacion}.\n"
-            else:
-                st.session_state.conversation_history += ".\n"
+            manager.save(session)
+            if cv_compact:
+                cv_stats = cv_compact.stats()
+                st.caption(f"CV compactado para la entrevista: {cv_stats['original_tokens']} → "
+                           f"{cv_stats['compact_tokens']} tokens ({cv_stats['saving']:.0%} menos).")
             st.success("CV cargado y entrevista iniciada. ¡Comencemos!")
     
     # --------------------------
     # Desarrollo de la entrevista
     # --------------------------
-    if st.session_state.cv_text and st.session_state.position and not st.session_state.interview_finished:
+    if state.started and not state.finished:
         st.subheader("Entrevista en Curso")
 
-        # Botón para generar nueva pregunta
+        # Botón para generar nueva pregunta (si se precargó al registrar la respuesta, llega de inmediato)
         if st.button("Nueva pregunta"):
-            question = interviewer.generate_question(
-                st.session_state.cv_text,
-                st.session_state.position,
-                st.session_state.conversation_history
-            )
-            st.session_state.last_question = question
-            st.session_state.conversation_history += f"Entrevistador: {question}\n"
-            st.session_state.num_questions += 1
-
-            # Actualizamos la barra de progreso (suponiendo 10 preguntas como tope)
-            total_questions = 10
-            progress_value = min(st.session_state.num_questions / total_questions, 1.0)
-            progress.progress(progress_value)
-
-            # Verificar si la pregunta indica que la entrevista finalizó
-            if "finalizar la entrevista" in question.lower() or "terminado" in question.lower():
-                st.session_state.interview_finished = True
-                st.session_state.final_summary_generated = True
-                final_summary = generate_final_summary(st.session_state.conversation_history)
-                avg_polarity = (sum(st.session_state.polarity_list) / len(st.session_state.polarity_list)
-                                if st.session_state.polarity_list else 0.0)
-                st.session_state.final_summary = final_summary
-                st.session_state.avg_polarity = avg_polarity
-                st.session_state.conversation_history += "\n=== Resumen Final de la Entrevista ===\n"
-                st.session_state.conversation_history += final_summary
-                st.session_state.conversation_history += f"\nPromedio de Polaridad (Tono Global): {avg_polarity:.2f}\n"
+            question_placeholder = st.empty()
+            try:
+                render_stream(question_placeholder, session.next_question_stream(), prefix="**Entrevistador:** ")
+                logging.info(f"Tokens de entrada estimados por pregunta: {state.prompt_tokens}")
+                progress.progress(state.progress)
+                manager.save(session)
+            except ModelInvocationError as e:
+                st.error(f"No se pudo generar la pregunta. Inténtalo de nuevo en unos segundos. ({e})")
+            # La pregunta completa se vuelve a mostrar más abajo junto al área de respuesta
+            question_placeholder.empty()
 
         # Mostrar la última pregunta y el área de respuesta
-        if st.session_state.last_question:
-            st.markdown(f"**Entrevistador:** {st.session_state.last_question}")
+        if state.last_question and not state.finished:
+            st.markdown(f"**Entrevistador:** {state.last_question}")
             user_response = st.text_area("Tu respuesta (escribe aquí y presiona Enter cuando termines):", 
-                                         key=f"response_{st.session_state.num_questions}", height=150)
+                                         key=f"response_{state.num_questions}", height=150)
             
             # Botón para registrar la respuesta
-            if st.button("Registrar respuesta", key=f"btn_response_{st.session_state.num_questions}"):
+            if st.button("Registrar respuesta", key=f"btn_response_{state.num_questions}"):
                 if user_response:
-                    st.session_state.conversation_history += f"Usuario: {user_response}\n"
-                    with st.spinner("Evaluando respuesta..."):
-                        evaluation = interviewer.evaluate_response(st.session_state.last_question, user_response)
-                    # Se añade la evaluación al historial de evaluaciones
-                    st.session_state.evaluations.append(evaluation)
-                    st.markdown(f"**Evaluación:** {evaluation}")
-                    sentiment = sentiment_analysis(user_response)
-                    if sentiment:
-                        st.write(f"**Análisis de Sentimiento:** Polaridad = {sentiment.polarity:.2f}, Subjetividad = {sentiment.subjectivity:.2f}")
-                        st.session_state.polarity_list.append(sentiment.polarity)
+                    evaluation_placeholder = st.empty()
+                    try:
+                        render_stream(evaluation_placeholder, session.submit_answer_stream(user_response),
+                                      prefix="**Evaluación:** ")
+                    except ModelInvocationError as e:
+                        evaluation_placeholder.empty()
+                        st.error(f"No se pudo evaluar la respuesta en este momento. ({e})")
+                    manager.save(session)
+                    result = session.last_result
+                    if result and result.polarity is not None:
+                        st.write(f"**Análisis de Sentimiento:** Polaridad = {result.polarity:.2f}, Subjetividad = {result.subjectivity:.2f}")
                     st.success("Respuesta registrada. Genera una nueva pregunta para continuar la entrevista.")
                 else:
                     st.error("Por favor, escribe tu respuesta antes de registrarla.")
 
         # Botón para finalizar la entrevista (en caso de que el usuario lo decida manualmente)
-        if not st.session_state.final_summary_generated:
+        if not state.finished:
             if st.button("Finalizar entrevista"):
-                st.session_state.interview_finished = True
-                st.session_state.final_summary_generated = True
-                final_summary = generate_final_summary(st.session_state.conversation_history)
-                avg_polarity = (sum(st.session_state.polarity_list) / len(st.session_state.polarity_list)
-                                if st.session_state.polarity_list else 0.0)
-                st.session_state.final_summary = final_summary
-                st.session_state.avg_polarity = avg_polarity
-                st.session_state.conversation_history += "\n=== Resumen Final de la Entrevista ===\n"
-                st.session_state.conversation_history += final_summary
-                st.session_state.conversation_history += f"\nPromedio de Polaridad (Tono Global): {avg_polarity:.2f}\n"
+                session.finish()
+                manager.save(session)
     
     # --------------------------
     # Mostrar resumen final junto con la evaluación, similar al historial
     # --------------------------
-    if st.session_state.interview_finished and st.session_state.final_summary_generated:
+    if state.finished:
         st.subheader("Resumen Final de la Entrevista")
-        st.write(st.session_state.final_summary)
-        st.write(f"**Promedio de Polaridad de la Conversación:** {st.session_state.avg_polarity:.2f}")
+        st.write(state.final_summary)
+        st.write(f"**Promedio de Polaridad de la Conversación:** {state.avg_polarity:.2f}")
+        scores = session.score_summary()
+        if scores["count"]:
+            st.write(f"**Puntuación media:** {scores['mean']:.1f}/10 "
+                     f"(mínima {scores['min']:g}, máxima {scores['max']:g})")
+            if scores["dimensions"]:
+                st.write("**Media por dimensión:** " + ", ".join(
+                    f"{name} {value:.1f}" for name, value in scores["dimensions"].items()))
+        if len(state.polarity_list) > 1:
+            sentiment_stats = session.sentiment_aggregate()
+            tendencia = "mejorando" if sentiment_stats.trend > 0.02 else "empeorando" if sentiment_stats.trend < -0.02 else "estable"
+            st.write(f"**Evolución del tono:** {tendencia} (pendiente {sentiment_stats.trend:+.3f}, "
+                     f"varianza {sentiment_stats.variance:.3f})")
         
         # Mostrar las evaluaciones registradas para cada respuesta
         st.markdown("### Evaluación de las Respuestas")
-        if st.session_state.evaluations:
-            for idx, eval_text in enumerate(st.session_state.evaluations, start=1):
-                st.markdown(f"**Evaluación de la Respuesta {idx}:** {eval_text}")
+        if any(state.evaluations):
+            for idx, eval_text in enumerate(state.evaluations, start=1):
+                if eval_text:
+                    st.markdown(f"**Evaluación de la Respuesta {idx}:** {eval_text}")
         else:
             st.info("No se registraron evaluaciones.")
         
@@ -316,35 +307,55 @@ def main():
     # --------------------------
     # Gráfico de análisis de polaridad (si hay datos)
     # --------------------------
-    if st.session_state.polarity_list:
-        data = {"Pregunta": list(range(1, len(st.session_state.polarity_list) + 1)),
-                "Polaridad": st.session_state.polarity_list}
+    # Cada barra lleva el número de su pregunta aunque alguna respuesta no tenga polaridad
+    polarity = state.polarity_by_question()
+    if polarity:
+        data = {"Pregunta": [number for number, _ in polarity], "Polaridad": [value for _, value in polarity]}
+        import plotly.express as px  # Importación diferida: plotly tarda varios segundos en cargarse
         fig = px.bar(data, x="Pregunta", y="Polaridad", title="Análisis de Polaridad de Respuestas")
         st.plotly_chart(fig)
 
+    # Gráfico de puntuaciones (solo las evaluaciones con nota)
+    scored = state.scores_by_question()
+    if scored:
+        data = {"Pregunta": [idx for idx, _ in scored], "Puntuación": [score for _, score in scored]}
+        import plotly.express as px
+        fig = px.bar(data, x="Pregunta", y="Puntuación", range_y=[0, 10], title="Puntuación de las Respuestas")
+        st.plotly_chart(fig)
+
+    # Comparativa con las entrevistas finalizadas de otras sesiones (almacén analítico)
+    if state.finished and ANALYTICS_ENABLED:
+        render_cohort_comparison(state)
+
     # --------------------------
     # Panel lateral: historial y exportar PDF
     # --------------------------
     st.sidebar.title("Historial de la entrevista")
-    st.sidebar.text_area("Historial", st.session_state.conversation_history, height=300)
+    st.sidebar.text_area("Historial", state.conversation_history, height=300)
 
     # Exportar PDF en memoria
     if st.sidebar.button("Exportar a PDF"):
-        pdf_buffer = export_to_pdf_in_memory(st.session_state.conversation_history)
-        st.sidebar.download_button(
-            label="Descargar PDF",
-            data=pdf_buffer,
-            file_name="entrevista_resultado.pdf",
-            mime="application/pdf"
-        )
+        try:
+            pdf_bytes = pdf_report.render_report(state)
+        except Exception as e:
+            logging.error(f"Error exportando a PDF: {e}")
+            pdf_bytes = None
+            st.sidebar.error("No se pudo generar el PDF. Inténtalo de nuevo.")
+        if pdf_bytes:
+            st.sidebar.download_button(
+                label="Descargar PDF",
+                data=pdf_bytes,
+                file_name="entrevista_resultado.pdf",
+                mime="application/pdf"
+            )
 
     # --------------------------
     # Búsqueda de empleos en plataformas externas
     # --------------------------
     st.sidebar.markdown("## Buscar empleos similares en plataformas externas")
-    if st.session_state.position:
-        position_query = urllib.parse.quote(st.session_state.position)
-        location_query = urllib.parse.quote(st.session_state.ubicacion) if st.session_state.ubicacion else ""
+    if state.position:
+        position_query = urllib.parse.quote(state.position)
+        location_query = urllib.parse.quote(state.ubicacion) if state.ubicacion else ""
         linkedin_url = f"https://www.linkedin.com/jobs/search?keywords={position_query}"
         indeed_url = f"https://www.indeed.com/jobs?q={position_query}"
         if location_query:
@@ -353,6 +364,22 @@ def main():
         st.sidebar.markdown(f"[Buscar en LinkedIn]({linkedin_url})", unsafe_allow_html=True)
         st.sidebar.markdown(f"[Buscar en Indeed]({indeed_url})", unsafe_allow_html=True)
     
+    # --------------------------
+    # Panel de administración: métricas del proceso
+    # --------------------------
+    if METRICS_ADMIN_PANEL:
+        with st.sidebar.expander("Métricas (admin)"):
+            st.json(metrics.registry.snapshot())
+            st.download_button(
+                label="Descargar en formato Prometheus",
+                data=metrics.registry.render_prometheus(),
+                file_name="metrics.txt",
+                mime="text/plain"
+            )
+
+    # Dependencias pesadas y cliente de Bedrock listos antes de la primera pregunta
+    warm_up_in_background()
+
     st.sidebar.markdown("<div class='footer'>© 2025 Javier Galindo Martínez - Todos los derechos reservados</div>", unsafe_allow_html=True)
 
 if __name__ == "__main__":
@@ -0,0 +1,234 @@
+# batch_evaluation.py
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ALL_COMPLETED, FIRST_COMPLETED, ThreadPoolExecutor, wait
+from config import (
+    BATCH_CONCURRENCY,
+    BATCH_MAX_RETRIES,
+    BATCH_BACKOFF_BASE,
+    BATCH_BACKOFF_MAX,
+    BATCH_RATE_LIMIT,
+)
+from evaluation import parse_evaluation
+from invocation import CircuitBreaker, ModelInvocationError, ResilientInvoker
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+class RateLimiter:
+    """
+    Limitador de tipo token bucket: permite 'rate' peticiones por segundo con
+    ráfagas de hasta 'burst' peticiones. Es seguro entre hilos.
+    """
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1, int(rate))
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        if not self.rate:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait_time = (1 - self.tokens) / self.rate
+            time.sleep(wait_time)
+
+
+def record_id(record):
+    """Identificador estable de un registro: su campo 'id' o el hash de pregunta y respuesta."""
+    if record.get("id") is not None:
+        return str(record["id"])
+    digest = hashlib.sha256(f"{record['question']}\x00{record['answer']}".encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def load_results(output_path):
+    """
+    Lee un fichero de salida y devuelve {id: resultado} quedándose con la última línea de
+    cada id (un registro que falló y se reintentó al reanudar aparece más de una vez).
+    """
+    results = {}
+    if not os.path.exists(output_path):
+        return results
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                # Última línea truncada si el proceso murió a mitad de escritura
+                continue
+            results[result["id"]] = result
+    return results
+
+
+def load_checkpoint(output_path):
+    """Devuelve los ids ya evaluados correctamente en un fichero de salida previo."""
+    return {result_id for result_id, result in load_results(output_path).items() if not result.get("error")}
+
+
+def compact_output(output_path):
+    """
+    Reescribe el fichero de salida con una sola línea por id y sin los fallos, que se
+    vuelven a evaluar al reanudar. Devuelve los ids evaluados correctamente.
+    """
+    results = load_results(output_path)
+    done = {result_id: result for result_id, result in results.items() if not result.get("error")}
+    tmp_path = f"{output_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for result in done.values():
+            f.write(json.dumps(result, ensure_ascii=False) + "\n")
+    os.replace(tmp_path, output_path)
+    return set(done)
+
+
+def iter_records(input_path, skip_ids):
+    with open(input_path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                record["id"] = record_id(record)
+            except (json.JSONDecodeError, KeyError) as e:
+                logging.error(f"Línea {line_number} ignorada: {e}")
+                continue
+            if record["id"] not in skip_ids:
+                yield record
+
+
+def evaluate_with_retry(interviewer, record, limiter, max_retries=BATCH_MAX_RETRIES,
+                        backoff_base=BATCH_BACKOFF_BASE, backoff_max=BATCH_BACKOFF_MAX):
+    """
+    Evalúa un registro reintentando con backoff exponencial y jitter los errores
+    transitorios del modelo. Este bucle es el único nivel de reintentos: el Interviewer
+    del lote debe usar un invocador de un solo intento (ver batch_interviewer).
+    """
+    start = time.perf_counter()
+    error = None
+    for attempt in range(1, max_retries + 2):
+        limiter.acquire()
+        try:
+            evaluation = parse_evaluation(interviewer.evaluate_response(record["question"], record["answer"]))
+        except ModelInvocationError as e:
+            error = f"{type(e).__name__}: {e}"
+            if not e.retryable:
+                break
+            if attempt <= max_retries:
+                delay = min(backoff_max, backoff_base * 2 ** (attempt - 1))
+                time.sleep(random.uniform(0, delay))
+            continue
+        return {"id": record["id"], "question": record["question"], "answer": record["answer"],
+                "evaluation": evaluation.render(), "score": evaluation.score,
+                "dimensions": evaluation.dimensions, "rationale": evaluation.rationale,
+                "structured": evaluation.structured, "error": None, "attempts": attempt,
+                "latency": round(time.perf_counter() - start, 3)}
+    return {"id": record["id"], "question": record["question"], "answer": record["answer"],
+            "evaluation": None, "score": None, "dimensions": {}, "rationale": "",
+            "structured": False, "error": error, "attempts": attempt,
+            "latency": round(time.perf_counter() - start, 3)}
+
+
+def run_batch(interviewer, input_path, output_path, concurrency=BATCH_CONCURRENCY,
+              rate=BATCH_RATE_LIMIT, max_retries=BATCH_MAX_RETRIES,
+              backoff_base=BATCH_BACKOFF_BASE, backoff_max=BATCH_BACKOFF_MAX):
+    """
+    Evalúa todos los pares (pregunta, respuesta) del JSONL de entrada y va escribiendo
+    cada resultado en el JSONL de salida en cuanto está listo. Los ids ya evaluados en
+    una ejecución anterior se omiten, de modo que un proceso interrumpido se reanuda; al
+    reanudar se compacta la salida para que cada id quede en una sola línea.
+    """
+    done = compact_output(output_path) if os.path.exists(output_path) else set()
+    if done:
+        logging.info(f"Reanudando: {len(done)} evaluaciones ya completadas.")
+    limiter = RateLimiter(rate)
+    stats = {"evaluated": 0, "failed": 0, "skipped": len(done)}
+    start = time.perf_counter()
+
+    with open(output_path, "a", encoding="utf-8") as out, \
+            ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch-eval") as executor:
+        pending = set()
+
+        def drain(return_when):
+            finished, still_pending = wait(pending, return_when=return_when)
+            for future in finished:
+                result = future.result()
+                out.write(json.dumps(result, ensure_ascii=False) + "\n")
+                out.flush()
+                stats["failed" if result["error"] else "evaluated"] += 1
+            return still_pending
+
+        for record in iter_records(input_path, done):
+            # Se limita el número de tareas en vuelo para no cargar todo el fichero en memoria
+            if len(pending) >= concurrency * 2:
+                pending = drain(FIRST_COMPLETED)
+            pending.add(executor.submit(evaluate_with_retry, interviewer, record, limiter, max_retries,
+                                        backoff_base, backoff_max))
+        if pending:
+            drain(ALL_COMPLETED)
+
+    elapsed = time.perf_counter() - start
+    stats["elapsed"] = round(elapsed, 3)
+    stats["throughput"] = round(stats["evaluated"] / elapsed, 3) if elapsed else 0.0
+    logging.info(f"Evaluación por lotes terminada: {stats}")
+    return stats
+
+
+def _stub_reply(body):
+    # Sin la llave inicial, que el Interviewer envía como prefijo de la respuesta
+    return ('"puntuacion": 7, "dimensiones": {"relevancia": 8, "claridad": 7, "profundidad": 6, "ejemplos": 6}, '
+            '"justificacion": "Respuesta clara, aunque podría aportar más ejemplos concretos."}')
+
+
+def batch_interviewer(client=None):
+    """
+    Interviewer para el lote con un invocador de un solo intento: los reintentos los hace
+    evaluate_with_retry (respetando el limitador de ritmo), no el invocador. Su circuito
+    no se abre nunca: con él abierto cada registro fallaría al instante con
+    CircuitOpenError y una ráfaga corta de throttling haría fallar todo el lote.
+    """
+    from interviewer import Interviewer
+    breaker = CircuitBreaker(failure_threshold=float("inf"))
+    return Interviewer(client=client, invoker=ResilientInvoker(max_attempts=1, breaker=breaker))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Evalúa por lotes respuestas de entrevistas guardadas en JSONL.")
+    parser.add_argument("input", help="JSONL de entrada con campos 'question', 'answer' e 'id' opcional")
+    parser.add_argument("output", help="JSONL de salida (se reanuda si ya existe)")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY)
+    parser.add_argument("--rate", type=float, default=BATCH_RATE_LIMIT, help="Peticiones por segundo (0 = sin límite)")
+    parser.add_argument("--max-retries", type=int, default=BATCH_MAX_RETRIES)
+    parser.add_argument("--stub", action="store_true", help="Usa un modelo local falso en lugar de Bedrock")
+    parser.add_argument("--stub-latency", type=float, default=0.0, help="Latencia simulada del modelo falso (s)")
+    parser.add_argument("--stub-fault-rate", type=float, default=0.0, help="Proporción de llamadas con throttling simulado")
+    args = parser.parse_args(argv)
+
+    client = None
+    if args.stub:
+        from fake_bedrock import FakeBedrockClient
+        client = FakeBedrockClient(reply=_stub_reply, first_token_delay=args.stub_latency,
+                                   fault_rate=args.stub_fault_rate)
+    interviewer = batch_interviewer(client)
+    stats = run_batch(interviewer, args.input, args.output, concurrency=args.concurrency,
+                      rate=args.rate, max_retries=args.max_retries)
+    print(json.dumps(stats))
+    return 0 if not stats["failed"] else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,95 @@
+# bedrock_client.py
+
+import logging
+import os
+import threading
+from config import (
+    BEDROCK_MAX_POOL_CONNECTIONS,
+    BEDROCK_TCP_KEEPALIVE,
+    BEDROCK_CONNECT_TIMEOUT,
+    BEDROCK_READ_TIMEOUT,
+)
+from metrics import registry
+
+# Clientes compartidos por todo el proceso, uno por combinación región/configuración.
+# Los clientes de boto3 son thread-safe, así que todas las sesiones de Streamlit
+# pueden reutilizar el mismo pool de conexiones HTTP.
+_clients = {}
+_lock = threading.Lock()
+_stats = {"created": 0, "reused": 0}
+
+
+def _default_region():
+    return os.environ.get("AWS_DEFAULT_REGION", "us-east-1")
+
+
+def get_bedrock_client(region=None,
+                       max_pool_connections=BEDROCK_MAX_POOL_CONNECTIONS,
+                       tcp_keepalive=BEDROCK_TCP_KEEPALIVE,
+                       connect_timeout=BEDROCK_CONNECT_TIMEOUT,
+                       read_timeout=BEDROCK_READ_TIMEOUT):
+    """
+    Devuelve el cliente 'bedrock-runtime' compartido para la región y configuración dadas.
+    Solo se construye (resolución de credenciales, handshake TLS) la primera vez.
+    """
+    region = region or _default_region()
+    key = (region, max_pool_connections, tcp_keepalive, connect_timeout, read_timeout)
+
+    client = _clients.get(key)
+    if client is not None:
+        with _lock:
+            _stats["reused"] += 1
+        return client
+
+    with _lock:
+        # Otro hilo pudo haberlo creado mientras esperábamos el lock
+        client = _clients.get(key)
+        if client is not None:
+            _stats["reused"] += 1
+            return client
+
+        # Importación diferida: boto3 tarda en cargarse y no hace falta para pintar la primera pantalla
+        import boto3
+        from botocore.config import Config
+
+        if not os.environ.get("AWS_ACCESS_KEY_ID") or not os.environ.get("AWS_SECRET_ACCESS_KEY"):
+            logging.error("Variables AWS_ACCESS_KEY_ID o AWS_SECRET_ACCESS_KEY no están definidas en el entorno.")
+        else:
+            logging.info("Credenciales de AWS encontradas en el entorno.")
+
+        client_config = Config(
+            region_name=region,
+            max_pool_connections=max_pool_connections,
+            tcp_keepalive=tcp_keepalive,
+            connect_timeout=connect_timeout,
+            read_timeout=read_timeout,
+            # Los reintentos los gestiona invocation.ResilientInvoker
+            retries={"total_max_attempts": 1, "mode": "standard"},
+        )
+        client = boto3.session.Session().client('bedrock-runtime', config=client_config)
+        _clients[key] = client
+        _stats["created"] += 1
+        logging.info(f"Cliente de Bedrock creado para la región {region} (pool={max_pool_connections}).")
+        return client
+
+
+def get_client_stats():
+    """
+    Devuelve cuántos clientes se han construido y cuántas veces se han reutilizado.
+    """
+    with _lock:
+        return dict(_stats, cached_clients=len(_clients))
+
+
+registry.register_collector(lambda: {f"bedrock_clients_{name}": value
+                                     for name, value in get_client_stats().items()})
+
+
+def reset_clients():
+    """
+    Descarta los clientes cacheados y reinicia los contadores (útil en pruebas).
+    """
+    with _lock:
+        _clients.clear()
+        _stats["created"] = 0
+        _stats["reused"] = 0
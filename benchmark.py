@@ -0,0 +1,377 @@
+# benchmark.py
+
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import resource
+import subprocess
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from config import BENCH_SESSIONS, BENCH_TURNS, BENCH_OUTPUT_PATH, BENCH_TOLERANCE
+from cv_preprocessing import preprocess_cv
+from fake_bedrock import FakeBedrockClient
+from interview_session import InterviewSession
+from interviewer import Interviewer
+from invocation import ModelInvocationError, ResilientInvoker
+from response_cache import MemoryResponseCache
+
+logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# CV sintético usado cuando no se indica un PDF con --cv
+SAMPLE_CV_PAGES = [
+    """Laura Martín Pérez
+Desarrolladora Backend | Madrid, España | laura.martin@example.com
+PERFIL PROFESIONAL
+Ingeniera de software con 7 años de experiencia en sistemas distribuidos, APIs REST y
+plataformas de datos en la nube. Acostumbrada a liderar equipos pequeños y a mentorizar.
+EXPERIENCIA
+Tech Lead Backend - Fintech Iberia (2021 - actualidad)
+- Diseño de la plataforma de pagos en Python y Go, 3.000 transacciones por segundo.
+- Migración de un monolito a microservicios sobre Kubernetes y AWS.
+- Reducción del 40 % en la latencia p99 de la API pública.
+Desarrolladora Backend - Retail Online S.L. (2017 - 2021)
+- Servicios de catálogo y búsqueda con Elasticsearch y PostgreSQL.
+- Automatización de despliegues con GitLab CI y Terraform.
+Página 1 de 2""",
+    """Laura Martín Pérez
+EDUCACIÓN
+Grado en Ingeniería Informática - Universidad Politécnica de Madrid (2013 - 2017)
+HABILIDADES
+Python, Go, SQL, Kafka, Docker, Kubernetes, AWS, Terraform, observabilidad (Prometheus, Grafana)
+IDIOMAS
+Español (nativo), Inglés (C1), Francés (B1)
+CERTIFICACIONES
+AWS Certified Solutions Architect - Associate
+Página 2 de 2""",
+]
+
+SAMPLE_ANSWERS = [
+    "En mi último puesto lideré la migración de un monolito a microservicios. Empezamos por los "
+    "servicios con menos dependencias y medimos la latencia en cada fase para evitar regresiones.",
+    "Cuando hay un conflicto en el equipo prefiero hablarlo en privado primero, entender el punto de "
+    "vista de cada persona y acordar criterios objetivos para decidir.",
+    "Mi mayor error fue desplegar un cambio sin una estrategia de vuelta atrás. Desde entonces uso "
+    "feature flags y despliegues graduales con métricas de error automáticas.",
+    "Me motiva este puesto porque combina diseño de sistemas con impacto directo en el negocio, y "
+    "creo que mi experiencia en pagos encaja con vuestros retos de escalabilidad.",
+    "Para priorizar uso el impacto estimado y el esfuerzo, y reviso la planificación cada semana con "
+    "producto para ajustar en función de lo que aprendemos.",
+]
+
+SAMPLE_QUESTION = ("Has mencionado la migración a microservicios en Fintech Iberia. ¿Qué criterios "
+                   "usasteis para decidir el orden de extracción de los servicios y cómo medisteis el "
+                   "impacto en la latencia y en la fiabilidad durante el proceso?")
+# Evaluación en el formato de evaluation.EVALUATION_FORMAT, sin la llave inicial (va como prefijo)
+SAMPLE_EVALUATION = ('"puntuacion": 7, "dimensiones": {"relevancia": 8, "claridad": 8, "profundidad": 6, '
+                     '"ejemplos": 7}, "justificacion": "Respuesta clara y bien estructurada, con un ejemplo '
+                     'concreto; podría aportar métricas del resultado y detallar su papel frente al del equipo."}')
+
+
+def _stub_reply(body):
+    """Respuesta del modelo simulado según el tipo de llamada (pregunta o evaluación)."""
+    messages = json.dumps(body.get("messages", []), ensure_ascii=False)
+    return SAMPLE_EVALUATION if "Evalúa la siguiente respuesta" in messages else SAMPLE_QUESTION
+
+
+def percentile(values, q):
+    """Percentil con interpolación lineal entre las muestras ordenadas (q entre 0 y 100)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def summarize(values):
+    return {
+        "count": len(values),
+        "mean": round(sum(values) / len(values), 6) if values else 0.0,
+        "p50": round(percentile(values, 50), 6),
+        "p95": round(percentile(values, 95), 6),
+        "p99": round(percentile(values, 99), 6),
+        "max": round(max(values), 6) if values else 0.0,
+    }
+
+
+def _rss_kb():
+    """Memoria residente actual del proceso en KB (pico si /proc no está disponible)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              timeout=5, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ""
+
+
+def prepare_cv(cv_path=None):
+    """Devuelve el CV compacto que se envía en los prompts y el tiempo que llevó prepararlo."""
+    start = time.perf_counter()
+    if cv_path:
+        import cv_parser
+        with open(cv_path, "rb") as f:
+            pages = cv_parser.get_cv_pages(f)
+    else:
+        pages = SAMPLE_CV_PAGES
+    cv_prompt = preprocess_cv(pages).render()
+    return cv_prompt, time.perf_counter() - start
+
+
+def run_session(session_id, interviewer, cv_prompt, position, turns, prefetch, seed, retrieval=None):
+    """
+    Simula una entrevista completa con el mismo motor que la app (InterviewSession):
+    pregunta en streaming (o precargada), respuesta del candidato, evaluación en
+    streaming y análisis de sentimiento.
+    Devuelve las latencias de cada turno, los tokens del CV enviados por pregunta
+    ((enviados, completos), si hay recuperación de fragmentos) y la sesión, cuyo
+    estado sigue en memoria.
+    """
+    rng = random.Random(seed)
+    session = InterviewSession(interviewer=interviewer, prefetch=prefetch, retrieval=retrieval)
+    session.start(cv_prompt, position, "Remoto", "Madrid, España")
+    samples = {"turn": [], "question": [], "evaluation": [], "ttft": [], "cv_retrieval": []}
+    cv_tokens = []
+    errors = 0
+
+    for _ in range(turns):
+        turn_start = time.perf_counter()
+        try:
+            for _ in session.next_question_stream():
+                pass
+        except ModelInvocationError:
+            errors += 1
+            continue
+        if session.last_call_metrics.get("ttft") is not None:
+            samples["ttft"].append(session.last_call_metrics["ttft"])
+        if session.last_retrieval:
+            samples["cv_retrieval"].append(session.last_retrieval["seconds"])
+            cv_tokens.append(tuple(session.last_retrieval[key] for key in
+                                   ("tokens", "full_tokens", "billed_tokens", "baseline_billed_tokens")))
+        samples["question"].append(time.perf_counter() - turn_start)
+        if session.state.finished:
+            break
+
+        answer_start = time.perf_counter()
+        try:
+            for _ in session.submit_answer_stream(rng.choice(SAMPLE_ANSWERS)):
+                pass
+            if interviewer.last_call_metrics.get("ttft") is not None:
+                samples["ttft"].append(interviewer.last_call_metrics["ttft"])
+        except ModelInvocationError:
+            errors += 1
+        samples["evaluation"].append(time.perf_counter() - answer_start)
+        samples["turn"].append(time.perf_counter() - turn_start)
+
+    return samples, cv_tokens, errors, session
+
+
+def run_benchmark(sessions=BENCH_SESSIONS, turns=BENCH_TURNS, prefetch=True, cv_path=None,
+                  first_token_delay=0.3, prefill_per_1k_tokens=0.05, tokens_per_second=80.0,
+                  latency_jitter=0.2, fault_rate=0.0, response_cache=False, trace_memory=False, seed=0,
+                  retrieval=None):
+    """
+    Ejecuta 'sessions' entrevistas simultáneas de 'turns' preguntas contra el cliente
+    de Bedrock simulado y devuelve un informe serializable a JSON.
+    """
+    client = FakeBedrockClient(reply=_stub_reply, first_token_delay=first_token_delay,
+                               prefill_per_1k_tokens=prefill_per_1k_tokens,
+                               tokens_per_second=tokens_per_second, latency_jitter=latency_jitter,
+                               fault_rate=fault_rate, seed=seed, record_calls=False)
+    # Invocador propio para que el circuito y el límite de concurrencia no dependan de ejecuciones previas
+    invoker = ResilientInvoker()
+    cache = MemoryResponseCache() if response_cache else None
+    cv_prompt, cv_seconds = prepare_cv(cv_path)
+    position = "Desarrolladora Backend Senior"
+
+    if trace_memory:
+        tracemalloc.start()
+    rss_before = _rss_kb()
+    traced_before = tracemalloc.get_traced_memory()[0] if trace_memory else 0
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=sessions, thread_name_prefix="bench-session") as executor:
+        futures = [
+            executor.submit(run_session, session_id,
+                            Interviewer(client=client, response_cache=cache, cache_evaluations=response_cache,
+                                        invoker=invoker),
+                            cv_prompt, position, turns, prefetch, seed + session_id, retrieval)
+            for session_id in range(sessions)
+        ]
+        results = [future.result() for future in futures]
+    elapsed = time.perf_counter() - start
+
+    # Memoria retenida por las sesiones (su estado sigue vivo en 'results')
+    rss_after = _rss_kb()
+    memory = {"rss_kb": rss_after, "rss_delta_per_session_kb": round((rss_after - rss_before) / sessions, 1)}
+    if trace_memory:
+        traced_after, traced_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        memory["traced_per_session_kb"] = round((traced_after - traced_before) / sessions / 1024, 1)
+        memory["traced_peak_kb"] = round(traced_peak / 1024, 1)
+
+    samples = {"turn": [], "question": [], "evaluation": [], "ttft": [], "cv_retrieval": []}
+    cv_tokens = []
+    errors = 0
+    for session_samples, session_cv_tokens, session_errors, _ in results:
+        for name, values in session_samples.items():
+            samples[name].extend(values)
+        cv_tokens.extend(session_cv_tokens)
+        errors += session_errors
+    completed_turns = len(samples["turn"])
+    invoker_stats = invoker.stats()
+
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "params": {
+                "sessions": sessions, "turns": turns, "prefetch": prefetch, "cv": cv_path or "sample",
+                "first_token_delay": first_token_delay, "prefill_per_1k_tokens": prefill_per_1k_tokens,
+                "tokens_per_second": tokens_per_second, "latency_jitter": latency_jitter,
+                "fault_rate": fault_rate, "response_cache": response_cache, "seed": seed,
+                "retrieval": {None: "auto", True: "on", False: "off"}[retrieval],
+            },
+        },
+        "summary": {
+            "elapsed": round(elapsed, 3),
+            "completed_turns": completed_turns,
+            "errors": errors,
+            "turns_per_second": round(completed_turns / elapsed, 3) if elapsed else 0.0,
+            "model_calls_per_second": round(invoker_stats["calls"] / elapsed, 3) if elapsed else 0.0,
+            "cv_prepare_seconds": round(cv_seconds, 6),
+            "cv_prompt_chars": len(cv_prompt),
+        },
+        "latency": {name: summarize(values) for name, values in samples.items()},
+        "retrieval": {
+            "questions": len(cv_tokens),
+            "cv_tokens_sent": round(sum(item[0] for item in cv_tokens) / len(cv_tokens), 1) if cv_tokens else None,
+            "cv_tokens_full": cv_tokens[0][1] if cv_tokens else None,
+            "saving": round(1 - sum(item[0] for item in cv_tokens) / sum(item[1] for item in cv_tokens), 4)
+            if cv_tokens else 0.0,
+            # Frente al CV completo en el bloque cacheado (escritura en la 1.ª pregunta, lecturas después)
+            "billed_saving": round(1 - sum(item[2] for item in cv_tokens) / sum(item[3] for item in cv_tokens), 4)
+            if cv_tokens else 0.0,
+        },
+        "memory": memory,
+        "invoker": invoker_stats,
+    }
+
+
+# Métricas comparadas entre ejecuciones: (ruta en el informe, True si mayor es mejor)
+COMPARED_METRICS = [
+    (("latency", "turn", "p50"), False),
+    (("latency", "turn", "p95"), False),
+    (("latency", "turn", "p99"), False),
+    (("latency", "question", "p95"), False),
+    (("latency", "evaluation", "p95"), False),
+    (("summary", "turns_per_second"), True),
+    (("cold_start", "median"), False),
+]
+
+
+def compare(report, baseline, tolerance=BENCH_TOLERANCE):
+    """
+    Compara un informe con otro de referencia. Devuelve una lista de
+    (métrica, referencia, actual, cambio relativo, es_regresión).
+    """
+    rows = []
+    for path, higher_is_better in COMPARED_METRICS:
+        current, previous = report, baseline
+        for key in path:
+            current = current.get(key, {}) if isinstance(current, dict) else {}
+            previous = previous.get(key, {}) if isinstance(previous, dict) else {}
+        if not isinstance(current, (int, float)) or not isinstance(previous, (int, float)) or not previous:
+            continue
+        change = (current - previous) / previous
+        regression = change < -tolerance if higher_is_better else change > tolerance
+        rows.append((".".join(path), previous, current, change, regression))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark offline de la entrevista con un Bedrock simulado.")
+    parser.add_argument("--sessions", type=int, default=BENCH_SESSIONS, help="Entrevistas simultáneas")
+    parser.add_argument("--turns", type=int, default=BENCH_TURNS, help="Preguntas por entrevista")
+    parser.add_argument("--output", default=BENCH_OUTPUT_PATH, help="Fichero JSON con los resultados")
+    parser.add_argument("--cv", help="PDF de CV a usar (por defecto, un CV sintético)")
+    parser.add_argument("--no-prefetch", action="store_true", help="Desactiva la precarga de la siguiente pregunta")
+    parser.add_argument("--ttft", type=float, default=0.3, help="Latencia base hasta el primer token (s)")
+    parser.add_argument("--prefill", type=float, default=0.05, help="Segundos extra por cada 1000 tokens de entrada")
+    parser.add_argument("--tokens-per-second", type=float, default=80.0, help="Velocidad de generación simulada")
+    parser.add_argument("--jitter", type=float, default=0.2, help="Variación relativa de las latencias (0.2 = ±20 %%)")
+    parser.add_argument("--fault-rate", type=float, default=0.0, help="Proporción de llamadas con throttling simulado")
+    parser.add_argument("--response-cache", action="store_true", help="Activa el caché de evaluaciones")
+    parser.add_argument("--retrieval", choices=("auto", "on", "off"), default="auto",
+                        help="Fragmentos del CV por pregunta (auto = según la longitud del CV)")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="Mide la memoria por sesión con tracemalloc (añade sobrecarga a las latencias)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--cold-start", action="store_true",
+                        help="Mide también el tiempo de importación de app.py en intérpretes nuevos")
+    parser.add_argument("--compare", help="Informe JSON de referencia con el que comparar")
+    parser.add_argument("--tolerance", type=float, default=BENCH_TOLERANCE,
+                        help="Empeoramiento relativo admitido antes de considerar regresión")
+    args = parser.parse_args(argv)
+    # Los módulos de la app configuran el logging en INFO al importarse
+    logging.getLogger().setLevel(logging.WARNING)
+
+    report = run_benchmark(sessions=args.sessions, turns=args.turns, prefetch=not args.no_prefetch,
+                           cv_path=args.cv, first_token_delay=args.ttft, prefill_per_1k_tokens=args.prefill,
+                           tokens_per_second=args.tokens_per_second, latency_jitter=args.jitter,
+                           fault_rate=args.fault_rate, response_cache=args.response_cache,
+                           trace_memory=args.trace_memory, seed=args.seed,
+                           retrieval={"auto": None, "on": True, "off": False}[args.retrieval])
+    if args.cold_start:
+        from startup import measure_cold_start
+        report["cold_start"] = measure_cold_start()
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+
+    turn = report["latency"]["turn"]
+    print(f"{report['summary']['completed_turns']} turnos en {report['summary']['elapsed']}s "
+          f"({report['summary']['turns_per_second']} turnos/s, {report['summary']['errors']} errores)")
+    print(f"Latencia por turno: p50={turn['p50']:.3f}s p95={turn['p95']:.3f}s p99={turn['p99']:.3f}s")
+    print(f"Memoria por sesión: {report['memory']}")
+    if report["retrieval"]["questions"]:
+        retrieval = report["retrieval"]
+        print(f"Fragmentos del CV: {retrieval['cv_tokens_full']} -> {retrieval['cv_tokens_sent']} tokens por pregunta "
+              f"({retrieval['saving']:.0%} menos; {retrieval['billed_saving']:.0%} de coste frente al CV cacheado), p95 {report['latency']['cv_retrieval']['p95'] * 1000:.2f} ms")
+    if "cold_start" in report:
+        cold_start = report["cold_start"]
+        print(f"Arranque en frío: {cold_start['median']:.3f}s (presupuesto {cold_start['budget']}s, "
+              f"{'dentro' if cold_start['within_budget'] else 'FUERA'} del presupuesto)")
+    print(f"Resultados guardados en {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        rows = compare(report, baseline, args.tolerance)
+        if baseline.get("meta", {}).get("params") != report["meta"]["params"]:
+            print("\nAviso: los parámetros de ambas ejecuciones no coinciden; la comparación es orientativa.")
+        print(f"\nComparación con {args.compare} (commit {baseline.get('meta', {}).get('commit') or '?'}):")
+        for name, previous, current, change, regression in rows:
+            flag = "  REGRESIÓN" if regression else ""
+            print(f"  {name:<22} {previous:>10.4f} -> {current:>10.4f} ({change:+.1%}){flag}")
+        if any(row[4] for row in rows):
+            return 1
+    if "cold_start" in report and not report["cold_start"]["within_budget"]:
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,8 +1,146 @@
 # config.py
 
+import os
+
+# Directorios base de la aplicación
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(BASE_DIR, "data")  # Datos incluidos en el repositorio
+CACHE_DIR = os.environ.get("ENTREVISTADOR_CACHE_DIR",
+                           os.path.join(os.path.expanduser("~"), ".cache", "entrevistador"))
+
 # Configuración del modelo de Amazon Bedrock
 AWS_MODEL_ID = "anthropic.claude-3-5-sonnet-20240620-v1:0"
 AWS_BEDROCK_VERSION = "bedrock-2023-05-31"
 
-# Ruta de salida del PDF exportado
-PDF_OUTPUT_PATH = "entrevista_resultado.pdf"
+# Presupuesto de tokens de salida por tipo de llamada (max_tokens). Una pregunta son una o dos
+# frases y la evaluación es un JSON corto (evaluation.py), así que no necesitan miles de tokens
+MAX_TOKENS_QUESTION = int(os.environ.get("MAX_TOKENS_QUESTION", "400"))
+MAX_TOKENS_EVALUATION = int(os.environ.get("MAX_TOKENS_EVALUATION", "350"))
+
+# Caché de prompts de Bedrock para el bloque estático (CV, puesto, modalidad, ubicación).
+# Desactivar si el modelo configurado no soporta prompt caching.
+PROMPT_CACHING_ENABLED = os.environ.get("PROMPT_CACHING_ENABLED", "1") == "1"
+PROMPT_CACHE_MIN_TOKENS = int(os.environ.get("PROMPT_CACHE_MIN_TOKENS", "1024"))  # Bloques más cortos no se cachean
+PROMPT_CACHE_WRITE_FACTOR = 1.25  # Coste de escribir en caché, relativo a la tarifa normal de entrada
+PROMPT_CACHE_READ_FACTOR = 0.1  # Coste de leer de caché, relativo a la tarifa normal de entrada
+
+# Pool de conexiones del cliente de Bedrock (compartido por todas las sesiones)
+BEDROCK_MAX_POOL_CONNECTIONS = int(os.environ.get("BEDROCK_MAX_POOL_CONNECTIONS", "20"))
+BEDROCK_TCP_KEEPALIVE = os.environ.get("BEDROCK_TCP_KEEPALIVE", "1") == "1"
+BEDROCK_CONNECT_TIMEOUT = float(os.environ.get("BEDROCK_CONNECT_TIMEOUT", "5"))
+BEDROCK_READ_TIMEOUT = float(os.environ.get("BEDROCK_READ_TIMEOUT", "60"))
+
+# Invocación resiliente del modelo: reintentos, circuit breaker y concurrencia adaptativa
+INVOKE_MAX_ATTEMPTS = int(os.environ.get("INVOKE_MAX_ATTEMPTS", "4"))
+INVOKE_BACKOFF_BASE = 0.5  # Segundos
+INVOKE_BACKOFF_MAX = 8.0  # Segundos
+INVOKE_DEADLINE = float(os.environ.get("INVOKE_DEADLINE", "90"))  # Plazo total incluyendo reintentos
+INVOKE_QUEUE_TIMEOUT = float(os.environ.get("INVOKE_QUEUE_TIMEOUT", "30"))  # Espera máxima por un hueco
+CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_TIMEOUT = float(os.environ.get("CIRCUIT_RESET_TIMEOUT", "30"))  # Segundos
+CONCURRENCY_INITIAL = int(os.environ.get("CONCURRENCY_INITIAL", "8"))
+CONCURRENCY_MIN = 1
+CONCURRENCY_MAX = int(os.environ.get("CONCURRENCY_MAX", "32"))
+
+# Contexto de conversación enviado al modelo en cada pregunta
+CONTEXT_RECENT_TURNS = int(os.environ.get("CONTEXT_RECENT_TURNS", "3"))  # Turnos que se envían literalmente
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", "1500"))  # Tokens máximos del historial
+CONTEXT_SUMMARY_LINE_CHARS = 160  # Longitud máxima de cada campo en el resumen de turnos antiguos
+
+# Hilos en segundo plano para precargar la siguiente pregunta y el análisis de sentimiento
+PIPELINE_MAX_WORKERS = int(os.environ.get("PIPELINE_MAX_WORKERS", "8"))
+
+# Catálogo de países y ciudades (countriesnow.space) con snapshot local
+COUNTRIES_API_URL = "https://countriesnow.space/api/v0.1/countries"
+COUNTRIES_CACHE_PATH = os.path.join(CACHE_DIR, "countries.v1.json.gz")
+COUNTRIES_CACHE_TTL = int(os.environ.get("COUNTRIES_CACHE_TTL", str(7 * 24 * 3600)))  # Segundos
+COUNTRIES_FALLBACK_PATH = os.path.join(DATA_DIR, "countries_fallback.json")  # Catálogo sin conexión
+
+# Extracción de texto del CV (caché por SHA-256 y extracción en paralelo por páginas)
+CV_CACHE_DIR = os.path.join(CACHE_DIR, "cv_text")
+CV_CACHE_MAX_ENTRIES = int(os.environ.get("CV_CACHE_MAX_ENTRIES", "128"))  # Entradas del LRU en memoria
+CV_PARALLEL_MIN_PAGES = int(os.environ.get("CV_PARALLEL_MIN_PAGES", "8"))  # A partir de aquí se usa el pool
+CV_PAGES_PER_TASK = 4  # Páginas por tarea del pool
+CV_PAGE_TIMEOUT = float(os.environ.get("CV_PAGE_TIMEOUT", "5"))  # Segundos máximos por página
+CV_PARSER_WORKERS = int(os.environ.get("CV_PARSER_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+# Evaluación por lotes (batch_evaluation.py)
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", "4"))
+BATCH_RATE_LIMIT = float(os.environ.get("BATCH_RATE_LIMIT", "2"))  # Peticiones por segundo
+BATCH_MAX_RETRIES = int(os.environ.get("BATCH_MAX_RETRIES", "3"))
+BATCH_BACKOFF_BASE = 1.0  # Segundos
+BATCH_BACKOFF_MAX = 30.0  # Segundos
+
+# Caché de respuestas del modelo para llamadas deterministas (evaluaciones)
+RESPONSE_CACHE_BACKEND = os.environ.get("RESPONSE_CACHE_BACKEND", "memory")  # memory | sqlite | none
+# Desactivado por defecto: con el caché, la misma respuesta a la misma pregunta reutiliza la evaluación anterior
+RESPONSE_CACHE_EVALUATIONS = os.environ.get("RESPONSE_CACHE_EVALUATIONS", "0") == "1"
+RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get("RESPONSE_CACHE_MAX_ENTRIES", "2048"))
+RESPONSE_CACHE_TTL = int(os.environ.get("RESPONSE_CACHE_TTL", str(24 * 3600)))  # Segundos (0 = sin caducidad)
+RESPONSE_CACHE_SQLITE_PATH = os.path.join(CACHE_DIR, "responses.sqlite3")
+
+# Almacén de sesiones de entrevista (persistencia entre reinicios y entre workers)
+SESSION_STORE_BACKEND = os.environ.get("SESSION_STORE_BACKEND", "sqlite")  # memory | file | sqlite | redis
+SESSION_DIR = os.environ.get("SESSION_DIR", os.path.join(CACHE_DIR, "sessions"))
+SESSION_SQLITE_PATH = os.path.join(SESSION_DIR, "sessions.sqlite3")
+SESSION_REDIS_URL = os.environ.get("SESSION_REDIS_URL", "redis://localhost:6379/0")
+SESSION_TTL = int(os.environ.get("SESSION_TTL", str(7 * 24 * 3600)))  # Segundos sin actividad (0 = sin caducidad)
+SESSION_FLUSH_INTERVAL = float(os.environ.get("SESSION_FLUSH_INTERVAL", "2"))  # Escritura diferida por lotes (s)
+SESSION_IDLE_TIMEOUT = float(os.environ.get("SESSION_IDLE_TIMEOUT", "900"))  # Descarga de memoria (s, 0 = nunca)
+
+# Análisis de sentimiento en español con léxico vectorizado (sentiment.py)
+SENTIMENT_LEXICON_PATH = os.path.join(DATA_DIR, "sentiment_lexicon_es.tsv")
+SENTIMENT_NEGATION_WINDOW = 3  # Palabras afectadas por una negación
+SENTIMENT_BATCH_SIZE = int(os.environ.get("SENTIMENT_BATCH_SIZE", "2048"))  # Textos por bloque
+
+# Recuperación de fragmentos del CV (cv_retrieval.py): con CV largos, cada pregunta lleva solo
+# los datos generales y los fragmentos más relevantes para los últimos turnos (BM25)
+CV_RETRIEVAL_ENABLED = os.environ.get("CV_RETRIEVAL_ENABLED", "1") == "1"
+# Por debajo se envía el CV entero. Con prompt caching, el CV completo se escribe en caché una vez
+# (x1,25) y después se lee a x0,1, mientras que los fragmentos (~4 x 120 tokens) se cobran enteros en
+# cada pregunta: en una entrevista de 10 preguntas los fragmentos solo salen más baratos a partir de
+# unos 2400 tokens de CV. Sin caché compensan desde unos 650 tokens.
+CV_RETRIEVAL_MIN_TOKENS = int(os.environ.get("CV_RETRIEVAL_MIN_TOKENS", "2400" if PROMPT_CACHING_ENABLED else "800"))
+CV_RETRIEVAL_CHUNK_TOKENS = 120  # Tamaño aproximado de cada fragmento
+CV_RETRIEVAL_TOP_K = int(os.environ.get("CV_RETRIEVAL_TOP_K", "4"))  # Fragmentos por pregunta
+CV_RETRIEVAL_QUERY_TURNS = 2  # Turnos recientes usados como consulta
+CV_RETRIEVAL_BM25_K1 = 1.5
+CV_RETRIEVAL_BM25_B = 0.75
+
+# Arranque en frío: recursos remotos cacheados en disco y presupuesto de tiempo de importación
+ASSETS_CACHE_DIR = os.path.join(CACHE_DIR, "assets")
+LOTTIE_HEADER_URL = "https://assets1.lottiefiles.com/packages/lf20_jcikwtux.json"
+ASSET_RETRY_INTERVAL = 300  # Segundos entre intentos de descarga si falla
+STARTUP_IMPORT_BUDGET = float(os.environ.get("STARTUP_IMPORT_BUDGET", "1.5"))  # Segundos para importar app.py
+STARTUP_WARMUP = os.environ.get("STARTUP_WARMUP", "1") == "1"  # Precarga en segundo plano tras arrancar
+
+# Benchmark offline (benchmark.py) con el backend de Bedrock simulado
+BENCH_SESSIONS = int(os.environ.get("BENCH_SESSIONS", "8"))  # Entrevistas simultáneas
+BENCH_TURNS = int(os.environ.get("BENCH_TURNS", "5"))  # Preguntas por entrevista
+BENCH_OUTPUT_PATH = os.environ.get("BENCH_OUTPUT_PATH", "benchmark_results.json")
+BENCH_TOLERANCE = float(os.environ.get("BENCH_TOLERANCE", "0.10"))  # Empeoramiento relativo admitido
+
+# Métricas: endpoint Prometheus (puerto), volcado JSON periódico y panel de administración
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "0"))  # 0 = desactivado
+METRICS_JSON_PATH = os.environ.get("METRICS_JSON_PATH", "")  # Vacío = desactivado
+METRICS_JSON_INTERVAL = float(os.environ.get("METRICS_JSON_INTERVAL", "60"))  # Segundos
+METRICS_ADMIN_PANEL = os.environ.get("METRICS_ADMIN_PANEL", "0") == "1"
+
+# Almacén analítico de entrevistas finalizadas (analytics.py): una fila por entrevista con sus
+# métricas y los arrays de puntuación y polaridad por respuesta, sin transcripciones
+ANALYTICS_ENABLED = os.environ.get("ANALYTICS_ENABLED", "1") == "1"
+ANALYTICS_SQLITE_PATH = os.environ.get("ANALYTICS_SQLITE_PATH", os.path.join(CACHE_DIR, "analytics.sqlite3"))
+ANALYTICS_MIN_COHORT = int(os.environ.get("ANALYTICS_MIN_COHORT", "5"))  # Entrevistas mínimas para comparar
+ANALYTICS_TOP_GROUPS = int(os.environ.get("ANALYTICS_TOP_GROUPS", "10"))  # Grupos en los gráficos de cohortes
+
+# Informe PDF de la entrevista (pdf_report.py)
+PDF_OUTPUT_DIR = os.environ.get("PDF_OUTPUT_DIR", os.path.join(CACHE_DIR, "reports"))  # Un fichero por sesión
+PDF_FONT_PATH = os.environ.get("PDF_FONT_PATH", "")  # Fuente TTF Unicode; vacío = buscar en PDF_FONT_CANDIDATES
+PDF_FONT_BOLD_PATH = os.environ.get("PDF_FONT_BOLD_PATH", "")  # Variante negrita; vacío = junto a la regular
+PDF_FONT_CANDIDATES = (
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+    "/usr/share/fonts/dejavu/DejaVuSans.ttf",
+    "/Library/Fonts/Arial Unicode.ttf",
+    "C:\\Windows\\Fonts\\arial.ttf",
+)
+REPORT_EXPORT_WORKERS = int(os.environ.get("REPORT_EXPORT_WORKERS", "0"))  # Procesos (0 = núcleos de la CPU)
@@ -0,0 +1,158 @@
+# conversation.py
+
+from dataclasses import dataclass, asdict, field
+from config import CONTEXT_RECENT_TURNS, CONTEXT_TOKEN_BUDGET, CONTEXT_SUMMARY_LINE_CHARS
+
+
+def estimate_tokens(text):
+    """
+    Estimación rápida del número de tokens (aprox. 4 caracteres por token).
+    """
+    return (len(text) + 3) // 4
+
+
+def _shorten(text, limit):
+    text = " ".join(text.split())
+    return text if len(text) <= limit else text[:limit - 1].rstrip() + "…"
+
+
+@dataclass
+class Turn:
+    """Un turno de la entrevista: pregunta, respuesta del candidato, evaluación y polaridad."""
+    question: str
+    answer: str = ""
+    evaluation: str = ""
+    polarity: float = None  # None si no se pudo analizar el sentimiento de la respuesta
+
+
+@dataclass
+class ConversationStore:
+    """
+    Almacén estructurado de los turnos de la entrevista. Mantiene además un resumen
+    acumulado de los turnos antiguos, que se va ampliando de forma incremental.
+    """
+    turns: list = field(default_factory=list)
+    summary_lines: list = field(default_factory=list)
+    folded: int = 0  # Número de turnos ya incorporados al resumen
+
+    def add_question(self, question):
+        self.turns.append(Turn(question=question))
+
+    def record_answer(self, answer, evaluation=""):
+        if not self.turns:
+            return
+        self.turns[-1].answer = answer
+        self.turns[-1].evaluation = evaluation
+
+    def to_dict(self):
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(turns=[Turn(**t) for t in data.get("turns", [])],
+                   summary_lines=list(data.get("summary_lines", [])),
+                   folded=data.get("folded", 0))
+
+
+class ContextBuilder:
+    """
+    Construye el contexto de conversación que se envía al modelo: los últimos N turnos
+    literales más un resumen de los anteriores, sin superar el presupuesto de tokens.
+    """
+    def __init__(self, recent_turns=CONTEXT_RECENT_TURNS, token_budget=CONTEXT_TOKEN_BUDGET,
+                 summary_line_chars=CONTEXT_SUMMARY_LINE_CHARS):
+        self.recent_turns = recent_turns
+        self.token_budget = token_budget
+        self.summary_line_chars = summary_line_chars
+
+    def _fold(self, store):
+        # Solo se resumen los turnos que acaban de salir de la ventana reciente
+        limit = max(0, len(store.turns) - self.recent_turns)
+        for idx in range(store.folded, limit):
+            turn = store.turns[idx]
+            line = f"P{idx + 1}: {_shorten(turn.question, self.summary_line_chars)}"
+            if turn.answer:
+                line += f" | R: {_shorten(turn.answer, self.summary_line_chars)}"
+            store.summary_lines.append(line)
+        store.folded = max(store.folded, limit)
+
+    def _trim(self, text, excess_tokens):
+        limit = max(self.summary_line_chars, len(text) - excess_tokens * 4)
+        return _shorten(text, limit)
+
+    def _select(self, store, reserved_tokens=0):
+        """
+        Elige el resumen y los turnos recientes que caben en el presupuesto.
+        Devuelve (texto_resumen, [(número, Turn), ...]).
+        """
+        self._fold(store)
+        start = store.folded
+        recent = [(start + i + 1, Turn(t.question, t.answer, t.evaluation))
+                  for i, t in enumerate(store.turns[start:])]
+
+        budget = self.token_budget - reserved_tokens
+        used = sum(estimate_tokens(t.question) + estimate_tokens(t.answer) for _, t in recent)
+
+        # Si los turnos recientes no caben, se recortan empezando por el más antiguo
+        for _, turn in recent:
+            if used <= budget:
+                break
+            for attr in ("answer", "question"):
+                text = getattr(turn, attr)
+                if used <= budget or not text:
+                    continue
+                shortened = self._trim(text, used - budget)
+                used -= estimate_tokens(text) - estimate_tokens(shortened)
+                setattr(turn, attr, shortened)
+
+        # El resumen ocupa lo que quede, conservando las líneas más recientes
+        summary = []
+        for line in reversed(store.summary_lines):
+            cost = estimate_tokens(line) + 1
+            if used + cost > budget:
+                break
+            summary.append(line)
+            used += cost
+        summary.reverse()
+
+        summary_text = ""
+        if summary:
+            omitted = len(store.summary_lines) - len(summary)
+            title = "Resumen de turnos anteriores"
+            if omitted:
+                title += f" ({omitted} turnos más antiguos omitidos)"
+            summary_text = title + ":\n" + "\n".join(summary)
+        return summary_text, recent
+
+    def build(self, store, header=""):
+        """
+        Devuelve el texto de contexto para el prompt a partir del almacén de turnos.
+        """
+        summary_text, recent = self._select(store, estimate_tokens(header))
+        parts = [header.strip()] if header.strip() else []
+        if summary_text:
+            parts.append(summary_text)
+        if recent:
+            lines = []
+            for number, turn in recent:
+                lines.append(f"Entrevistador (P{number}): {turn.question}")
+                if turn.answer:
+                    lines.append(f"Usuario: {turn.answer}")
+            parts.append("Últimos turnos:\n" + "\n".join(lines))
+        return "\n\n".join(parts)
+
+    def build_messages(self, store, opening, instruction):
+        """
+        Devuelve la lista de mensajes alternos user/assistant para la API: un mensaje
+        de apertura (con el resumen de turnos antiguos, si lo hay), cada turno reciente
+        como pregunta del asistente y respuesta del usuario, y la instrucción final.
+        """
+        summary_text, recent = self._select(store, estimate_tokens(opening) + estimate_tokens(instruction))
+        opening_text = opening if not summary_text else f"{opening}\n\n{summary_text}"
+        messages = [{"role": "user", "content": [{"type": "text", "text": opening_text}]}]
+        for _, turn in recent:
+            messages.append({"role": "assistant", "content": [{"type": "text", "text": turn.question}]})
+            messages.append({"role": "user",
+                             "content": [{"type": "text", "text": turn.answer or "(Sin respuesta)"}]})
+        messages[-1]["content"].append({"type": "text", "text": instruction})
+        return messages
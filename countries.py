@@ -0,0 +1,175 @@
+# countries.py
+
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+from config import (
+    COUNTRIES_API_URL,
+    COUNTRIES_CACHE_PATH,
+    COUNTRIES_CACHE_TTL,
+    COUNTRIES_FALLBACK_PATH,
+)
+from metrics import registry, timed
+
+# Versión del formato del snapshot en disco; si cambia, se ignoran los snapshots antiguos
+SNAPSHOT_VERSION = 1
+# Espera mínima entre intentos de refresco cuando la API no responde (segundos)
+REFRESH_RETRY_INTERVAL = 300
+
+# Caché en memoria del proceso: {"fetched_at": float, "data": list}
+_cache = {"fetched_at": 0.0, "data": None}
+_lock = threading.Lock()
+_refresh_thread = None
+_last_refresh_attempt = 0.0
+_index = None  # CountryIndex construido sobre la versión actual de los datos
+
+
+def fetch_countries_remote():
+    """
+    Obtiene la lista de países y sus ciudades desde la API de countriesnow.space.
+    Se reduce el tiempo de espera entre intentos para acelerar el proceso.
+    """
+    import requests  # Importación diferida: solo se usa al refrescar en segundo plano
+    for attempt in range(3):
+        try:
+            response = requests.get(COUNTRIES_API_URL, timeout=5)
+            response.raise_for_status()
+            data = response.json()
+            if not data.get("error", True):
+                # Solo se conservan los campos que usa la aplicación
+                return [{"country": item["country"], "cities": item.get("cities", [])}
+                        for item in data.get("data", [])]
+            else:
+                logging.error("Error en la respuesta de la API.")
+        except Exception as e:
+            logging.error(f"Intento {attempt + 1} - Error al obtener los datos: {e}")
+        time.sleep(0.2)
+    return []
+
+
+def _read_snapshot(path):
+    try:
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rt", encoding="utf-8") as f:
+            snapshot = json.load(f)
+        if snapshot.get("version") != SNAPSHOT_VERSION or not snapshot.get("data"):
+            return None
+        return snapshot
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logging.error(f"Error leyendo el snapshot de países {path}: {e}")
+        return None
+
+
+def _write_snapshot(path, data, fetched_at):
+    snapshot = {"version": SNAPSHOT_VERSION, "fetched_at": fetched_at, "data": data}
+    try:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            json.dump(snapshot, f, ensure_ascii=False, separators=(",", ":"))
+        # Reemplazo atómico para que otros procesos nunca lean un fichero a medias
+        os.replace(tmp_path, path)
+    except Exception as e:
+        logging.error(f"Error guardando el snapshot de países {path}: {e}")
+
+
+def refresh_countries():
+    """
+    Descarga el catálogo y actualiza la caché en memoria y el snapshot en disco.
+    Devuelve True si la descarga tuvo éxito.
+    """
+    data = fetch_countries_remote()
+    registry.inc("countries_refresh_total", result="ok" if data else "error")
+    if not data:
+        return False
+    fetched_at = time.time()
+    with _lock:
+        _cache["data"] = data
+        _cache["fetched_at"] = fetched_at
+    _write_snapshot(COUNTRIES_CACHE_PATH, data, fetched_at)
+    logging.info(f"Catálogo de países actualizado ({len(data)} países).")
+    return True
+
+
+def _refresh_in_background():
+    global _refresh_thread, _last_refresh_attempt
+    with _lock:
+        if _refresh_thread is not None and _refresh_thread.is_alive():
+            return
+        if time.time() - _last_refresh_attempt < REFRESH_RETRY_INTERVAL:
+            return
+        _last_refresh_attempt = time.time()
+        _refresh_thread = threading.Thread(target=refresh_countries, name="countries-refresh", daemon=True)
+        _refresh_thread.start()
+
+
+@timed("countries_lookup")
+def get_countries_data():
+    """
+    Devuelve la lista de países y ciudades sin bloquear en la red: primero la caché en
+    memoria, después el snapshot en disco y, si no existe, el catálogo incluido en el
+    repositorio. Si los datos han caducado se refrescan en segundo plano.
+    """
+    with _lock:
+        data, fetched_at = _cache["data"], _cache["fetched_at"]
+
+    if data is None:
+        snapshot = _read_snapshot(COUNTRIES_CACHE_PATH) or _read_snapshot(COUNTRIES_FALLBACK_PATH)
+        if snapshot is None:
+            data, fetched_at = [], 0.0
+        else:
+            data, fetched_at = snapshot["data"], snapshot.get("fetched_at", 0.0)
+        with _lock:
+            # Si otro hilo ya cargó datos más recientes, se usan esos
+            if _cache["data"] is None or _cache["fetched_at"] < fetched_at:
+                _cache["data"] = data
+                _cache["fetched_at"] = fetched_at
+            data, fetched_at = _cache["data"], _cache["fetched_at"]
+
+    if time.time() - fetched_at > COUNTRIES_CACHE_TTL:
+        _refresh_in_background()
+    return data
+
+
+class CountryIndex:
+    """
+    Índice del catálogo de países: lista de países ordenada y, por país, sus ciudades
+    ordenadas como tupla inmutable. Las ciudades se ordenan de forma perezosa la
+    primera vez que se consulta cada país. La búsqueda mientras se escribe la hace el
+    propio multiselect de Streamlit sobre estas tuplas.
+    """
+    def __init__(self, data):
+        self.source = data  # Lista original, para detectar si los datos han cambiado
+        self._raw_cities = {item["country"]: item.get("cities", []) for item in data}
+        self.countries = tuple(sorted(self._raw_cities))
+        self._cities = {}
+
+    def __contains__(self, country):
+        return country in self._raw_cities
+
+    def cities(self, country):
+        """Ciudades del país, ordenadas y sin duplicados."""
+        cities = self._cities.get(country)
+        if cities is None:
+            cities = tuple(sorted(set(self._raw_cities.get(country, ()))))
+            self._cities[country] = cities
+        return cities
+
+
+def get_country_index():
+    """
+    Devuelve el índice del catálogo de países, compartido por todo el proceso.
+    Solo se reconstruye cuando los datos cambian (por ejemplo, tras un refresco).
+    """
+    global _index
+    data = get_countries_data()
+    index = _index
+    if index is None or index.source is not data:
+        index = CountryIndex(data)
+        _index = index
+    return index
@@ -0,0 +1,197 @@
+# cv_parser.py
+
+import gzip
+import hashlib
+import io
+import json
+import logging
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict
+from multiprocessing import TimeoutError as PoolTimeoutError
+from config import (
+    CV_CACHE_DIR,
+    CV_CACHE_MAX_ENTRIES,
+    CV_PARALLEL_MIN_PAGES,
+    CV_PAGES_PER_TASK,
+    CV_PAGE_TIMEOUT,
+    CV_PARSER_WORKERS,
+)
+from metrics import registry
+
+# Versión del formato del caché en disco
+CACHE_VERSION = 1
+
+# Caché LRU en memoria: sha256 -> lista de textos por página
+_memory_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+# Pool de procesos compartido para PDFs grandes
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _read_bytes(uploaded_file):
+    """Obtiene los bytes de un UploadedFile de Streamlit, un objeto tipo fichero o una ruta."""
+    if isinstance(uploaded_file, (bytes, bytearray)):
+        return bytes(uploaded_file)
+    if isinstance(uploaded_file, str):
+        with open(uploaded_file, "rb") as f:
+            return f.read()
+    if hasattr(uploaded_file, "getvalue"):
+        return uploaded_file.getvalue()
+    uploaded_file.seek(0)
+    return uploaded_file.read()
+
+
+def _cache_path(digest):
+    return os.path.join(CV_CACHE_DIR, f"{digest}.json.gz")
+
+
+def _cache_get(digest):
+    with _cache_lock:
+        pages = _memory_cache.get(digest)
+        if pages is not None:
+            _memory_cache.move_to_end(digest)
+            return pages
+    try:
+        with gzip.open(_cache_path(digest), "rt", encoding="utf-8") as f:
+            entry = json.load(f)
+        if entry.get("version") != CACHE_VERSION:
+            return None
+        pages = entry["pages"]
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logging.error(f"Error leyendo el caché de CV {digest}: {e}")
+        return None
+    _cache_put_memory(digest, pages)
+    return pages
+
+
+def _cache_put_memory(digest, pages):
+    with _cache_lock:
+        _memory_cache[digest] = pages
+        _memory_cache.move_to_end(digest)
+        while len(_memory_cache) > CV_CACHE_MAX_ENTRIES:
+            _memory_cache.popitem(last=False)
+
+
+def _cache_put(digest, pages):
+    _cache_put_memory(digest, pages)
+    try:
+        os.makedirs(CV_CACHE_DIR, exist_ok=True)
+        tmp_path = f"{_cache_path(digest)}.{os.getpid()}.tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            json.dump({"version": CACHE_VERSION, "pages": pages}, f, ensure_ascii=False)
+        os.replace(tmp_path, _cache_path(digest))
+    except Exception as e:
+        logging.error(f"Error guardando el caché de CV {digest}: {e}")
+
+
+def _extract_page_range(data, start, stop):
+    """Tarea del pool: extrae el texto de las páginas [start, stop) del PDF."""
+    from PyPDF2 import PdfReader
+    reader = PdfReader(io.BytesIO(data))
+    return [reader.pages[i].extract_text() or "" for i in range(start, stop)]
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # 'spawn' evita heredar hilos y locks del proceso de Streamlit
+            _pool = multiprocessing.get_context("spawn").Pool(processes=CV_PARSER_WORKERS)
+        return _pool
+
+
+def _discard_pool():
+    """Termina el pool (por ejemplo, si un worker se quedó bloqueado en una página)."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.terminate()
+            _pool = None
+
+
+def _iter_pages_parallel(data, page_count):
+    pool = _get_pool()
+    tasks = []
+    for start in range(0, page_count, CV_PAGES_PER_TASK):
+        stop = min(start + CV_PAGES_PER_TASK, page_count)
+        tasks.append((start, stop, pool.apply_async(_extract_page_range, (data, start, stop))))
+
+    timed_out = False
+    for start, stop, result in tasks:
+        ok = True
+        try:
+            texts = result.get(timeout=CV_PAGE_TIMEOUT * (stop - start))
+        except PoolTimeoutError:
+            logging.error(f"Tiempo agotado extrayendo las páginas {start + 1}-{stop} del CV.")
+            registry.inc("cv_page_timeouts_total", stop - start)
+            timed_out = ok = False
+            texts = [""] * (stop - start)
+        except Exception as e:
+            logging.error(f"Error extrayendo las páginas {start + 1}-{stop} del CV: {e}")
+            ok = False
+            texts = [""] * (stop - start)
+        for offset, text in enumerate(texts):
+            yield start + offset, text, ok
+    if timed_out:
+        _discard_pool()
+
+
+def iter_cv_pages(uploaded_file):
+    """
+    Genera (número_de_página, texto) en orden a medida que se extraen, de modo que
+    las primeras páginas están disponibles antes de procesar el documento completo.
+    El resultado se guarda en caché por el SHA-256 del contenido del fichero.
+    """
+    data = _read_bytes(uploaded_file)
+    digest = hashlib.sha256(data).hexdigest()
+    pages = _cache_get(digest)
+    registry.inc("cv_cache_lookups_total", result="hit" if pages is not None else "miss")
+    if pages is not None:
+        logging.info(f"CV encontrado en caché ({digest[:12]}).")
+        yield from enumerate(pages)
+        return
+
+    from PyPDF2 import PdfReader  # Importación diferida: solo se necesita al procesar un CV nuevo
+    reader = PdfReader(io.BytesIO(data))
+    page_count = len(reader.pages)
+    if page_count >= CV_PARALLEL_MIN_PAGES:
+        page_iter = _iter_pages_parallel(data, page_count)
+    else:
+        page_iter = ((i, reader.pages[i].extract_text() or "", True) for i in range(page_count))
+
+    pages = []
+    complete = True
+    for number, text, ok in page_iter:
+        pages.append(text)
+        complete = complete and ok
+        yield number, text
+    # Un resultado con páginas fallidas no se guarda para poder reintentarlo
+    if complete:
+        _cache_put(digest, pages)
+
+
+def get_cv_pages(uploaded_file):
+    """
+    Devuelve la lista con el texto de cada página del CV.
+    """
+    return [text for _, text in iter_cv_pages(uploaded_file)]
+
+
+def join_pages(pages):
+    """
+    Une el texto de las páginas en el texto completo del CV, separadas por saltos de línea.
+    """
+    return "\n".join(text for text in pages if text).strip()
+
+
+def extract_cv_text(uploaded_file):
+    """
+    Devuelve el texto completo del CV, con las páginas separadas por saltos de línea.
+    """
+    return join_pages(get_cv_pages(uploaded_file))
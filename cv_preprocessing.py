@@ -0,0 +1,153 @@
+# cv_preprocessing.py
+
+import logging
+import re
+import unicodedata
+from collections import Counter
+from dataclasses import dataclass, field
+from conversation import estimate_tokens
+
+# Secciones reconocidas y los títulos (sin acentos, en minúsculas) que las identifican
+SECTION_HEADINGS = {
+    "perfil": ("perfil", "perfil profesional", "resumen", "resumen profesional", "sobre mi",
+               "acerca de mi", "objetivo", "objetivo profesional", "profile", "summary",
+               "professional summary", "about me", "objective"),
+    "experiencia": ("experiencia", "experiencia laboral", "experiencia profesional",
+                    "trayectoria profesional", "historial laboral", "experience",
+                    "work experience", "professional experience", "employment", "employment history"),
+    "educacion": ("educacion", "formacion", "formacion academica", "estudios", "titulacion",
+                  "education", "academic background", "academic education"),
+    "habilidades": ("habilidades", "competencias", "aptitudes", "conocimientos",
+                    "conocimientos tecnicos", "habilidades tecnicas", "tecnologias",
+                    "skills", "technical skills", "competences", "tools"),
+    "idiomas": ("idiomas", "lenguas", "languages"),
+    "proyectos": ("proyectos", "proyectos destacados", "projects", "portfolio"),
+    "certificaciones": ("certificaciones", "certificados", "cursos", "formacion complementaria",
+                        "certifications", "courses", "licenses"),
+}
+SECTION_TITLES = {
+    "cabecera": "DATOS GENERALES",
+    "perfil": "PERFIL",
+    "experiencia": "EXPERIENCIA",
+    "educacion": "EDUCACIÓN",
+    "habilidades": "HABILIDADES",
+    "idiomas": "IDIOMAS",
+    "proyectos": "PROYECTOS",
+    "certificaciones": "CERTIFICACIONES",
+}
+# Líneas al principio y al final de cada página donde se buscan cabeceras y pies
+PAGE_EDGE_LINES = 3
+_HEADING_LOOKUP = {heading: section for section, headings in SECTION_HEADINGS.items() for heading in headings}
+
+# Números de página: "Página 2", "Page 2 of 3" o "2 de 3" en cualquier línea; un número
+# suelto ("2") solo en los bordes de la página, para no borrar años o cifras del CV
+_PAGE_NUMBER_RE = re.compile(r"^((p[aá]g(ina)?\.?|page)\s*\d+(\s*(de|of|/)\s*\d+)?|\d{1,3}\s*(de|of|/)\s*\d{1,3})$",
+                             re.IGNORECASE)
+_BARE_PAGE_NUMBER_RE = re.compile(r"^\d{1,3}$")
+_BULLET_RE = re.compile(r"^[\u2022\u25aa\u25cf\u25e6\u2023\u2043\u2219\u00b7*\-\u2013\u2014]+\s*")
+_SPACES_RE = re.compile(r"[ \t\u00a0\u2000-\u200b]+")
+
+
+def _fold(text):
+    decomposed = unicodedata.normalize("NFKD", text.casefold())
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+def _normalize_line(line):
+    line = unicodedata.normalize("NFKC", line)
+    line = _SPACES_RE.sub(" ", line).strip()
+    if _BULLET_RE.match(line):
+        line = "- " + _BULLET_RE.sub("", line)
+    return line
+
+
+def _page_lines(page):
+    """Líneas normalizadas y no vacías de una página, sin los números de página."""
+    lines = [line for line in (_normalize_line(line) for line in page.splitlines()) if line]
+    edge = set(range(PAGE_EDGE_LINES)) | set(range(len(lines) - PAGE_EDGE_LINES, len(lines)))
+    return [line for n, line in enumerate(lines)
+            if not _PAGE_NUMBER_RE.match(line) and not (n in edge and _BARE_PAGE_NUMBER_RE.match(line))]
+
+
+def _heading_section(line):
+    """Devuelve la sección si la línea es un título conocido (p. ej. 'EXPERIENCIA LABORAL:')."""
+    if len(line) > 40:
+        return None
+    key = _fold(line).strip(" :-_|").strip()
+    key = re.sub(r"\s+", " ", key)
+    return _HEADING_LOOKUP.get(key)
+
+
+@dataclass
+class CompactCV:
+    """Representación compacta del CV segmentada por secciones."""
+    sections: dict = field(default_factory=dict)
+    original_chars: int = 0
+    original_tokens: int = 0
+
+    def render(self):
+        parts = []
+        for section, lines in self.sections.items():
+            if lines:
+                parts.append(f"## {SECTION_TITLES.get(section, section.upper())}\n" + "\n".join(lines))
+        return "\n\n".join(parts)
+
+    def stats(self):
+        text = self.render()
+        compact_tokens = estimate_tokens(text)
+        saving = 1 - compact_tokens / self.original_tokens if self.original_tokens else 0.0
+        return {"original_chars": self.original_chars, "compact_chars": len(text),
+                "original_tokens": self.original_tokens, "compact_tokens": compact_tokens,
+                "saving": saving}
+
+
+def preprocess_cv(pages):
+    """
+    Compacta el texto del CV antes de enviarlo al modelo: normaliza espacios, elimina
+    números de página y cabeceras/pies repetidos en varias páginas, descarta líneas
+    repetidas seguidas y agrupa el contenido por secciones (experiencia, educación,
+    habilidades...). Las líneas que se repiten en distintos puntos del CV (el mismo
+    puesto en dos empresas, "Tecnologías: Python" en cada experiencia) se conservan.
+    'pages' es la lista de textos por página (o el texto completo como str).
+    """
+    if isinstance(pages, str):
+        pages = [pages]
+    original = "\n".join(pages)
+
+    page_lines = [_page_lines(page) for page in pages]
+
+    # Cabeceras y pies de página: líneas de los bordes de página que se repiten
+    # en la mitad o más de las páginas
+    repeated = set()
+    if len(page_lines) > 1:
+        counts = Counter(line for lines in page_lines
+                         for line in set(lines[:PAGE_EDGE_LINES] + lines[-PAGE_EDGE_LINES:]))
+        threshold = max(2, (len(page_lines) + 1) // 2)
+        repeated = {line for line, count in counts.items() if count >= threshold}
+
+    sections = {"cabecera": []}
+    current = "cabecera"
+    kept_repeated = set()
+    for lines in page_lines:
+        for line in lines:
+            section = _heading_section(line)
+            if section:
+                current = section
+                sections.setdefault(current, [])
+                continue
+            if line in repeated:
+                # Las cabeceras y pies repetidos se conservan una vez y solo en los datos generales
+                if current != "cabecera" or line in kept_repeated:
+                    continue
+                kept_repeated.add(line)
+            target = sections.setdefault(current, [])
+            if target and _fold(target[-1]) == _fold(line):
+                continue
+            target.append(line)
+
+    compact = CompactCV(sections={k: v for k, v in sections.items() if v},
+                        original_chars=len(original), original_tokens=estimate_tokens(original))
+    stats = compact.stats()
+    logging.info(f"CV compactado: {stats['original_tokens']} -> {stats['compact_tokens']} tokens "
+                 f"({stats['saving']:.0%} menos).")
+    return compact
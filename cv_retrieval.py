@@ -0,0 +1,194 @@
+# cv_retrieval.py
+
+import re
+import time
+import unicodedata
+from dataclasses import dataclass
+import numpy as np
+from config import (
+    PROMPT_CACHING_ENABLED,
+    PROMPT_CACHE_MIN_TOKENS,
+    PROMPT_CACHE_WRITE_FACTOR,
+    PROMPT_CACHE_READ_FACTOR,
+    CV_RETRIEVAL_CHUNK_TOKENS,
+    CV_RETRIEVAL_TOP_K,
+    CV_RETRIEVAL_QUERY_TURNS,
+    CV_RETRIEVAL_BM25_K1,
+    CV_RETRIEVAL_BM25_B,
+)
+from conversation import estimate_tokens
+from cv_preprocessing import SECTION_TITLES
+
+# Secciones que se envían siempre (en el bloque cacheable del prompt)
+CORE_SECTIONS = (SECTION_TITLES["cabecera"], SECTION_TITLES["perfil"])
+# Palabras vacías (sin acentos) que no aportan a la búsqueda
+STOPWORDS = frozenset("""
+a al algo como con cual cuando de del desde donde el ella ellos en entre era es esa ese eso esta este esto
+fue ha han hay la las le les lo los mas me mi mis muy no nos o otra otro para pero por porque que se ser si
+sin sobre su sus tambien te tu tus un una uno unos y ya yo
+and are as at be by for from has have in is it of on or that the this to was were with
+""".split())
+
+_TERM_RE = re.compile(r"[a-z0-9][a-z0-9+#]*")
+_SENTENCE_RE = re.compile(r"(?<=[.;])\s+")
+
+
+def _fold(text):
+    decomposed = unicodedata.normalize("NFKD", text.casefold())
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+def terms(text):
+    """Términos de búsqueda: sin acentos, sin palabras vacías y sin la 's' final del plural."""
+    result = []
+    for term in _TERM_RE.findall(_fold(text or "")):
+        if len(term) < 2 or term in STOPWORDS:
+            continue
+        result.append(term[:-1] if len(term) > 4 and term.endswith("s") else term)
+    return result
+
+
+def chunk_cv(text, max_tokens=CV_RETRIEVAL_CHUNK_TOKENS):
+    """
+    Divide el CV (idealmente el CompactCV renderizado, con títulos '## SECCIÓN') en
+    fragmentos de unos 'max_tokens' tokens que no mezclan secciones. Cada fragmento
+    empieza por el título de su sección para que el modelo sepa de dónde viene.
+    """
+    chunks = []
+    title, lines, size = "", [], 0
+
+    def flush():
+        if lines:
+            chunks.append("\n".join(([title] if title else []) + lines))
+
+    for line in (text or "").splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith("## "):
+            flush()
+            title, lines, size = line, [], 0
+            continue
+        # Líneas muy largas (texto sin saltos): se parten por frases
+        pieces = _SENTENCE_RE.split(line) if estimate_tokens(line) > max_tokens else [line]
+        for piece in pieces:
+            tokens = estimate_tokens(piece)
+            if lines and size + tokens > max_tokens:
+                flush()
+                lines, size = [], 0
+            lines.append(piece)
+            size += tokens
+    flush()
+    return chunks
+
+
+def is_core(chunk):
+    return chunk.startswith(tuple(f"## {title}" for title in CORE_SECTIONS))
+
+
+def cache_factor(tokens, first_turn):
+    """
+    Coste relativo a la tarifa normal de 'tokens' enviados en el bloque cacheable del
+    prompt: se escriben en caché en la primera pregunta y se leen en las siguientes, o se
+    cobran enteros si el prompt caching está desactivado o el bloque es demasiado corto
+    para cachearse (se aproxima con los tokens del CV; las instrucciones suman unas decenas).
+    """
+    if not PROMPT_CACHING_ENABLED or tokens < PROMPT_CACHE_MIN_TOKENS:
+        return 1.0
+    return PROMPT_CACHE_WRITE_FACTOR if first_turn else PROMPT_CACHE_READ_FACTOR
+
+
+@dataclass
+class Retrieval:
+    """Resultado de una selección: texto enviado y lo que ha costado y ahorrado."""
+    core: str
+    excerpts: str
+    selected: list
+    seconds: float
+    tokens: int       # Tokens del CV enviados (datos generales + fragmentos)
+    full_tokens: int  # Tokens del CV completo
+    core_tokens: int  # Tokens de los datos generales (van en el bloque cacheable)
+
+    @property
+    def saving(self):
+        return 1 - self.tokens / self.full_tokens if self.full_tokens else 0.0
+
+    def billed(self, first_turn):
+        """
+        (coste con fragmentos, coste con el CV completo) en tokens a tarifa normal. El CV
+        completo iría en el bloque cacheado; con fragmentos solo van ahí los datos generales
+        y los fragmentos se cobran enteros en cada pregunta.
+        """
+        excerpts = self.tokens - self.core_tokens
+        billed = self.core_tokens * cache_factor(self.core_tokens, first_turn) + excerpts
+        return billed, self.full_tokens * cache_factor(self.full_tokens, first_turn)
+
+    def stats(self, first_turn=False):
+        billed, baseline = self.billed(first_turn)
+        return {"seconds": self.seconds, "chunks": len(self.selected), "tokens": self.tokens,
+                "full_tokens": self.full_tokens, "saving": self.saving,
+                "billed_tokens": billed, "baseline_billed_tokens": baseline}
+
+
+class CVIndex:
+    """
+    Índice BM25 sobre los fragmentos de un CV. La matriz fragmento x término con los
+    pesos BM25 se calcula una sola vez con NumPy; puntuar una consulta es sumar las
+    columnas de sus términos.
+    """
+    def __init__(self, chunks, k1=CV_RETRIEVAL_BM25_K1, b=CV_RETRIEVAL_BM25_B):
+        self.chunks = list(chunks)
+        self.core = [idx for idx, chunk in enumerate(self.chunks) if is_core(chunk)]
+        if not self.core and self.chunks:
+            # CV sin secciones reconocidas: el primer fragmento suele traer nombre y contacto
+            self.core = [0]
+        self.vocabulary = {}
+        rows, cols = [], []
+        for row, chunk in enumerate(self.chunks):
+            for term in terms(chunk):
+                rows.append(row)
+                cols.append(self.vocabulary.setdefault(term, len(self.vocabulary)))
+        n, size = len(self.chunks), len(self.vocabulary)
+        tf = np.bincount(np.asarray(rows, dtype=np.int64) * size + np.asarray(cols, dtype=np.int64),
+                         minlength=n * size).reshape(n, size).astype(np.float32) if size else np.zeros((n, 0))
+        df = (tf > 0).sum(axis=0)
+        idf = np.log1p((n - df + 0.5) / (df + 0.5))
+        lengths = tf.sum(axis=1)
+        norm = k1 * (1 - b + b * lengths / (lengths.mean() if n and lengths.mean() else 1.0))
+        self.weights = (idf * tf * (k1 + 1) / (tf + norm[:, None])).astype(np.float32)
+        self.chunk_tokens = np.array([estimate_tokens(chunk) for chunk in self.chunks])
+        self.full_tokens = estimate_tokens("\n\n".join(self.chunks))
+
+    def scores(self, query):
+        ids = [self.vocabulary[term] for term in terms(query) if term in self.vocabulary]
+        if not ids:
+            return np.zeros(len(self.chunks), dtype=np.float32)
+        return self.weights[:, ids].sum(axis=1)
+
+    def top_k(self, query, k=CV_RETRIEVAL_TOP_K):
+        """Índices de los 'k' fragmentos (sin contar los fijos) que mejor puntúan, en orden del CV."""
+        scores = self.scores(query)
+        scores[self.core] = -1.0
+        if not (scores > 0).any():
+            # Sin coincidencias (p. ej. un puesto sin relación léxica): primeros fragmentos del CV
+            scores = np.where(scores < 0, -1.0, 1.0)
+        ranked = np.argsort(-scores, kind="stable")[:k]
+        return sorted(int(idx) for idx in ranked if scores[idx] > 0)
+
+    def select(self, query, k=CV_RETRIEVAL_TOP_K):
+        start = time.perf_counter()
+        selected = self.top_k(query, k)
+        core = "\n\n".join(self.chunks[idx] for idx in self.core)
+        excerpts = "\n\n".join(self.chunks[idx] for idx in selected)
+        core_tokens = int(self.chunk_tokens[self.core].sum())
+        tokens = core_tokens + int(self.chunk_tokens[selected].sum())
+        return Retrieval(core=core, excerpts=excerpts, selected=selected, seconds=time.perf_counter() - start,
+                         tokens=tokens, full_tokens=self.full_tokens, core_tokens=core_tokens)
+
+
+def build_query(position, conversation, turns=CV_RETRIEVAL_QUERY_TURNS):
+    """Consulta a partir del puesto y de las preguntas y respuestas más recientes."""
+    parts = [position]
+    for turn in conversation.turns[-turns:]:
+        parts.extend((turn.question, turn.answer))
+    return "\n".join(part for part in parts if part)
@@ -0,0 +1,160 @@
+# evaluation.py
+
+import json
+import math
+import re
+from dataclasses import dataclass, asdict, field
+
+# Dimensiones de la rúbrica, puntuadas del 1 al 10 como la nota global
+EVALUATION_DIMENSIONS = ("relevancia", "claridad", "profundidad", "ejemplos")
+SCORE_MIN, SCORE_MAX = 1, 10
+RATIONALE_MAX_CHARS = 400
+
+# Formato que se pide al modelo (las claves son las que lee parse_evaluation)
+EVALUATION_FORMAT = json.dumps({
+    "puntuacion": 7,
+    "dimensiones": {dimension: 7 for dimension in EVALUATION_DIMENSIONS},
+    "justificacion": "Una o dos frases con los puntos fuertes y lo que se podría mejorar.",
+}, ensure_ascii=False)
+
+_FENCE_RE = re.compile(r"^```(?:json)?\s*|\s*```$")
+# Texto libre o JSON truncado: "Puntuación: 7/10", "7/10", "puntuacion": 7
+_SCORE_RES = (
+    re.compile(r'"puntuaci[oó]n"\s*:\s*"?(\d+(?:[.,]\d+)?)'),
+    re.compile(r"puntuaci[oó]n\s*(?:global|final)?\s*[:=]?\s*(\d+(?:[.,]\d+)?)", re.IGNORECASE),
+    re.compile(r"\b(\d+(?:[.,]\d+)?)\s*/\s*10\b"),
+)
+_RATIONALE_RE = re.compile(r'"justificaci[oó]n"\s*:\s*"((?:[^"\\]|\\.)*)', re.DOTALL)
+
+
+def _shorten(text, limit=RATIONALE_MAX_CHARS):
+    text = " ".join(str(text).split())
+    return text if len(text) <= limit else text[:limit - 1].rstrip() + "…"
+
+
+def _score(value):
+    """
+    Convierte una puntuación (número o texto como '7' o '7/10') a float, ajustada al rango
+    SCORE_MIN..SCORE_MAX (un 0 pasa a 1 y un 11 a 10); None si no es un número.
+    """
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, str):
+        value = value.split("/")[0].strip().replace(",", ".")
+    try:
+        score = float(value)
+    except (TypeError, ValueError):
+        return None
+    if not math.isfinite(score):
+        return None
+    return round(min(max(score, SCORE_MIN), SCORE_MAX), 1)
+
+
+@dataclass
+class Evaluation:
+    """
+    Evaluación de una respuesta: nota global, notas por dimensión de la rúbrica y una
+    justificación breve. 'structured' indica si el modelo devolvió un JSON válido o si
+    se recuperó la nota del texto libre.
+    """
+    score: float = None
+    dimensions: dict = field(default_factory=dict)
+    rationale: str = ""
+    structured: bool = False
+
+    def render(self):
+        """Texto legible para la interfaz, el historial y el informe."""
+        text = f"Puntuación: {self.score:g}/10" if self.score is not None else "Puntuación: no disponible"
+        if self.dimensions:
+            text += " (" + ", ".join(f"{name} {value:g}" for name, value in self.dimensions.items()) + ")"
+        return f"{text}. {self.rationale}" if self.rationale else text
+
+    def to_dict(self):
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**{key: data[key] for key in cls.__dataclass_fields__ if key in data})
+
+
+def _from_json(data):
+    score = _score(data.get("puntuacion", data.get("puntuación", data.get("score"))))
+    if score is None:
+        return None
+    raw_dimensions = data.get("dimensiones") or data.get("dimensions") or {}
+    dimensions = {}
+    if isinstance(raw_dimensions, dict):
+        for name in EVALUATION_DIMENSIONS:
+            value = _score(raw_dimensions.get(name))
+            if value is not None:
+                dimensions[name] = value
+    rationale = data.get("justificacion", data.get("justificación", data.get("rationale", "")))
+    return Evaluation(score=score, dimensions=dimensions, rationale=_shorten(rationale or ""), structured=True)
+
+
+def parse_evaluation(text):
+    """
+    Interpreta la salida del modelo. Se espera el JSON de EVALUATION_FORMAT (admite que
+    venga sin la llave inicial, que se envía como prefijo de la respuesta, o entre
+    bloques de código). Si no es un JSON válido, se extraen del texto la nota y la
+    justificación que se puedan recuperar.
+    """
+    text = _FENCE_RE.sub("", (text or "").strip())
+    candidate = text if text.startswith("{") else "{" + text
+    start, end = candidate.find("{"), candidate.rfind("}")
+    if end > start:
+        try:
+            data = json.loads(candidate[start:end + 1])
+        except json.JSONDecodeError:
+            data = None
+        if isinstance(data, dict):
+            evaluation = _from_json(data)
+            if evaluation is not None:
+                return evaluation
+
+    # Texto libre o JSON truncado por el presupuesto de tokens
+    score = None
+    for pattern in _SCORE_RES:
+        match = pattern.search(text)
+        if match:
+            score = _score(match.group(1))
+            if score is not None:
+                break
+    if _SCORE_RES[0].search(text):
+        # JSON incompleto: se recuperan las dimensiones y la justificación que lleguen a aparecer
+        dimensions = {}
+        for name in EVALUATION_DIMENSIONS:
+            match = re.search(rf'"{name}"\s*:\s*"?(\d+(?:[.,]\d+)?)', text)
+            value = _score(match.group(1)) if match else None
+            if value is not None:
+                dimensions[name] = value
+        match = _RATIONALE_RE.search(text)
+        rationale = match.group(1).replace('\\"', '"') if match else ""
+        return Evaluation(score=score, dimensions=dimensions, rationale=_shorten(rationale))
+    rationale = re.sub(r"^\s*puntuaci[oó]n\s*[:=]?\s*\d+(?:[.,]\d+)?\s*(/\s*10)?\s*[.,;]?", "", text,
+                       flags=re.IGNORECASE)
+    rationale = re.sub(r"^\s*justificaci[oó]n\s*:\s*", "", rationale, flags=re.IGNORECASE)
+    return Evaluation(score=score, rationale=_shorten(rationale))
+
+
+def summarize_scores(evaluations):
+    """
+    Agrega una lista de evaluaciones (Evaluation o sus diccionarios): número de notas,
+    media, mínimo, máximo y media por dimensión de la rúbrica.
+    """
+    scores, dimensions = [], {}
+    for evaluation in evaluations:
+        if isinstance(evaluation, dict):
+            evaluation = Evaluation.from_dict(evaluation)
+        if evaluation.score is None:
+            continue
+        scores.append(evaluation.score)
+        for name, value in evaluation.dimensions.items():
+            dimensions.setdefault(name, []).append(value)
+    return {
+        "count": len(scores),
+        "mean": round(sum(scores) / len(scores), 2) if scores else None,
+        "min": min(scores) if scores else None,
+        "max": max(scores) if scores else None,
+        "dimensions": {name: round(sum(values) / len(values), 2) for name, values in dimensions.items()},
+    }
@@ -0,0 +1,171 @@
+# fake_bedrock.py
+
+import io
+import json
+import random
+import threading
+import time
+
+
+class FakeClientError(Exception):
+    """Imita botocore.exceptions.ClientError (expone 'response' con el código de error)."""
+    def __init__(self, code, status=400, message="Error simulado"):
+        super().__init__(f"An error occurred ({code}): {message}")
+        self.response = {"Error": {"Code": code, "Message": message},
+                         "ResponseMetadata": {"HTTPStatusCode": status}}
+
+
+# Códigos HTTP habituales de cada error de Bedrock, para los fallos simulados
+FAULT_STATUS = {
+    "ThrottlingException": 429,
+    "ModelTimeoutException": 408,
+    "ServiceUnavailableException": 503,
+    "InternalServerException": 500,
+    "ValidationException": 400,
+    "AccessDeniedException": 403,
+}
+
+
+class FakeBedrockClient:
+    """
+    Cliente local que imita la interfaz de 'bedrock-runtime' (invoke_model e
+    invoke_model_with_response_stream) para probar sin acceso a AWS.
+    Se inyecta con Interviewer(client=FakeBedrockClient(...)).
+    """
+    def __init__(self, reply="Pregunta de prueba: ¿Cuál ha sido tu mayor reto profesional?",
+                 chunk_words=3, first_token_delay=0.0, chunk_delay=0.0,
+                 faults=None, fault_rate=0.0, fault_code="ThrottlingException",
+                 stream_fault_after=None, seed=None,
+                 prefill_per_1k_tokens=0.0, tokens_per_second=0.0, latency_jitter=0.0,
+                 record_calls=True):
+        # 'reply' puede ser un texto fijo o una función que recibe el body (dict) y devuelve texto
+        self.reply = reply
+        self.chunk_words = chunk_words
+        self.first_token_delay = first_token_delay
+        self.chunk_delay = chunk_delay
+        # Modelo de latencia: el primer token tarda first_token_delay más
+        # prefill_per_1k_tokens por cada 1000 tokens de entrada no cacheados; la salida se
+        # genera a tokens_per_second (0 = usa chunk_delay). latency_jitter es la variación
+        # relativa aleatoria (0.2 = ±20 %) aplicada a cada espera.
+        self.prefill_per_1k_tokens = prefill_per_1k_tokens
+        self.tokens_per_second = tokens_per_second
+        self.latency_jitter = latency_jitter
+        # Inyección de fallos: 'faults' es una secuencia de códigos de error (o None = éxito)
+        # que se consume llamada a llamada; después se aplica 'fault_rate' con 'fault_code'.
+        # 'stream_fault_after' corta el stream con un error tras ese número de fragmentos.
+        self.faults = list(faults or [])
+        self.fault_rate = fault_rate
+        self.fault_code = fault_code
+        self.stream_fault_after = stream_fault_after
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        # Bodies recibidos (se puede desactivar en pruebas de carga largas)
+        self.record_calls = record_calls
+        self.calls = []
+        self._cached_prefixes = set()
+
+    def _maybe_fail(self):
+        with self._lock:
+            if self.faults:
+                code = self.faults.pop(0)
+            elif self.fault_rate and self._random.random() < self.fault_rate:
+                code = self.fault_code
+            else:
+                code = None
+        if code:
+            raise FakeClientError(code, FAULT_STATUS.get(code, 400))
+
+    def _sleep(self, seconds):
+        if seconds <= 0:
+            return
+        if self.latency_jitter:
+            with self._lock:
+                seconds *= 1 + self._random.uniform(-self.latency_jitter, self.latency_jitter)
+        time.sleep(max(0.0, seconds))
+
+    def _first_token_latency(self, usage):
+        uncached = usage["input_tokens"] + usage.get("cache_creation_input_tokens", 0)
+        return self.first_token_delay + self.prefill_per_1k_tokens * uncached / 1000
+
+    def _output_latency(self, text):
+        if not self.tokens_per_second:
+            return None
+        return max(1, len(text) // 4) / self.tokens_per_second
+
+    def _reply_text(self, body):
+        if callable(self.reply):
+            return self.reply(body)
+        return self.reply
+
+    def _usage(self, body, text):
+        system = body.get("system", "")
+        system_tokens = len(json.dumps(system)) // 4
+        usage = {"input_tokens": max(1, len(json.dumps(body.get("messages", []))) // 4),
+                 "output_tokens": max(1, len(text) // 4)}
+        # Simula la caché de prompts: el bloque de sistema cacheable se cobra una vez
+        cacheable = isinstance(system, list) and any("cache_control" in block for block in system)
+        if cacheable:
+            key = json.dumps(system, sort_keys=True)
+            if key in self._cached_prefixes:
+                usage["cache_read_input_tokens"] = system_tokens
+                usage["cache_creation_input_tokens"] = 0
+            else:
+                self._cached_prefixes.add(key)
+                usage["cache_read_input_tokens"] = 0
+                usage["cache_creation_input_tokens"] = system_tokens
+        else:
+            usage["input_tokens"] += system_tokens
+        return usage
+
+    def invoke_model(self, modelId, body, contentType=None, accept=None):
+        body = json.loads(body)
+        if self.record_calls:
+            self.calls.append(body)
+        self._maybe_fail()
+        text = self._reply_text(body)
+        usage = self._usage(body, text)
+        self._sleep(self._first_token_latency(usage) + (self._output_latency(text) or 0.0))
+        payload = {
+            "type": "message",
+            "role": "assistant",
+            "content": [{"type": "text", "text": text}],
+            "usage": usage,
+        }
+        return {"body": io.BytesIO(json.dumps(payload).encode("utf-8"))}
+
+    def invoke_model_with_response_stream(self, modelId, body, contentType=None, accept=None):
+        body = json.loads(body)
+        if self.record_calls:
+            self.calls.append(body)
+        self._maybe_fail()
+        text = self._reply_text(body)
+        return {"body": self._events(body, text)}
+
+    def _events(self, body, text):
+        usage = self._usage(body, text)
+
+        def event(payload):
+            return {"chunk": {"bytes": json.dumps(payload).encode("utf-8")}}
+
+        yield event({"type": "message_start",
+                     "message": {"usage": dict(usage, output_tokens=0)}})
+        yield event({"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}})
+        self._sleep(self._first_token_latency(usage))
+        words = text.split(" ")
+        chunks = (len(words) + self.chunk_words - 1) // self.chunk_words
+        output_latency = self._output_latency(text)
+        chunk_delay = output_latency / chunks if output_latency is not None else self.chunk_delay
+        for n, i in enumerate(range(0, len(words), self.chunk_words)):
+            if self.stream_fault_after is not None and n >= self.stream_fault_after:
+                yield {"modelStreamErrorException": {"message": "Fallo simulado a mitad del stream"}}
+                return
+            piece = " ".join(words[i:i + self.chunk_words])
+            if i + self.chunk_words < len(words):
+                piece += " "
+            yield event({"type": "content_block_delta", "index": 0,
+                         "delta": {"type": "text_delta", "text": piece}})
+            self._sleep(chunk_delay)
+        yield event({"type": "content_block_stop", "index": 0})
+        yield event({"type": "message_delta", "delta": {"stop_reason": "end_turn"},
+                     "usage": {"output_tokens": usage["output_tokens"]}})
+        yield event({"type": "message_stop"})
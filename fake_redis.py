@@ -0,0 +1,142 @@
+# fake_redis.py
+
+import fnmatch
+import threading
+import time
+
+
+class WatchError(Exception):
+    """Imita redis.exceptions.WatchError: una clave vigilada cambió antes de EXEC."""
+
+
+class FakeRedis:
+    """
+    Sustituto local del cliente de redis con el subconjunto de comandos que usa
+    session_store.RedisSessionStore (get, mget, set con caducidad, delete, scan_iter y
+    pipeline con watch/multi). Se inyecta con RedisSessionStore(client=FakeRedis()).
+    """
+    def __init__(self):
+        self._data = {}  # clave -> (valor, instante de caducidad o None)
+        self._revisions = {}  # clave -> número de escrituras, para WATCH
+        self._lock = threading.Lock()
+        self.commands = 0
+
+    def _get(self, key):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and time.time() >= expires_at:
+            del self._data[key]
+            return None
+        return value
+
+    def _set(self, key, value, ex=None):
+        if isinstance(value, int):
+            value = str(value)
+        if isinstance(value, str):
+            value = value.encode("utf-8")
+        self._data[key] = (value, time.time() + ex if ex else None)
+        self._revisions[key] = self._revisions.get(key, 0) + 1
+
+    def get(self, key):
+        with self._lock:
+            self.commands += 1
+            return self._get(key)
+
+    def mget(self, keys):
+        with self._lock:
+            self.commands += 1
+            return [self._get(key) for key in keys]
+
+    def set(self, key, value, ex=None):
+        with self._lock:
+            self.commands += 1
+            self._set(key, value, ex)
+        return True
+
+    def delete(self, *keys):
+        with self._lock:
+            self.commands += 1
+            removed = 0
+            for key in keys:
+                if self._data.pop(key, None) is not None:
+                    self._revisions[key] = self._revisions.get(key, 0) + 1
+                    removed += 1
+            return removed
+
+    def scan_iter(self, match="*"):
+        now = time.time()
+        with self._lock:
+            self.commands += 1
+            keys = [key for key, (_, expires_at) in self._data.items()
+                    if (expires_at is None or now < expires_at) and fnmatch.fnmatchcase(key, match)]
+        return iter(key.encode("utf-8") for key in keys)
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    """
+    Acumula comandos y los aplica juntos en execute(), como un pipeline de redis. Tras
+    watch() los comandos se ejecutan al momento hasta multi(), y execute() lanza
+    WatchError si alguna clave vigilada se ha escrito entretanto.
+    """
+    def __init__(self, client):
+        self._client = client
+        self._commands = []
+        self._watched = None  # clave -> revisión al vigilarla
+        self._immediate = False
+
+    def watch(self, *keys):
+        with self._client._lock:
+            self._client.commands += 1
+            self._watched = {key: self._client._revisions.get(key, 0) for key in keys}
+        self._immediate = True
+
+    def multi(self):
+        self._immediate = False
+
+    def get(self, key):
+        if self._immediate:
+            return self._client.get(key)
+        self._commands.append(("get", key))
+        return self
+
+    def mget(self, keys):
+        if self._immediate:
+            return self._client.mget(keys)
+        self._commands.append(("mget", keys))
+        return self
+
+    def set(self, key, value, ex=None):
+        if self._immediate:
+            return self._client.set(key, value, ex=ex)
+        self._commands.append(("set", key, value, ex))
+        return self
+
+    def execute(self):
+        # Un pipeline cuenta como un único viaje al servidor
+        commands, self._commands = self._commands, []
+        watched, self._watched = self._watched, None
+        client = self._client
+        with client._lock:
+            client.commands += 1
+            if watched and any(client._revisions.get(key, 0) != revision for key, revision in watched.items()):
+                raise WatchError("Una clave vigilada cambió antes de EXEC.")
+            results = []
+            for command in commands:
+                if command[0] == "get":
+                    results.append(client._get(command[1]))
+                elif command[0] == "mget":
+                    results.append([client._get(key) for key in command[1]])
+                else:
+                    client._set(*command[1:])
+                    results.append(True)
+        return results
+
+    def reset(self):
+        self._commands = []
+        self._watched = None
+        self._immediate = False
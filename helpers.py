@@ -1,74 +1,79 @@
 # helpers.py
 
+import hashlib
+import json
 import logging
+import os
+import threading
 import time
-import requests
 import urllib.parse
-from PyPDF2 import PdfReader
-from fpdf import FPDF
-from textblob import TextBlob
-from config import PDF_OUTPUT_PATH
+from config import ASSETS_CACHE_DIR, ASSET_RETRY_INTERVAL
+import countries
+import cv_parser
+from metrics import registry, timed
+from cv_preprocessing import preprocess_cv
 
 def get_countries_data():
     """
-    Obtiene la lista de países y sus ciudades desde la API de countriesnow.space.
-    Se reduce el tiempo de espera entre intentos para acelerar el proceso.
-    """
-    url = "https://countriesnow.space/api/v0.1/countries"
-    for attempt in range(3):
-        try:
-            response = requests.get(url, timeout=5)
-            response.raise_for_status()
-            data = response.json()
-            if not data.get("error", True):
-                return data.get("data", [])
-            else:
-                logging.error("Error en la respuesta de la API.")
-        except Exception as e:
-            logging.error(f"Intento {attempt + 1} - Error al obtener los datos: {e}")
-        time.sleep(0.2)
-    return []
+    Obtiene la lista de países y sus ciudades. Usa la caché local (memoria, snapshot en
+    disco o catálogo incluido) y refresca los datos de countriesnow.space en segundo plano.
+    """
+    return countries.get_countries_data()
 
-def upload_and_parse_cv(uploaded_file):
+@timed("cv_parse")
+def parse_cv(uploaded_file):
     """
-    Extrae el texto de un archivo PDF que representa el CV.
+    Extrae una sola vez las páginas del PDF del CV y devuelve (texto completo, CompactCV).
+    La versión compacta es la que se envía en los prompts. Si no se puede leer el PDF
+    devuelve ("", None); si falla solo la compactación, (texto, None).
+    Los resultados de la extracción se cachean por el hash del contenido del fichero.
     """
     try:
-        pdf_reader = PdfReader(uploaded_file)
-        content = ""
-        for page in pdf_reader.pages:
-            text = page.extract_text()
-            if text:
-                content += text
-        return content.strip()
+        pages = cv_parser.get_cv_pages(uploaded_file)
     except Exception as e:
+        # La excepción no sale de la función, así que @timed no la cuenta
+        registry.inc("cv_parse_errors_total", error=type(e).__name__)
         logging.error(f"Error al leer el PDF: {e}")
-        return ""
+        return "", None
+    cv_text = cv_parser.join_pages(pages)
+    if not cv_text:
+        return "", None
+    try:
+        return cv_text, preprocess_cv(pages)
+    except Exception as e:
+        logging.error(f"Error al preprocesar el CV: {e}")
+        return cv_text, None
 
-def export_to_pdf(conversation_history):
+def upload_and_parse_cv(uploaded_file):
     """
-    Exporta el historial completo de la entrevista a un archivo PDF.
+    Extrae el texto de un archivo PDF que representa el CV.
+    """
+    return parse_cv(uploaded_file)[0]
+
+def export_to_pdf(state):
+    """
+    Exporta el informe de la entrevista (InterviewState) a un archivo PDF propio de la
+    sesión y devuelve su ruta.
     """
     try:
-        pdf = FPDF()
-        pdf.add_page()
-        pdf.set_font("Arial", size=12)
-        pdf.multi_cell(0, 10, conversation_history)
-        pdf_file = PDF_OUTPUT_PATH
-        pdf.output(pdf_file)
-        return pdf_file
+        import pdf_report
+        return pdf_report.write_report(state)
     except Exception as e:
         logging.error(f"Error exportando a PDF: {e}")
         return None
 
+@timed("sentiment_analysis")
 def sentiment_analysis(text):
     """
-    Realiza un análisis de sentimiento simple usando TextBlob.
+    Realiza un análisis de sentimiento de un texto en español con el léxico de sentiment.py.
+    Para muchos textos a la vez, usar sentiment.score_batch.
     """
     try:
-        analysis = TextBlob(text)
-        return analysis.sentiment  # Objeto con polarity y subjectivity
+        # Importación diferida: NumPy y el léxico solo se necesitan al registrar respuestas
+        import sentiment
+        return sentiment.analyze(text)  # Objeto con polarity y subjectivity
     except Exception as e:
+        registry.inc("sentiment_analysis_errors_total", error=type(e).__name__)
         logging.error(f"Error realizando análisis de sentimiento: {e}")
         return None
 
@@ -95,18 +100,68 @@ def get_job_recommendations(position, location):
     ]
     return recommendations
 
-def load_lottieurl(url: str):
-    """
-    Carga una animación Lottie desde una URL.
-    """
+# Animaciones ya cargadas e instante del último intento de descarga de cada URL
+_lottie_memory = {}
+_lottie_attempts = {}
+_lottie_lock = threading.Lock()
+
+
+def _lottie_cache_path(url):
+    return os.path.join(ASSETS_CACHE_DIR, hashlib.sha256(url.encode("utf-8")).hexdigest()[:16] + ".json")
+
+
+def _download_lottie(url):
+    import requests
     try:
         r = requests.get(url, timeout=5)
         if r.status_code != 200:
             return None
-        return r.json()
+        animation = r.json()
     except Exception as e:
         logging.error(f"Error cargando Lottie: {e}")
         return None
+    try:
+        os.makedirs(ASSETS_CACHE_DIR, exist_ok=True)
+        path = _lottie_cache_path(url)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(animation, f)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        logging.error(f"Error guardando Lottie en caché: {e}")
+    with _lottie_lock:
+        _lottie_memory[url] = animation
+    return animation
+
+
+def load_lottieurl(url: str, background=False):
+    """
+    Carga una animación Lottie desde una URL. Se guarda en el caché local, así que solo
+    se descarga la primera vez. Con background=True no se espera a la red: la descarga
+    se lanza en segundo plano y se devuelve None hasta que la animación esté en caché.
+    """
+    with _lottie_lock:
+        if url in _lottie_memory:
+            return _lottie_memory[url]
+    try:
+        with open(_lottie_cache_path(url), encoding="utf-8") as f:
+            animation = json.load(f)
+        with _lottie_lock:
+            _lottie_memory[url] = animation
+        return animation
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logging.error(f"Error leyendo Lottie del caché: {e}")
+    if not background:
+        return _download_lottie(url)
+    with _lottie_lock:
+        # Sin red no se reintenta en cada ejecución del script
+        if time.monotonic() - _lottie_attempts.get(url, float("-inf")) < ASSET_RETRY_INTERVAL:
+            return None
+        _lottie_attempts[url] = time.monotonic()
+    threading.Thread(target=_download_lottie, args=(url,), name="lottie-download", daemon=True).start()
+    return None
 
 def generate_final_summary(conversation_history):
     """
@@ -0,0 +1,446 @@
+# interview_session.py
+
+import asyncio
+import logging
+import time
+import uuid
+from dataclasses import dataclass, asdict, field
+from config import CV_RETRIEVAL_ENABLED, CV_RETRIEVAL_MIN_TOKENS
+from conversation import ConversationStore, estimate_tokens
+from evaluation import Evaluation, parse_evaluation, summarize_scores
+from helpers import sentiment_analysis, generate_final_summary
+from interviewer import Interviewer
+from metrics import registry
+from pipeline import prefetch_next_turn
+
+# Frases con las que el modelo indica que la entrevista ha terminado
+FINISH_MARKERS = ("finalizar la entrevista", "terminado")
+# Número de preguntas que se considera una entrevista completa (barra de progreso)
+EXPECTED_QUESTIONS = 10
+
+
+@dataclass
+class InterviewState:
+    """
+    Estado completo de una entrevista. Es serializable a JSON (to_dict / from_dict),
+    de modo que cualquier proceso puede retomar la entrevista a partir de él.
+    """
+    session_id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    cv_text: str = ""
+    cv_prompt: str = ""  # CV compactado que se envía en los prompts
+    cv_chunks: list = field(default_factory=list)  # Fragmentos para cv_retrieval (vacío = CV completo)
+    position: str = ""
+    modalidad: str = ""
+    ubicacion: str = ""
+    conversation: ConversationStore = field(default_factory=ConversationStore)
+    conversation_history: str = ""
+    num_questions: int = 0
+    last_question: str = ""
+    # Una entrada por turno respondido, en el mismo orden que conversation.turns (texto vacío
+    # y nota None si la evaluación falló)
+    evaluations: list = field(default_factory=list)  # Texto de cada evaluación (Evaluation.render)
+    evaluation_results: list = field(default_factory=list)  # Evaluation serializadas: nota, rúbrica y justificación
+    polarity_list: list = field(default_factory=list)
+    sentiment_stats: dict = field(default_factory=dict)  # SentimentAggregate serializado
+    prompt_tokens: list = field(default_factory=list)  # Tokens de entrada estimados por pregunta
+    finished: bool = False
+    final_summary: str = ""
+    avg_polarity: float = 0.0
+    avg_score: float = None
+    updated_at: float = field(default_factory=time.time)
+    version: int = 0  # Escrituras en el almacén de sesiones; detecta copias desactualizadas entre workers
+
+    @property
+    def started(self):
+        return bool(self.cv_text and self.position)
+
+    @property
+    def progress(self):
+        return min(self.num_questions / EXPECTED_QUESTIONS, 1.0)
+
+    def to_dict(self):
+        return asdict(self)
+
+    def polarity_by_question(self):
+        """Pares (número de pregunta, polaridad) de las respuestas con sentimiento analizado."""
+        return [(number, turn.polarity) for number, turn in enumerate(self.conversation.turns, start=1)
+                if turn.polarity is not None]
+
+    def scores_by_question(self):
+        """Pares (número de pregunta, nota) de las respuestas evaluadas con nota."""
+        return [(number, result["score"]) for number, result in enumerate(self.evaluation_results, start=1)
+                if result.get("score") is not None]
+
+    @classmethod
+    def from_dict(cls, data):
+        data = dict(data)
+        data["conversation"] = ConversationStore.from_dict(data.get("conversation") or {})
+        if not data.get("sentiment_stats") and data.get("polarity_list"):
+            # Estados guardados antes de existir los agregados incrementales
+            from sentiment import SentimentAggregate
+            data["sentiment_stats"] = SentimentAggregate.from_values(data["polarity_list"]).to_dict()
+        turns = [turn for turn in data["conversation"].turns if turn.answer]
+        if data.get("polarity_list") and all(turn.polarity is None for turn in turns) \
+                and len(turns) == len(data["polarity_list"]):
+            # Estados anteriores a guardar la polaridad en cada turno: solo se asigna por
+            # orden si hay exactamente una polaridad por respuesta
+            for turn, polarity in zip(turns, data["polarity_list"]):
+                turn.polarity = polarity
+        if "evaluation_results" not in data and data.get("evaluations"):
+            # Estados guardados con evaluaciones en texto libre: se recupera la nota del texto
+            data["evaluation_results"] = [parse_evaluation(text).to_dict() for text in data["evaluations"]]
+        known = cls.__dataclass_fields__
+        return cls(**{key: value for key, value in data.items() if key in known})
+
+
+@dataclass
+class TurnResult:
+    """Resultado de registrar una respuesta: evaluación (None si falló) y sentimiento."""
+    evaluation: str = None
+    score: float = None
+    dimensions: dict = field(default_factory=dict)
+    polarity: float = None
+    subjectivity: float = None
+
+
+class SessionError(Exception):
+    """Operación no válida en el estado actual de la entrevista."""
+
+
+class InterviewSession:
+    """
+    Motor de la entrevista independiente de la interfaz. Gestiona el flujo completo
+    (inicio, preguntas, respuestas, evaluación, sentimiento y cierre) sobre un
+    InterviewState, y puede usarse desde Streamlit, un API o un worker.
+    Las llamadas al modelo lanzan ModelInvocationError si fallan.
+    'retrieval' decide si cada pregunta lleva solo los fragmentos relevantes del CV:
+    None = según la configuración y la longitud del CV, True = siempre, False = nunca.
+    'on_finish' se llama con el InterviewState al finalizar la entrevista (p. ej. para
+    registrarla en el almacén analítico).
+    """
+    def __init__(self, interviewer=None, state=None, prefetch=True, retrieval=None, on_finish=None):
+        # El Interviewer (y con él el cliente de Bedrock) se crea en la primera llamada al modelo
+        self._interviewer = interviewer
+        self.state = state or InterviewState()
+        self.prefetch = prefetch
+        self.retrieval = retrieval
+        self.on_finish = on_finish
+        # Estado de ejecución, no serializable: precarga en curso, índice del CV y resultados de la última llamada
+        self._prefetched = None
+        self._cv_index = None
+        self.last_call_metrics = {}
+        self.last_result = None
+        self.last_retrieval = None
+
+    @classmethod
+    def from_dict(cls, data, interviewer=None, prefetch=True, retrieval=None, on_finish=None):
+        return cls(interviewer=interviewer, state=InterviewState.from_dict(data), prefetch=prefetch,
+                   retrieval=retrieval, on_finish=on_finish)
+
+    def to_dict(self):
+        return self.state.to_dict()
+
+    def adopt_runtime(self, other):
+        """
+        Hereda el estado de ejecución de otra copia de la misma sesión (la que se descarta
+        al recargarla del almacén): la precarga en curso, que next_question_stream ignora
+        si ya no corresponde a la pregunta actual, y el índice del CV si los fragmentos
+        no han cambiado.
+        """
+        if self._prefetched is None:
+            self._prefetched = other._prefetched
+        if self._cv_index is None and other.state.cv_chunks == self.state.cv_chunks:
+            self._cv_index = other._cv_index
+
+    @property
+    def interviewer(self):
+        if self._interviewer is None:
+            self._interviewer = Interviewer()
+        return self._interviewer
+
+    @property
+    def session_id(self):
+        return self.state.session_id
+
+    def _touch(self):
+        self.state.updated_at = time.time()
+
+    def _require_active(self):
+        if not self.state.started:
+            raise SessionError("La entrevista no se ha iniciado.")
+        if self.state.finished:
+            raise SessionError("La entrevista ya ha finalizado.")
+
+    # --------------------------
+    # Inicio
+    # --------------------------
+    def start(self, cv_text, position, modalidad="", ubicacion="", cv_prompt=None):
+        """
+        Inicia (o reinicia) la entrevista con el texto del CV y el puesto.
+        'cv_prompt' es la versión compacta del CV; si no se indica se usa el texto completo.
+        """
+        if not cv_text or not cv_text.strip():
+            raise SessionError("No se pudo extraer texto del CV.")
+        if not position or not position.strip():
+            raise SessionError("Es necesario indicar el puesto.")
+        history = f"Inicio de la entrevista para el puesto '{position}' - Modalidad: {modalidad}"
+        history += f", Ubicación: {ubicacion}.\n" if ubicacion else ".\n"
+        self.state = InterviewState(session_id=self.state.session_id, cv_text=cv_text,
+                                    cv_prompt=cv_prompt or cv_text, position=position,
+                                    modalidad=modalidad, ubicacion=ubicacion,
+                                    conversation_history=history)
+        self._prefetched = None
+        self._cv_index = None
+        if self._use_retrieval(self.state.cv_prompt):
+            from cv_retrieval import chunk_cv  # Importación diferida: carga NumPy
+            self.state.cv_chunks = chunk_cv(self.state.cv_prompt)
+        return self.state
+
+    def _use_retrieval(self, cv_prompt):
+        if self.retrieval is None:
+            return CV_RETRIEVAL_ENABLED and estimate_tokens(cv_prompt) >= CV_RETRIEVAL_MIN_TOKENS
+        return self.retrieval
+
+    def _cv_context(self):
+        """
+        Devuelve (cv_content, cv_excerpts) para la siguiente pregunta: el CV completo, o
+        los datos generales más los fragmentos relevantes para los últimos turnos.
+        """
+        state = self.state
+        if not state.cv_chunks:
+            return state.cv_prompt, None
+        from cv_retrieval import CVIndex, build_query
+        if self._cv_index is None:
+            start = time.perf_counter()
+            self._cv_index = CVIndex(state.cv_chunks)
+            registry.observe("cv_index_build_seconds", time.perf_counter() - start)
+        retrieval = self._cv_index.select(build_query(state.position, state.conversation))
+        self.last_retrieval = retrieval.stats(first_turn=state.num_questions == 0)
+        registry.observe("cv_retrieval_seconds", retrieval.seconds)
+        # Coste frente al CV completo en el bloque cacheado (no frente a su tarifa normal);
+        # el ahorro es baseline - billed y puede ser negativo con CV cortos
+        registry.inc("cv_retrieval_billed_tokens_total", self.last_retrieval["billed_tokens"])
+        registry.inc("cv_retrieval_baseline_billed_tokens_total", self.last_retrieval["baseline_billed_tokens"])
+        logging.info(f"Fragmentos del CV {retrieval.selected}: {retrieval.full_tokens} -> {retrieval.tokens} "
+                     f"tokens; coste {self.last_retrieval['billed_tokens']:.0f} frente a "
+                     f"{self.last_retrieval['baseline_billed_tokens']:.0f} con el CV completo cacheado, "
+                     f"en {retrieval.seconds * 1000:.2f} ms.")
+        return retrieval.core, retrieval.excerpts
+
+    # --------------------------
+    # Preguntas
+    # --------------------------
+    def next_question(self):
+        """Genera la siguiente pregunta, la registra en el estado y la devuelve."""
+        return "".join(self.next_question_stream()).strip()
+
+    def next_question_stream(self):
+        """
+        Igual que next_question, pero devuelve un generador con los fragmentos de texto.
+        La pregunta se registra en el estado al consumir el generador por completo.
+        Si la pregunta se precargó al registrar la respuesta anterior, se entrega de una vez.
+        """
+        self._require_active()
+        prefetched, self._prefetched = self._prefetched, None
+        if prefetched is not None and prefetched.question_number != self.state.num_questions:
+            prefetched = None
+        return self._question_chunks(prefetched)
+
+    def _question_chunks(self, prefetched):
+        state = self.state
+        question = None
+        if prefetched is not None:
+            try:
+                question, self.last_call_metrics = prefetched.next_question.result()
+                yield question
+            except Exception as e:
+                logging.error(f"La precarga de la pregunta falló, se genera de nuevo: {e}")
+                question = None
+        if question is None:
+            parts = []
+            cv_content, cv_excerpts = self._cv_context()
+            for chunk in self.interviewer.generate_question_stream(
+                    cv_content, state.position, state.conversation, state.modalidad, state.ubicacion,
+                    cv_excerpts):
+                parts.append(chunk)
+                yield chunk
+            question = "".join(parts)
+            self.last_call_metrics = self.interviewer.last_call_metrics
+        self._record_question(question.strip())
+
+    def _record_question(self, question):
+        state = self.state
+        state.prompt_tokens.append(self.last_call_metrics.get("prompt_tokens"))
+        state.conversation.add_question(question)
+        state.last_question = question
+        state.conversation_history += f"Entrevistador: {question}\n"
+        state.num_questions += 1
+        self._touch()
+        logging.info(f"Uso de la pregunta {state.num_questions}: {self.last_call_metrics}")
+        if any(marker in question.lower() for marker in FINISH_MARKERS):
+            self.finish()
+
+    # --------------------------
+    # Respuestas
+    # --------------------------
+    def submit_answer(self, answer):
+        """
+        Registra la respuesta a la última pregunta, la evalúa y analiza su sentimiento.
+        Devuelve un TurnResult; si la evaluación falla, la respuesta y el sentimiento
+        quedan registrados igualmente y se relanza el error.
+        """
+        for _ in self.submit_answer_stream(answer):
+            pass
+        return self.last_result
+
+    def submit_answer_stream(self, answer):
+        """
+        Igual que submit_answer, pero devuelve un generador con los fragmentos de la
+        evaluación. Al terminar, el resultado completo queda en 'last_result'.
+        """
+        self._require_active()
+        if not self.state.last_question:
+            raise SessionError("Todavía no se ha formulado ninguna pregunta.")
+        if not answer or not answer.strip():
+            raise SessionError("La respuesta está vacía.")
+        state = self.state
+        state.conversation_history += f"Usuario: {answer}\n"
+        state.conversation.record_answer(answer)
+        self.last_result = None
+        prefetched = None
+        if self.prefetch:
+            # La siguiente pregunta y el sentimiento se calculan en segundo plano
+            # mientras se genera la evaluación
+            cv_content, cv_excerpts = self._cv_context()
+            prefetched = prefetch_next_turn(self.interviewer, state.num_questions, cv_content,
+                                            state.position, state.conversation, state.modalidad,
+                                            state.ubicacion, answer, cv_excerpts)
+            self._prefetched = prefetched
+        return self._evaluation_chunks(answer, prefetched)
+
+    def _evaluation_chunks(self, answer, prefetched):
+        state = self.state
+        result = TurnResult()
+        turn_index = len(state.conversation.turns) - 1
+        evaluation = None
+        try:
+            # La evaluación es un JSON corto: se espera a tenerlo completo para validarlo y
+            # se emite una sola vez ya renderizado
+            raw = "".join(self.interviewer.evaluate_response_stream(state.last_question, answer))
+            evaluation = parse_evaluation(raw)
+            registry.inc("evaluations_structured_total" if evaluation.structured else "evaluations_fallback_total")
+            result.evaluation = evaluation.render()
+            result.score = evaluation.score
+            result.dimensions = dict(evaluation.dimensions)
+            # Se registra antes de entregarla: el consumidor puede cerrar el generador tras recibirla
+            state.conversation.record_answer(answer, result.evaluation)
+            self._store_evaluation(turn_index, evaluation)
+            yield result.evaluation
+        finally:
+            if evaluation is None:
+                # Hueco para que evaluations[i] siga correspondiendo al turno i
+                self._store_evaluation(turn_index, None)
+            sentiment = prefetched.sentiment.result() if prefetched is not None else sentiment_analysis(answer)
+            if sentiment:
+                result.polarity = sentiment.polarity
+                result.subjectivity = sentiment.subjectivity
+                state.conversation.turns[-1].polarity = sentiment.polarity
+                state.polarity_list.append(sentiment.polarity)
+                state.sentiment_stats = self.sentiment_aggregate().update(sentiment.polarity).to_dict()
+            self.last_result = result
+            self._touch()
+
+    def _store_evaluation(self, index, evaluation):
+        """
+        Guarda la evaluación del turno 'index' en evaluations y evaluation_results,
+        rellenando con huecos (texto vacío, nota None) los turnos anteriores sin evaluar.
+        """
+        state = self.state
+        empty = Evaluation()
+        while len(state.evaluation_results) < index:
+            state.evaluations.append("")
+            state.evaluation_results.append(empty.to_dict())
+        text = evaluation.render() if evaluation is not None else ""
+        data = (evaluation or empty).to_dict()
+        if len(state.evaluation_results) > index:
+            state.evaluations[index], state.evaluation_results[index] = text, data
+        else:
+            state.evaluations.append(text)
+            state.evaluation_results.append(data)
+
+    def sentiment_aggregate(self):
+        """Media, varianza y tendencia de la polaridad de las respuestas (SentimentAggregate)."""
+        from sentiment import SentimentAggregate  # Importación diferida: carga NumPy
+        return SentimentAggregate.from_dict(self.state.sentiment_stats)
+
+    def score_summary(self):
+        """Nota media, mínima y máxima y media por dimensión de la rúbrica (evaluation.summarize_scores)."""
+        return summarize_scores(self.state.evaluation_results)
+
+    # --------------------------
+    # Cierre
+    # --------------------------
+    def finish(self):
+        """Finaliza la entrevista y devuelve el resumen final (idempotente)."""
+        state = self.state
+        if state.finished:
+            return state.final_summary
+        state.finished = True
+        self._prefetched = None
+        state.final_summary = generate_final_summary(state.conversation_history)
+        state.avg_polarity = self.sentiment_aggregate().mean
+        state.avg_score = self.score_summary()["mean"]
+        state.conversation_history += "\n=== Resumen Final de la Entrevista ===\n"
+        state.conversation_history += state.final_summary
+        state.conversation_history += f"\nPromedio de Polaridad (Tono Global): {state.avg_polarity:.2f}\n"
+        if state.avg_score is not None:
+            state.conversation_history += f"Puntuación Media: {state.avg_score:.1f}/10\n"
+        self._touch()
+        if self.on_finish is not None:
+            self.on_finish(state)
+        return state.final_summary
+
+
+_STREAM_END = object()
+
+
+class AsyncInterviewSession:
+    """
+    API asíncrona sobre InterviewSession para frontends y workers basados en asyncio.
+    Las llamadas bloqueantes (modelo, sentimiento) se ejecutan en hilos aparte.
+    """
+    def __init__(self, session=None, **kwargs):
+        self.session = session or InterviewSession(**kwargs)
+
+    @property
+    def state(self):
+        return self.session.state
+
+    async def start(self, cv_text, position, modalidad="", ubicacion="", cv_prompt=None):
+        return self.session.start(cv_text, position, modalidad, ubicacion, cv_prompt)
+
+    async def next_question(self):
+        return await asyncio.to_thread(self.session.next_question)
+
+    async def submit_answer(self, answer):
+        return await asyncio.to_thread(self.session.submit_answer, answer)
+
+    async def finish(self):
+        return await asyncio.to_thread(self.session.finish)
+
+    async def next_question_stream(self):
+        async for chunk in self._iterate(self.session.next_question_stream):
+            yield chunk
+
+    async def submit_answer_stream(self, answer):
+        async for chunk in self._iterate(self.session.submit_answer_stream, answer):
+            yield chunk
+
+    @staticmethod
+    async def _iterate(factory, *args):
+        chunks = await asyncio.to_thread(factory, *args)
+        while True:
+            chunk = await asyncio.to_thread(next, chunks, _STREAM_END)
+            if chunk is _STREAM_END:
+                return
+            yield chunk
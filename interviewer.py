@@ -1,63 +1,143 @@
 # interviewer.py
 
 import json
-import boto3
 import logging
-from config import AWS_MODEL_ID, AWS_BEDROCK_VERSION
-import os
+import time
+from config import (
+    AWS_MODEL_ID,
+    AWS_BEDROCK_VERSION,
+    PROMPT_CACHING_ENABLED,
+    RESPONSE_CACHE_EVALUATIONS,
+    MAX_TOKENS_QUESTION,
+    MAX_TOKENS_EVALUATION,
+)
+from bedrock_client import get_bedrock_client
+from conversation import ContextBuilder, estimate_tokens
+from evaluation import EVALUATION_DIMENSIONS, EVALUATION_FORMAT, parse_evaluation
+from response_cache import cache_key, get_response_cache
+from invocation import ModelInvocationError, classify_error, get_invoker, stream_event_error
+from metrics import registry
 # Configuración del logging (opcional, si ya lo configuras en otro lugar, podrías omitirlo aquí)
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+INTERVIEW_OPENING = "Hola, estoy listo para comenzar la entrevista."
+NEXT_QUESTION_INSTRUCTION = "Formula la siguiente pregunta de la entrevista."
+# La respuesta de la evaluación empieza con este prefijo para forzar el JSON
+EVALUATION_PREFILL = "{"
+
 class Interviewer:
     """
     Clase encargada de interactuar con la API de Amazon Bedrock para generar preguntas
     y evaluar respuestas durante la entrevista.
     """
-    def __init__(self):
-            try:
-                region = os.environ.get("AWS_DEFAULT_REGION", "us-east-1")
-                # Solo para depurar, imprime si existen las variables (¡Cuidado de no imprimir datos sensibles en producción!)
-                if not os.environ.get("AWS_ACCESS_KEY_ID") or not os.environ.get("AWS_SECRET_ACCESS_KEY"):
-                    logging.error("Variables AWS_ACCESS_KEY_ID o AWS_SECRET_ACCESS_KEY no están definidas en el entorno.")
-                else:
-                    logging.info("Credenciales de AWS encontradas en el entorno.")
-                
-                self.client = boto3.client(
-                    'bedrock-runtime',
-                    region_name=region
-                )
-            except Exception as e:
-                logging.error(f"Error inicializando el cliente de boto3: {e}")
-                raise
-
-    def generate_question(self, cv_content, position, conversation_history):
+    def __init__(self, client=None, region=None, context_builder=None,
+                 response_cache=None, cache_evaluations=RESPONSE_CACHE_EVALUATIONS, invoker=None):
+        """
+        Usa el cliente de Bedrock compartido del proceso salvo que se inyecte uno
+        (por ejemplo, un cliente falso para pruebas). Las evaluaciones pueden servirse
+        desde un caché de respuestas; las preguntas nunca se cachean para que varíen.
+        Las llamadas pasan por el invocador resiliente del proceso (reintentos,
+        circuit breaker y límite de concurrencia) y sus fallos se lanzan como
+        ModelInvocationError.
+        """
+        try:
+            self.client = client if client is not None else get_bedrock_client(region)
+        except Exception as e:
+            logging.error(f"Error inicializando el cliente de boto3: {e}")
+            raise
+        self.context_builder = context_builder or ContextBuilder()
+        self.invoker = invoker or get_invoker()
+        self.cache_evaluations = cache_evaluations
+        self.response_cache = response_cache
+        if self.response_cache is None and cache_evaluations:
+            self.response_cache = get_response_cache()
+        # Métricas de la última invocación (tokens del prompt, ttft, tiempo total, uso)
+        self.last_call_metrics = {}
+
+    def generate_question(self, cv_content, position, conversation, modalidad="", ubicacion="", cv_excerpts=None):
         """
         Genera una pregunta basándose en el contenido del CV, el puesto y el historial de la conversación.
+        'conversation' es un ConversationStore (o, por compatibilidad, el historial como texto).
+        'cv_excerpts' son los fragmentos del CV relevantes para este turno (cv_retrieval); si se
+        indican, 'cv_content' solo lleva los datos generales.
         """
-        body = {
-            "anthropic_version": AWS_BEDROCK_VERSION,
-            "max_tokens": 5000,
-            "messages": [
-                {
-                    "role": "user",
-                    "content": f"""
-Actúa como un entrevistador profesional de recursos humanos para el puesto de '{position}'.
-CV: {cv_content}
-Historial: {conversation_history}
-Formula preguntas específicas y naturales que permitan evaluar la idoneidad del candidato.
-                    """
-                }
-            ]
-        }
-        return self._invoke_model(body)
+        return self._invoke_model(self._question_body(cv_content, position, conversation, modalidad, ubicacion,
+                                                      cv_excerpts))
+
+    def generate_question_stream(self, cv_content, position, conversation, modalidad="", ubicacion="",
+                                 cv_excerpts=None):
+        """
+        Igual que generate_question, pero devuelve un generador con los fragmentos de texto
+        a medida que llegan del modelo.
+        """
+        return self._invoke_model_stream(self._question_body(cv_content, position, conversation, modalidad,
+                                                             ubicacion, cv_excerpts))
+
+    def evaluate(self, question, user_response):
+        """
+        Evalúa la respuesta y devuelve una Evaluation validada (nota, rúbrica y justificación).
+        """
+        return parse_evaluation(self.evaluate_response(question, user_response))
 
     def evaluate_response(self, question, user_response):
         """
-        Evalúa la respuesta del usuario basado en la pregunta realizada.
+        Evalúa la respuesta del usuario basado en la pregunta realizada. Devuelve el texto
+        del modelo (el JSON de evaluation.EVALUATION_FORMAT sin la llave inicial, que va
+        como prefijo); evaluation.parse_evaluation lo convierte en una Evaluation.
+        """
+        return self._invoke_model(self._evaluation_body(question, user_response),
+                                  cacheable=self.cache_evaluations)
+
+    def evaluate_response_stream(self, question, user_response):
+        """
+        Igual que evaluate_response, pero devuelve un generador con los fragmentos de texto.
         """
-        body = {
+        return self._invoke_model_stream(self._evaluation_body(question, user_response),
+                                         cacheable=self.cache_evaluations)
+
+    def _question_system(self, cv_content, position, modalidad, ubicacion, cv_excerpts=None):
+        """
+        Bloque estático del prompt (instrucciones, CV, puesto, modalidad y ubicación).
+        No cambia durante la entrevista, por lo que se marca como cacheable. Los fragmentos
+        del CV elegidos para el turno van en un segundo bloque, detrás del cacheado.
+        """
+        text = f"""Actúa como un entrevistador profesional de recursos humanos para el puesto de '{position}'.
+Modalidad de trabajo: {modalidad or 'No especificada'}
+Ubicación: {ubicacion or 'No especificada'}
+CV del candidato:
+{cv_content}
+
+Formula preguntas específicas y naturales que permitan evaluar la idoneidad del candidato.
+Haz una sola pregunta por turno, teniendo en cuenta las respuestas anteriores."""
+        block = {"type": "text", "text": text}
+        if PROMPT_CACHING_ENABLED:
+            block["cache_control"] = {"type": "ephemeral"}
+        if not cv_excerpts:
+            return [block]
+        excerpts = {"type": "text", "text": f"Fragmentos del CV relevantes para la conversación actual:\n{cv_excerpts}"}
+        return [block, excerpts]
+
+    def _question_body(self, cv_content, position, conversation, modalidad="", ubicacion="", cv_excerpts=None):
+        if isinstance(conversation, str):
+            # Historial en texto plano: se envía como un único turno del usuario
+            messages = [{"role": "user", "content": [
+                {"type": "text", "text": f"Historial: {conversation}\n\n{NEXT_QUESTION_INSTRUCTION}"}
+            ]}]
+        else:
+            messages = self.context_builder.build_messages(
+                conversation, opening=INTERVIEW_OPENING, instruction=NEXT_QUESTION_INSTRUCTION
+            )
+        return {
+            "anthropic_version": AWS_BEDROCK_VERSION,
+            "max_tokens": MAX_TOKENS_QUESTION,
+            "system": self._question_system(cv_content, position, modalidad, ubicacion, cv_excerpts),
+            "messages": messages
+        }
+
+    def _evaluation_body(self, question, user_response):
+        return {
             "anthropic_version": AWS_BEDROCK_VERSION,
-            "max_tokens": 3000,
+            "max_tokens": MAX_TOKENS_EVALUATION,
             "messages": [
                 {
                     "role": "user",
@@ -65,29 +145,197 @@ Formula preguntas específicas y naturales que permitan evaluar la idoneidad del
 Evalúa la siguiente respuesta:
 Pregunta: {question}
 Respuesta: {user_response}
-Proporciona una puntuación del 1 al 10 y una justificación detallada.
+Puntúa del 1 al 10 la respuesta en global y en cada dimensión ({", ".join(EVALUATION_DIMENSIONS)}) \
+y justifica la nota en una o dos frases.
+Responde únicamente con un JSON con este formato, sin texto adicional:
+{EVALUATION_FORMAT}
                     """
-                }
+                },
+                {"role": "assistant", "content": EVALUATION_PREFILL}
             ]
         }
-        return self._invoke_model(body)
 
-    def _invoke_model(self, body):
+    def _cache_lookup(self, body, cacheable):
+        """
+        Devuelve (clave, texto_cacheado) si la llamada es cacheable; (None, None) si no.
+        """
+        if not cacheable or self.response_cache is None:
+            return None, None
+        key = cache_key(body, AWS_MODEL_ID)
+        cached = self.response_cache.get(key)
+        registry.inc("response_cache_lookups_total", result="hit" if cached is not None else "miss")
+        if cached is not None:
+            self.last_call_metrics = {"prompt_tokens": self._prompt_tokens(body), "total": 0.0,
+                                      "ttft": 0.0, "cache_hit": True}
+        return key, cached
+
+    def _invoke_model(self, body, cacheable=False):
+        """
+        Invoca el modelo pasando antes por el caché de respuestas si la llamada es cacheable.
+        """
+        key, cached = self._cache_lookup(body, cacheable)
+        if cached is not None:
+            return cached
+        text = self._call_model(body)
+        if key is not None:
+            self.response_cache.set(key, text)
+        return text
+
+    def _invoke_model_stream(self, body, cacheable=False):
+        """
+        Versión en streaming de _invoke_model: un acierto de caché se devuelve como un
+        único fragmento; en caso contrario se guarda el texto completo al terminar.
+        """
+        key, cached = self._cache_lookup(body, cacheable)
+        if cached is not None:
+            yield cached
+            return
+        parts = []
+        for chunk in self._call_model_stream(body):
+            parts.append(chunk)
+            yield chunk
+        if key is not None:
+            self.response_cache.set(key, "".join(parts).strip())
+
+    def _call_model(self, body):
         """
         Método privado que se encarga de invocar el modelo de Bedrock y procesar la respuesta.
         """
-        try:
+        start = time.perf_counter()
+        metrics = {"prompt_tokens": self._prompt_tokens(body), "total": None,
+                   "cache_hit": False, "error": False,
+                   "input_tokens": None, "output_tokens": None,
+                   "cache_read_input_tokens": None, "cache_creation_input_tokens": None}
+        self.last_call_metrics = metrics
+
+        def request():
             response = self.client.invoke_model(
                 modelId=AWS_MODEL_ID,
                 body=json.dumps(body),
                 contentType="application/json",
                 accept="application/json"
             )
-            response_body = json.loads(response['body'].read().decode('utf-8'))
-            content = response_body.get('content', [])
-            if isinstance(content, list):
-                return " ".join(item.get("text", "") for item in content).strip()
-            return content.strip()
+            return json.loads(response['body'].read().decode('utf-8'))
+
+        try:
+            response_body = self.invoker.call(request)
+        except ModelInvocationError as e:
+            metrics["error"] = True
+            registry.inc("model_errors_total", error=type(e).__name__)
+            raise
+        finally:
+            metrics["total"] = time.perf_counter() - start
+            registry.observe("model_invoke_seconds", metrics["total"], mode="blocking")
+        self._record_usage(metrics, response_body.get('usage', {}))
+        self._export_usage(metrics)
+        content = response_body.get('content', [])
+        if isinstance(content, list):
+            return " ".join(item.get("text", "") for item in content).strip()
+        return content.strip()
+
+    def _call_model_stream(self, body):
+        """
+        Método privado que invoca el modelo con invoke_model_with_response_stream y va
+        devolviendo el texto de cada delta. Al terminar deja en self.last_call_metrics
+        el tiempo hasta el primer token (ttft) y el tiempo total, en segundos.
+        """
+        start = time.perf_counter()
+        metrics = {"prompt_tokens": self._prompt_tokens(body), "ttft": None, "total": None,
+                   "cache_hit": False, "error": False,
+                   "input_tokens": None, "output_tokens": None,
+                   "cache_read_input_tokens": None, "cache_creation_input_tokens": None}
+        self.last_call_metrics = metrics
+        try:
+            response, lease = self.invoker.call(
+                lambda: self.client.invoke_model_with_response_stream(
+                    modelId=AWS_MODEL_ID,
+                    body=json.dumps(body),
+                    contentType="application/json",
+                    accept="application/json"
+                ),
+                keep_slot=True
+            )
+        except ModelInvocationError as e:
+            metrics["error"] = True
+            metrics["total"] = time.perf_counter() - start
+            registry.inc("model_errors_total", error=type(e).__name__)
+            registry.observe("model_invoke_seconds", metrics["total"], mode="stream")
+            raise
+
+        # El hueco de concurrencia se mantiene ocupado hasta que termina el stream
+        error = None
+        try:
+            for event in response['body']:
+                event_error = stream_event_error(event)
+                if event_error is not None:
+                    raise event_error
+                chunk = event.get('chunk')
+                if not chunk:
+                    continue
+                payload = json.loads(chunk['bytes'].decode('utf-8'))
+                event_type = payload.get('type')
+                if event_type == 'content_block_delta':
+                    text = payload.get('delta', {}).get('text', '')
+                    if text:
+                        if metrics["ttft"] is None:
+                            metrics["ttft"] = time.perf_counter() - start
+                        yield text
+                elif event_type == 'message_start':
+                    self._record_usage(metrics, payload.get('message', {}).get('usage', {}))
+                elif event_type == 'message_delta':
+                    metrics["output_tokens"] = payload.get('usage', {}).get('output_tokens')
+        except ModelInvocationError as e:
+            error = e
+            raise
         except Exception as e:
-            logging.error(f"Error al invocar el modelo: {e}")
-            return f"Error: {e}"
+            error = classify_error(e)
+            raise error from e
+        finally:
+            lease.release(error)
+            metrics["total"] = time.perf_counter() - start
+            registry.observe("model_invoke_seconds", metrics["total"], mode="stream")
+            if metrics["ttft"] is not None:
+                registry.observe("model_ttft_seconds", metrics["ttft"])
+            self._export_usage(metrics)
+            if error is not None:
+                metrics["error"] = True
+                registry.inc("model_errors_total", error=type(error).__name__)
+                logging.error(f"Error al invocar el modelo en streaming: {error}")
+            elif metrics["ttft"] is not None:
+                logging.info(f"Streaming completado: ttft={metrics['ttft']:.3f}s, total={metrics['total']:.3f}s")
+
+    @staticmethod
+    def _record_usage(metrics, usage):
+        """
+        Copia en las métricas los tokens de entrada (cacheados y no cacheados) y de salida.
+        """
+        for key in ("input_tokens", "output_tokens", "cache_read_input_tokens", "cache_creation_input_tokens"):
+            if key in usage:
+                metrics[key] = usage[key]
+        if metrics["cache_read_input_tokens"] or metrics["cache_creation_input_tokens"]:
+            logging.info(f"Tokens de entrada: no cacheados={metrics['input_tokens']}, "
+                         f"leídos de caché={metrics['cache_read_input_tokens']}, "
+                         f"escritos en caché={metrics['cache_creation_input_tokens']}")
+
+    @staticmethod
+    def _export_usage(metrics):
+        """Acumula en el registro de métricas los tokens de la llamada."""
+        registry.inc("model_input_tokens_total", metrics.get("input_tokens") or 0, kind="uncached")
+        registry.inc("model_input_tokens_total", metrics.get("cache_read_input_tokens") or 0, kind="cache_read")
+        registry.inc("model_input_tokens_total", metrics.get("cache_creation_input_tokens") or 0, kind="cache_write")
+        registry.inc("model_output_tokens_total", metrics.get("output_tokens") or 0)
+
+    @staticmethod
+    def _prompt_tokens(body):
+        """
+        Estimación de los tokens de entrada del prompt (sistema + mensajes).
+        """
+        def block_text(content):
+            if isinstance(content, list):
+                return " ".join(block.get("text", "") for block in content)
+            return content or ""
+
+        text = block_text(body.get("system", ""))
+        for message in body.get("messages", []):
+            text += block_text(message.get("content", ""))
+        return estimate_tokens(text)
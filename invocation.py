@@ -0,0 +1,331 @@
+# invocation.py
+
+import logging
+import random
+import threading
+import time
+from config import (
+    INVOKE_MAX_ATTEMPTS,
+    INVOKE_BACKOFF_BASE,
+    INVOKE_BACKOFF_MAX,
+    INVOKE_DEADLINE,
+    INVOKE_QUEUE_TIMEOUT,
+    CIRCUIT_FAILURE_THRESHOLD,
+    CIRCUIT_RESET_TIMEOUT,
+    CONCURRENCY_INITIAL,
+    CONCURRENCY_MIN,
+    CONCURRENCY_MAX,
+)
+from metrics import registry
+
+
+# ==============================
+# Errores tipados
+# ==============================
+
+class ModelInvocationError(Exception):
+    """Error base al invocar el modelo. 'retryable' indica si tiene sentido reintentar."""
+    retryable = False
+
+    def __init__(self, message, code=None):
+        super().__init__(message)
+        self.code = code
+
+
+class ModelThrottledError(ModelInvocationError):
+    """Bedrock ha limitado la petición (ThrottlingException y similares)."""
+    retryable = True
+
+
+class ModelTimeoutError(ModelInvocationError):
+    """La petición superó el tiempo de conexión o de lectura."""
+    retryable = True
+
+
+class ModelUnavailableError(ModelInvocationError):
+    """Error transitorio del servicio (5xx, modelo no disponible)."""
+    retryable = True
+
+
+class ModelRequestError(ModelInvocationError):
+    """Petición inválida, credenciales o permisos: no se reintenta."""
+
+
+class CircuitOpenError(ModelInvocationError):
+    """El circuito está abierto tras demasiados fallos seguidos; se rechaza sin llamar."""
+
+
+class ConcurrencyLimitError(ModelInvocationError):
+    """No se obtuvo un hueco de concurrencia a tiempo."""
+    retryable = True
+
+
+_THROTTLE_CODES = {"ThrottlingException", "TooManyRequestsException", "ServiceQuotaExceededException",
+                   "RequestLimitExceeded"}
+_TIMEOUT_CODES = {"ModelTimeoutException", "RequestTimeout", "RequestTimeoutException"}
+_UNAVAILABLE_CODES = {"ServiceUnavailableException", "InternalServerException", "ModelNotReadyException",
+                      "ModelStreamErrorException", "InternalFailure", "ServiceUnavailable"}
+_TIMEOUT_CLASSES = {"ReadTimeoutError", "ConnectTimeoutError", "TimeoutError", "ReadTimeout", "ConnectTimeout"}
+_CONNECTION_CLASSES = {"EndpointConnectionError", "ConnectionClosedError", "ConnectionError"}
+
+
+def classify_error(exc):
+    """
+    Convierte una excepción de boto3/botocore (o del cliente falso) en un error tipado.
+    Se usa el código de error de la respuesta y, si no hay, el nombre de la clase.
+    """
+    if isinstance(exc, ModelInvocationError):
+        return exc
+    code = None
+    response = getattr(exc, "response", None)
+    if isinstance(response, dict):
+        code = response.get("Error", {}).get("Code")
+        status = response.get("ResponseMetadata", {}).get("HTTPStatusCode")
+    else:
+        status = None
+    name = type(exc).__name__
+    message = f"{code or name}: {exc}"
+
+    if code in _THROTTLE_CODES or status == 429:
+        return ModelThrottledError(message, code)
+    if code in _TIMEOUT_CODES or name in _TIMEOUT_CLASSES or status == 408:
+        return ModelTimeoutError(message, code)
+    if code in _UNAVAILABLE_CODES or name in _CONNECTION_CLASSES or (status and status >= 500):
+        return ModelUnavailableError(message, code)
+    return ModelRequestError(message, code)
+
+
+def stream_event_error(event):
+    """
+    Los streams de Bedrock entregan los errores como eventos ('throttlingException',
+    'modelStreamErrorException', ...). Devuelve el error tipado o None.
+    """
+    for key, value in event.items():
+        if key.endswith("Exception"):
+            message = value.get("message", key) if isinstance(value, dict) else str(value)
+            code = key[0].upper() + key[1:]
+            if code in _THROTTLE_CODES:
+                return ModelThrottledError(f"{code}: {message}", code)
+            if code in _TIMEOUT_CODES:
+                return ModelTimeoutError(f"{code}: {message}", code)
+            if code in _UNAVAILABLE_CODES:
+                return ModelUnavailableError(f"{code}: {message}", code)
+            return ModelRequestError(f"{code}: {message}", code)
+    return None
+
+
+# ==============================
+# Circuit breaker
+# ==============================
+
+class CircuitBreaker:
+    """
+    Abre el circuito tras 'failure_threshold' fallos transitorios seguidos. Mientras está
+    abierto las llamadas fallan de inmediato; pasado 'reset_timeout' deja pasar una
+    llamada de prueba (semiabierto) y se cierra si tiene éxito.
+    """
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold=CIRCUIT_FAILURE_THRESHOLD, reset_timeout=CIRCUIT_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    raise CircuitOpenError("El servicio del modelo no está disponible temporalmente (circuito abierto).")
+                self.state = self.HALF_OPEN
+                self._trial_in_flight = False
+            if self.state == self.HALF_OPEN:
+                if self._trial_in_flight:
+                    raise CircuitOpenError("El servicio del modelo se está recuperando; inténtalo en unos segundos.")
+                self._trial_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                logging.info("Circuito del modelo cerrado de nuevo.")
+            self.state = self.CLOSED
+            self.failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logging.error(f"Circuito del modelo abierto tras {self.failures} fallos seguidos.")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def record_neutral(self):
+        """La llamada terminó con un error no transitorio: no cuenta, pero libera la prueba."""
+        with self._lock:
+            self._trial_in_flight = False
+
+
+# ==============================
+# Limitador de concurrencia adaptativo
+# ==============================
+
+class AdaptiveConcurrencyLimiter:
+    """
+    Limita las llamadas simultáneas al modelo en todo el proceso con un esquema AIMD:
+    el límite crece poco a poco con cada éxito y se reduce a la mitad cuando Bedrock
+    devuelve throttling.
+    """
+    def __init__(self, initial=CONCURRENCY_INITIAL, minimum=CONCURRENCY_MIN, maximum=CONCURRENCY_MAX,
+                 decrease_factor=0.5):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.decrease_factor = decrease_factor
+        self.in_flight = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, timeout=INVOKE_QUEUE_TIMEOUT):
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise ConcurrencyLimitError("Demasiadas peticiones simultáneas al modelo.")
+                self._cond.wait(remaining)
+            self.in_flight += 1
+
+    def release(self, throttled=False):
+        with self._cond:
+            self.in_flight -= 1
+            if throttled:
+                self.limit = max(self.minimum, self.limit * self.decrease_factor)
+                logging.info(f"Throttling de Bedrock: límite de concurrencia reducido a {int(self.limit)}.")
+            else:
+                self.limit = min(self.maximum, self.limit + 1.0 / max(self.limit, 1.0))
+            self._cond.notify_all()
+
+
+# ==============================
+# Invocador resiliente
+# ==============================
+
+class Lease:
+    """Hueco de concurrencia que sigue ocupado mientras se consume un stream."""
+    def __init__(self, invoker):
+        self._invoker = invoker
+        self._released = False
+
+    def release(self, error=None):
+        if self._released:
+            return
+        self._released = True
+        self._invoker._finish(error)
+
+
+class ResilientInvoker:
+    """
+    Ejecuta llamadas al modelo con reintentos (backoff exponencial con jitter), plazo
+    máximo total, circuit breaker y limitador de concurrencia compartido.
+    """
+    def __init__(self, max_attempts=INVOKE_MAX_ATTEMPTS, backoff_base=INVOKE_BACKOFF_BASE,
+                 backoff_max=INVOKE_BACKOFF_MAX, deadline=INVOKE_DEADLINE,
+                 breaker=None, limiter=None, sleep=time.sleep):
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.deadline = deadline
+        self.breaker = breaker or CircuitBreaker()
+        self.limiter = limiter or AdaptiveConcurrencyLimiter()
+        self.sleep = sleep
+        self._stats = {"calls": 0, "retries": 0, "throttled": 0, "failures": 0, "rejected": 0}
+        self._stats_lock = threading.Lock()
+
+    def _count(self, name):
+        with self._stats_lock:
+            self._stats[name] += 1
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats.update(circuit=self.breaker.state, concurrency_limit=int(self.limiter.limit),
+                     in_flight=self.limiter.in_flight)
+        return stats
+
+    def _finish(self, error):
+        """Libera el hueco de concurrencia y actualiza el circuito según el resultado."""
+        self.limiter.release(throttled=isinstance(error, ModelThrottledError))
+        if error is None:
+            self.breaker.record_success()
+        elif error.retryable:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_neutral()
+
+    def _backoff(self, attempt):
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)))
+
+    def call(self, fn, keep_slot=False):
+        """
+        Ejecuta fn() con reintentos. Con keep_slot=True devuelve (resultado, Lease) y el
+        hueco de concurrencia no se libera hasta llamar a lease.release().
+        Lanza siempre errores tipados (ModelInvocationError).
+        """
+        self._count("calls")
+        start = time.monotonic()
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                self.breaker.before_call()
+            except CircuitOpenError:
+                self._count("rejected")
+                raise
+            try:
+                self.limiter.acquire()
+            except ConcurrencyLimitError:
+                self.breaker.record_neutral()
+                self._count("rejected")
+                raise
+            try:
+                result = fn()
+            except Exception as e:
+                error = classify_error(e)
+                self._finish(error)
+                if isinstance(error, ModelThrottledError):
+                    self._count("throttled")
+                delay = self._backoff(attempt)
+                out_of_time = time.monotonic() - start + delay > self.deadline
+                if not error.retryable or attempt >= self.max_attempts or out_of_time:
+                    self._count("failures")
+                    logging.error(f"Error al invocar el modelo (intento {attempt}): {error}")
+                    raise error from e
+                self._count("retries")
+                logging.info(f"Reintentando la llamada al modelo en {delay:.2f}s tras: {error}")
+                self.sleep(delay)
+                continue
+            if keep_slot:
+                return result, Lease(self)
+            self._finish(None)
+            return result
+
+
+_default_invoker = None
+_default_lock = threading.Lock()
+
+
+def get_invoker():
+    """Devuelve el invocador compartido por todo el proceso (un único limitador y circuito)."""
+    global _default_invoker
+    with _default_lock:
+        if _default_invoker is None:
+            _default_invoker = ResilientInvoker()
+            registry.register_collector(
+                lambda: {f"model_invoker_{name}": value for name, value in _default_invoker.stats().items()}
+            )
+        return _default_invoker
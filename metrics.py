@@ -0,0 +1,260 @@
+# metrics.py
+
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from config import METRICS_PORT, METRICS_JSON_PATH, METRICS_JSON_INTERVAL
+
+# Límites de los buckets de latencia (segundos)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key, extra=None):
+    items = list(key) + (list(extra.items()) if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in items) + "}"
+
+
+class Histogram:
+    """Histograma acumulado con buckets fijos, suma y recuento."""
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.total += 1
+        self.sum += value
+        for idx, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[idx] += 1
+                break
+
+    def quantile(self, q):
+        """Aproximación del cuantil a partir de los buckets (límite superior del bucket)."""
+        if not self.total:
+            return 0.0
+        target = q * self.total
+        cumulative = 0
+        for idx, count in enumerate(self.counts):
+            cumulative += count
+            if cumulative >= target:
+                return self.buckets[idx]
+        return float("inf")
+
+
+class MetricsRegistry:
+    """
+    Registro en memoria de contadores, gauges e histogramas del proceso.
+    Todas las operaciones son seguras entre hilos.
+    """
+    def __init__(self):
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def inc(self, name, amount=1, **labels):
+        if not amount:
+            return
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def set_gauge(self, name, value, **labels):
+        with self._lock:
+            self._gauges[(name, _label_key(labels))] = value
+
+    def observe(self, name, value, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def register_collector(self, collector):
+        """
+        Registra una función que devuelve {nombre_gauge: valor} y se evalúa en cada
+        exportación (útil para estadísticas que ya mantienen otros módulos).
+        """
+        with self._lock:
+            self._collectors.append(collector)
+
+    def _collect(self):
+        gauges = {}
+        for collector in list(self._collectors):
+            try:
+                for name, value in collector().items():
+                    if isinstance(value, (int, float)) and not isinstance(value, bool):
+                        gauges[(name, ())] = value
+            except Exception as e:
+                logging.error(f"Error en un colector de métricas: {e}")
+        return gauges
+
+    def snapshot(self):
+        """Devuelve todas las métricas como un diccionario serializable a JSON."""
+        collected = self._collect()
+        with self._lock:
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+            histograms = {key: (h.total, h.sum, h.quantile(0.5), h.quantile(0.95), h.quantile(0.99))
+                          for key, h in self._histograms.items()}
+        gauges.update(collected)
+
+        def name_of(key):
+            return key[0] + _format_labels(key[1])
+
+        return {
+            "timestamp": time.time(),
+            "counters": {name_of(k): v for k, v in sorted(counters.items())},
+            "gauges": {name_of(k): v for k, v in sorted(gauges.items())},
+            "histograms": {name_of(k): {"count": c, "sum": round(s, 6), "p50": p50, "p95": p95, "p99": p99}
+                           for k, (c, s, p50, p95, p99) in sorted(histograms.items())},
+        }
+
+    def render_prometheus(self):
+        """Exporta las métricas en el formato de texto de Prometheus."""
+        collected = self._collect()
+        lines = []
+        with self._lock:
+            for (name, key), value in sorted(self._counters.items()):
+                lines.append(f"{name}{_format_labels(key)} {value}")
+            gauges = dict(self._gauges)
+            gauges.update(collected)
+            for (name, key), value in sorted(gauges.items()):
+                lines.append(f"{name}{_format_labels(key)} {value}")
+            for (name, key), histogram in sorted(self._histograms.items()):
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_format_labels(key, {'le': bound})} {cumulative}")
+                lines.append(f"{name}_bucket{_format_labels(key, {'le': '+Inf'})} {histogram.total}")
+                lines.append(f"{name}_sum{_format_labels(key)} {histogram.sum}")
+                lines.append(f"{name}_count{_format_labels(key)} {histogram.total}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+
+
+# Registro global del proceso
+registry = MetricsRegistry()
+
+
+class timed:
+    """
+    Mide la latencia de un bloque o función y la registra en el histograma
+    '<name>_seconds'. Las excepciones se cuentan en '<name>_errors_total'.
+    Se usa como decorador (@timed("cv_parse")) o como contexto (with timed("x"):).
+    """
+    def __init__(self, name, **labels):
+        self.name = name
+        self.labels = labels
+        self._start = None
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        registry.observe(f"{self.name}_seconds", time.perf_counter() - self._start, **self.labels)
+        if exc_type is not None:
+            registry.inc(f"{self.name}_errors_total", error=exc_type.__name__, **self.labels)
+        return False
+
+    def __call__(self, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timed(self.name, **self.labels):
+                return func(*args, **kwargs)
+        return wrapper
+
+
+# ==============================
+# Exportación: endpoint HTTP y volcado JSON periódico
+# ==============================
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] == "/metrics":
+            body = registry.render_prometheus().encode("utf-8")
+            content_type = "text/plain; version=0.0.4"
+        elif self.path.split("?")[0] == "/metrics.json":
+            body = json.dumps(registry.snapshot()).encode("utf-8")
+            content_type = "application/json"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_exporters_started = False
+_exporters_lock = threading.Lock()
+
+
+def start_metrics_server(port):
+    """Sirve /metrics (Prometheus) y /metrics.json en un hilo en segundo plano."""
+    server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    logging.info(f"Métricas disponibles en http://0.0.0.0:{port}/metrics")
+    return server
+
+
+def dump_json(path):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(registry.snapshot(), f, indent=1)
+    os.replace(tmp_path, path)
+
+
+def start_json_dump(path, interval):
+    """Vuelca periódicamente las métricas a un fichero JSON."""
+    def loop():
+        while True:
+            time.sleep(interval)
+            try:
+                dump_json(path)
+            except Exception as e:
+                logging.error(f"Error volcando métricas a {path}: {e}")
+    threading.Thread(target=loop, name="metrics-json-dump", daemon=True).start()
+
+
+def start_exporters():
+    """
+    Arranca una única vez por proceso los exportadores configurados
+    (METRICS_PORT y/o METRICS_JSON_PATH).
+    """
+    global _exporters_started
+    with _exporters_lock:
+        if _exporters_started:
+            return
+        _exporters_started = True
+    if METRICS_PORT:
+        try:
+            start_metrics_server(METRICS_PORT)
+        except OSError as e:
+            logging.error(f"No se pudo abrir el puerto de métricas {METRICS_PORT}: {e}")
+    if METRICS_JSON_PATH:
+        start_json_dump(METRICS_JSON_PATH, METRICS_JSON_INTERVAL)
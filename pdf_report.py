@@ -0,0 +1,270 @@
+# pdf_report.py
+
+import functools
+import logging
+import os
+import threading
+import time
+from config import (
+    PDF_OUTPUT_DIR,
+    PDF_FONT_PATH,
+    PDF_FONT_BOLD_PATH,
+    PDF_FONT_CANDIDATES,
+)
+from metrics import timed
+
+# fontTools registra a nivel INFO cada paso del subconjunto de la fuente
+logging.getLogger("fontTools").setLevel(logging.WARNING)
+
+# Versión del formato del informe: cambiarla al modificar su contenido o maquetación
+# para que report_export.py vuelva a generar los informes ya exportados
+REPORT_FORMAT_VERSION = 4
+FONT_FAMILY = "Informe"
+# Fuente estándar de PDF (solo latin-1) si no se encuentra ninguna TTF Unicode
+FALLBACK_FAMILY = "helvetica"
+
+# Normalización en una sola pasada (str.translate): caracteres invisibles y de control
+# que descuadran el texto en el PDF
+_CLEAN_TABLE = {code: None for code in range(32) if chr(code) not in "\n\t"}
+_CLEAN_TABLE.update({
+    ord("\t"): "    ",
+    ord("\u00a0"): " ",  # Espacio duro
+    ord("\u200b"): None,  # Espacios de anchura cero
+    ord("\u200c"): None,
+    ord("\u200d"): None,
+    ord("\ufeff"): None,  # BOM
+    ord("\u2028"): "\n",  # Separadores de línea y párrafo
+    ord("\u2029"): "\n",
+})
+_CLEAN = str.maketrans(_CLEAN_TABLE)
+# Con la fuente estándar, además, los signos tipográficos pasan a sus equivalentes latin-1
+_LATIN1 = str.maketrans({
+    **_CLEAN_TABLE,
+    ord("“"): '"', ord("”"): '"', ord("„"): '"',
+    ord("‘"): "'", ord("’"): "'", ord("‚"): "'",
+    ord("–"): "-", ord("—"): "-", ord("−"): "-",
+    ord("…"): "...", ord("•"): "-", ord("€"): "EUR", ord("™"): "(TM)",
+})
+
+
+@functools.lru_cache(maxsize=1)
+def resolve_fonts():
+    """
+    Devuelve (ruta regular, ruta negrita) de la fuente TTF Unicode a usar, o None si no
+    hay ninguna disponible. Si no existe la variante negrita se usa la regular.
+    """
+    candidates = (PDF_FONT_PATH,) if PDF_FONT_PATH else PDF_FONT_CANDIDATES
+    regular = next((path for path in candidates if path and os.path.isfile(path)), None)
+    if regular is None:
+        logging.error("No se encontró una fuente TTF Unicode para el PDF; se usa la estándar (solo latin-1).")
+        return None
+    bold = PDF_FONT_BOLD_PATH
+    if not bold:
+        root, ext = os.path.splitext(regular)
+        bold = f"{root}-Bold{ext}"
+    return regular, bold if os.path.isfile(bold) else regular
+
+
+def iter_report_blocks(state):
+    """
+    Recorre el InterviewState y genera los bloques del informe en orden, sin construir
+    el texto completo: ("title" | "heading" | "label" | "text", texto) y ("chart", pares
+    (número de pregunta, polaridad)).
+    """
+    yield "title", "Informe de la Entrevista"
+    yield "text", f"Puesto: {state.position}"
+    details = [f"Modalidad: {state.modalidad}"] if state.modalidad else []
+    if state.ubicacion:
+        details.append(f"Ubicación: {state.ubicacion}")
+    details.append(f"Fecha: {time.strftime('%d/%m/%Y %H:%M', time.localtime(state.updated_at))}")
+    yield "text", " · ".join(details)
+
+    for number, turn in enumerate(state.conversation.turns, start=1):
+        yield "heading", f"Pregunta {number}"
+        yield "text", turn.question
+        if not turn.answer:
+            continue
+        yield "label", "Respuesta"
+        yield "text", turn.answer
+        if turn.evaluation:
+            yield "label", "Evaluación"
+            yield "text", turn.evaluation
+        if turn.polarity is not None:
+            yield "label", f"Polaridad: {turn.polarity:+.2f}"
+
+    polarity = state.polarity_by_question()
+    if polarity:
+        yield "heading", "Análisis de Polaridad de Respuestas"
+        yield "chart", polarity
+    if state.finished:
+        yield "heading", "Resumen Final de la Entrevista"
+        yield "text", state.final_summary
+        yield "label", f"Promedio de Polaridad (Tono Global): {state.avg_polarity:.2f}"
+        if state.avg_score is not None:
+            yield "label", f"Puntuación Media: {state.avg_score:.1f}/10"
+
+
+class ReportRenderer:
+    """
+    Escribe los bloques de iter_report_blocks en un documento FPDF a medida que llegan:
+    cada texto se normaliza una sola vez y se escribe línea a línea, de modo que la
+    memoria de trabajo depende del turno más largo y no de la entrevista completa.
+    """
+    def __init__(self):
+        from fpdf import FPDF  # Importación diferida: solo se necesita al exportar
+        self.pdf = FPDF()
+        self.pdf.set_auto_page_break(True, margin=15)
+        self.pdf.set_title("Informe de la Entrevista")
+        fonts = resolve_fonts()
+        if fonts:
+            self.pdf.add_font(FONT_FAMILY, "", fonts[0])
+            self.pdf.add_font(FONT_FAMILY, "B", fonts[1])
+            self.family, self.table = FONT_FAMILY, _CLEAN
+        else:
+            self.family, self.table = FALLBACK_FAMILY, _LATIN1
+        self._widths = {}  # (estilo, tamaño, palabra) -> ancho
+        self.pdf.add_page()
+
+    def normalize(self, text):
+        text = (text or "").translate(self.table)
+        if self.family == FALLBACK_FAMILY:
+            text = text.encode("latin-1", "replace").decode("latin-1")
+        return text
+
+    def _width(self, word):
+        key = (self.pdf.font_style, self.pdf.font_size_pt, word)
+        width = self._widths.get(key)
+        if width is None:
+            width = self._widths[key] = self.pdf.get_string_width(word)
+        return width
+
+    def _wrap(self, paragraph, max_width):
+        """
+        Parte un párrafo en líneas que caben en 'max_width'. Se hace aquí, con los anchos
+        de palabra cacheados, porque el ajuste de multi_cell recalcula el ancho de la línea
+        en cada carácter y su coste crece con la longitud del texto.
+        """
+        space = self._width(" ")
+        line, line_width = [], 0.0
+        for word in paragraph.split(" "):
+            width = self._width(word)
+            while width > max_width and len(word) > 1:
+                # Palabras más largas que la línea (URLs, etc.): se cortan por caracteres
+                if line:
+                    yield " ".join(line)
+                    line, line_width = [], 0.0
+                cut = len(word) - 1
+                while cut > 1 and self._width(word[:cut]) > max_width:
+                    cut = max(1, int(cut * max_width / self._width(word[:cut])))
+                yield word[:cut]
+                word = word[cut:]
+                width = self._width(word)
+            needed = width if not line else line_width + space + width
+            if line and needed > max_width:
+                yield " ".join(line)
+                line, needed = [], width
+            line.append(word)
+            line_width = needed
+        yield " ".join(line)
+
+    def _write(self, text, size, style="", height=6, space_before=0):
+        pdf = self.pdf
+        if space_before:
+            pdf.ln(space_before)
+        pdf.set_font(self.family, style, size)
+        max_width = pdf.w - pdf.l_margin - pdf.r_margin - 2 * pdf.c_margin
+        for paragraph in self.normalize(text).strip("\n").split("\n"):
+            for line in self._wrap(paragraph, max_width):
+                pdf.cell(0, height, line, new_x="LMARGIN", new_y="NEXT")
+
+    def add(self, kind, payload):
+        if kind == "title":
+            self._write(payload, 18, "B", height=10)
+            self.pdf.ln(2)
+        elif kind == "heading":
+            self._write(payload, 14, "B", height=8, space_before=4)
+        elif kind == "label":
+            self._write(payload, 11, "B", space_before=1)
+        elif kind == "chart":
+            self._draw_polarity_chart(payload)
+        else:
+            self._write(payload, 11)
+
+    def _draw_polarity_chart(self, values, height=50):
+        """
+        Gráfico de barras vectorial de la polaridad por respuesta (eje en 0, rango [-1, 1]).
+        'values' son pares (número de pregunta, polaridad); cada barra lleva su número.
+        """
+        pdf = self.pdf
+        if pdf.get_y() + height + 10 > pdf.h - pdf.b_margin:
+            pdf.add_page()
+        left, top = pdf.l_margin, pdf.get_y() + 2
+        width = pdf.w - pdf.l_margin - pdf.r_margin
+        axis = top + height / 2
+        slot = width / len(values)
+        bar = max(slot * 0.7, 0.2)
+        pdf.set_draw_color(120, 120, 120)
+        pdf.line(left, axis, left + width, axis)
+        pdf.set_font(self.family, "", 7)
+        for idx, (number, value) in enumerate(values):
+            value = max(-1.0, min(1.0, value))
+            bar_height = abs(value) * height / 2
+            x = left + idx * slot + (slot - bar) / 2
+            if value >= 0:
+                pdf.set_fill_color(10, 61, 98)
+                pdf.rect(x, axis - bar_height, bar, bar_height, style="F")
+            else:
+                pdf.set_fill_color(192, 57, 43)
+                pdf.rect(x, axis, bar, bar_height, style="F")
+            if slot >= 6:
+                pdf.text(x, top + height + 4, str(number))
+        pdf.set_draw_color(0, 0, 0)
+        pdf.set_y(top + height + 8)
+
+    def output(self, path=None):
+        """Devuelve el PDF como bytes o, si se indica 'path', lo escribe en ese fichero."""
+        if path:
+            self.pdf.output(path)
+            return path
+        return bytes(self.pdf.output())
+
+
+def _render(state):
+    renderer = ReportRenderer()
+    for kind, payload in iter_report_blocks(state):
+        renderer.add(kind, payload)
+    return renderer
+
+
+@timed("pdf_report")
+def render_report(state):
+    """Genera el informe PDF de la entrevista en memoria y lo devuelve como bytes."""
+    return _render(state).output()
+
+
+def report_filename(session_id):
+    # Los ids se generan con uuid4().hex; se descartan separadores por seguridad
+    safe_id = "".join(ch for ch in session_id if ch.isalnum() or ch in "-_")
+    return f"entrevista_{safe_id}.pdf"
+
+
+def report_path(session_id, directory=PDF_OUTPUT_DIR):
+    return os.path.join(directory, report_filename(session_id))
+
+
+@timed("pdf_report")
+def write_report(state, directory=PDF_OUTPUT_DIR):
+    """
+    Escribe el informe en un fichero propio de la sesión dentro de 'directory' y devuelve
+    su ruta. Se escribe en un temporal y se renombra, así que nunca se lee a medias.
+    """
+    os.makedirs(directory, exist_ok=True)
+    path = report_path(state.session_id, directory)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        _render(state).output(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return path
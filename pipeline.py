@@ -0,0 +1,60 @@
+# pipeline.py
+
+import copy
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from config import PIPELINE_MAX_WORKERS
+from helpers import sentiment_analysis
+
+# Executor compartido por todas las sesiones del proceso
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """
+    Devuelve el ThreadPoolExecutor del proceso, creándolo la primera vez.
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=PIPELINE_MAX_WORKERS,
+                                               thread_name_prefix="interview-pipeline")
+    return _executor
+
+
+@dataclass
+class PrefetchedTurn:
+    """Trabajo lanzado en segundo plano al registrar una respuesta."""
+    question_number: int     # Número de la pregunta respondida
+    next_question: Future    # Future[(texto, métricas)] con la siguiente pregunta
+    sentiment: Future        # Future con el análisis de sentimiento de la respuesta
+
+
+def _generate(interviewer, *args):
+    # Copia superficial: comparte el cliente pero tiene sus propias métricas
+    worker = copy.copy(interviewer)
+    question = worker.generate_question(*args)
+    return question, worker.last_call_metrics
+
+
+def prefetch_next_turn(interviewer, question_number, cv_content, position, conversation,
+                       modalidad, ubicacion, user_response, cv_excerpts=None):
+    """
+    Lanza en segundo plano la generación de la siguiente pregunta y el análisis de
+    sentimiento de la respuesta. La evaluación puede hacerse en paralelo, ya que la
+    siguiente pregunta solo depende de la respuesta, no de su puntuación.
+    """
+    executor = get_executor()
+    # Se envía una copia de la conversación para no compartir estado mutable entre hilos
+    snapshot = copy.deepcopy(conversation)
+    logging.info(f"Precargando la pregunta siguiente a la número {question_number}.")
+    return PrefetchedTurn(
+        question_number=question_number,
+        next_question=executor.submit(_generate, interviewer, cv_content, position, snapshot,
+                                      modalidad, ubicacion, cv_excerpts),
+        sentiment=executor.submit(sentiment_analysis, user_response),
+    )
@@ -0,0 +1,264 @@
+# report_export.py
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import time
+import zipfile
+from concurrent.futures import ALL_COMPLETED, FIRST_COMPLETED, ProcessPoolExecutor, wait
+from config import REPORT_EXPORT_WORKERS, SESSION_STORE_BACKEND
+from pdf_report import REPORT_FORMAT_VERSION, render_report, report_filename
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+MANIFEST_NAME = "manifest.json"
+
+
+def content_hash(data):
+    """Hash del estado de la entrevista y de la versión del formato del informe."""
+    raw = json.dumps(data, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(f"{REPORT_FORMAT_VERSION}\x00{raw}".encode("utf-8")).hexdigest()
+
+
+# ==============================
+# Origen de las entrevistas
+# ==============================
+
+def iter_store_records(store):
+    """Recorre los estados de entrevista guardados en un SessionStore."""
+    from session_store import decode_state
+    for session_id in store.list_ids():
+        try:
+            blob = store.load(session_id)
+            if blob is not None:
+                yield decode_state(blob)
+        except Exception as e:
+            logging.error(f"Sesión {session_id} ignorada: {e}")
+
+
+def iter_jsonl_records(input_path):
+    """Recorre un JSONL con un estado de entrevista (InterviewState.to_dict()) por línea."""
+    with open(input_path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                record["session_id"] = str(record["session_id"])
+            except (json.JSONDecodeError, KeyError, TypeError) as e:
+                logging.error(f"Línea {line_number} ignorada: {e}")
+                continue
+            yield record
+
+
+# ==============================
+# Destino: directorio o fichero zip
+# ==============================
+
+class DirectoryOutput:
+    """Un PDF por entrevista en 'path', más el manifiesto."""
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def _write_file(self, name, data):
+        path = os.path.join(self.path, name)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def load_manifest(self):
+        try:
+            with open(os.path.join(self.path, MANIFEST_NAME), encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def has(self, name):
+        return os.path.exists(os.path.join(self.path, name))
+
+    def write(self, name, data):
+        self._write_file(name, data)
+
+    def keep(self, name):
+        pass
+
+    def close(self, manifest):
+        self._write_file(MANIFEST_NAME, json.dumps(manifest, indent=2, ensure_ascii=False).encode("utf-8"))
+
+    def abort(self):
+        pass
+
+
+class ZipOutput:
+    """
+    Fichero zip con los PDF y el manifiesto. Se genera uno nuevo en un temporal al que
+    se copian sin volver a renderizar los informes que no han cambiado.
+    """
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._previous = zipfile.ZipFile(path) if os.path.exists(path) else None
+        self._names = set(self._previous.namelist()) if self._previous else set()
+        self._tmp_path = f"{path}.{os.getpid()}.tmp"
+        # Los PDF ya van comprimidos: se guardan sin volver a comprimir
+        self._zip = zipfile.ZipFile(self._tmp_path, "w", zipfile.ZIP_STORED)
+
+    def load_manifest(self):
+        if MANIFEST_NAME not in self._names:
+            return {}
+        try:
+            return json.loads(self._previous.read(MANIFEST_NAME))
+        except json.JSONDecodeError:
+            return {}
+
+    def has(self, name):
+        return name in self._names
+
+    def write(self, name, data):
+        self._zip.writestr(name, data)
+
+    def keep(self, name):
+        self._zip.writestr(self._previous.getinfo(name), self._previous.read(name))
+
+    def close(self, manifest):
+        self._zip.writestr(MANIFEST_NAME, json.dumps(manifest, indent=2, ensure_ascii=False))
+        self._zip.close()
+        if self._previous:
+            self._previous.close()
+        os.replace(self._tmp_path, self.path)
+
+    def abort(self):
+        self._zip.close()
+        if self._previous:
+            self._previous.close()
+        os.remove(self._tmp_path)
+
+
+def open_output(path):
+    return ZipOutput(path) if path.lower().endswith(".zip") else DirectoryOutput(path)
+
+
+# ==============================
+# Exportación
+# ==============================
+
+def _render(data):
+    """Se ejecuta en los procesos del pool: genera el PDF de un estado de entrevista."""
+    from interview_session import InterviewState
+    start = time.perf_counter()
+    try:
+        pdf = render_report(InterviewState.from_dict(data))
+        return data["session_id"], pdf, None, time.perf_counter() - start
+    except Exception as e:
+        return data["session_id"], None, f"{type(e).__name__}: {e}", time.perf_counter() - start
+
+
+def run_export(records, output_path, workers=REPORT_EXPORT_WORKERS, force=False, finished_only=False):
+    """
+    Genera en paralelo (un proceso por núcleo) los informes PDF de las entrevistas de
+    'records' y los escribe en un directorio o un .zip junto con un manifiesto. Los
+    informes cuyo estado no ha cambiado desde la ejecución anterior (mismo hash) no se
+    vuelven a generar, salvo con 'force'.
+    """
+    workers = workers or os.cpu_count() or 1
+    output = open_output(output_path)
+    previous = {} if force else output.load_manifest().get("reports", {})
+    reports = {}
+    hashes = {}
+    stats = {"rendered": 0, "skipped": 0, "failed": 0, "ignored": 0, "bytes": 0}
+    start = time.perf_counter()
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            pending = set()
+
+            def drain(return_when):
+                finished, still_pending = wait(pending, return_when=return_when)
+                for future in finished:
+                    session_id, pdf, error, seconds = future.result()
+                    digest = hashes.pop(session_id)
+                    if error:
+                        logging.error(f"Error generando el informe de {session_id}: {error}")
+                        stats["failed"] += 1
+                        continue
+                    name = report_filename(session_id)
+                    output.write(name, pdf)
+                    reports[session_id] = {"file": name, "hash": digest, "bytes": len(pdf),
+                                           "render_seconds": round(seconds, 3)}
+                    stats["rendered"] += 1
+                    stats["bytes"] += len(pdf)
+                return still_pending
+
+            seen = set()
+            for data in records:
+                session_id = data.get("session_id")
+                started = data.get("cv_text") and data.get("position")
+                if not started or session_id in seen or (finished_only and not data.get("finished")):
+                    stats["ignored"] += 1
+                    continue
+                seen.add(session_id)
+                digest = content_hash(data)
+                entry = previous.get(session_id)
+                if entry and entry.get("hash") == digest and output.has(entry["file"]):
+                    output.keep(entry["file"])
+                    reports[session_id] = entry
+                    stats["skipped"] += 1
+                    continue
+                # Se limita el número de informes en vuelo para no cargar todo el origen en memoria
+                if len(pending) >= workers * 2:
+                    pending = drain(FIRST_COMPLETED)
+                hashes[session_id] = digest
+                pending.add(executor.submit(_render, data))
+            if pending:
+                drain(ALL_COMPLETED)
+
+        # Se conservan los informes de ejecuciones anteriores que no se han regenerado
+        for session_id, entry in previous.items():
+            if session_id not in reports and output.has(entry["file"]):
+                output.keep(entry["file"])
+                reports[session_id] = entry
+        elapsed = time.perf_counter() - start
+        output.close({
+            "format_version": REPORT_FORMAT_VERSION,
+            "generated_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "count": len(reports),
+            "reports": reports,
+        })
+    except BaseException:
+        output.abort()
+        raise
+
+    stats["elapsed"] = round(elapsed, 3)
+    stats["throughput"] = round(stats["rendered"] / elapsed, 3) if elapsed else 0.0
+    logging.info(f"Exportación de informes terminada: {stats}")
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Exporta por lotes los informes PDF de las entrevistas guardadas.")
+    parser.add_argument("output", help="Directorio o fichero .zip de salida (se actualiza si ya existe)")
+    parser.add_argument("--input", help="JSONL con estados de entrevista (por defecto, el almacén de sesiones)")
+    parser.add_argument("--backend", default=SESSION_STORE_BACKEND,
+                        help="Almacén de sesiones del que leer: file, sqlite o redis")
+    parser.add_argument("--workers", type=int, default=REPORT_EXPORT_WORKERS, help="Procesos (0 = núcleos de la CPU)")
+    parser.add_argument("--finished-only", action="store_true", help="Solo entrevistas finalizadas")
+    parser.add_argument("--force", action="store_true", help="Regenera todos los informes aunque no hayan cambiado")
+    args = parser.parse_args(argv)
+
+    if args.input:
+        records = iter_jsonl_records(args.input)
+    else:
+        from session_store import create_session_store
+        records = iter_store_records(create_session_store(args.backend))
+    stats = run_export(records, args.output, workers=args.workers, force=args.force,
+                       finished_only=args.finished_only)
+    print(json.dumps(stats))
+    return 0 if not stats["failed"] else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
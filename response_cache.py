@@ -0,0 +1,176 @@
+# response_cache.py
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from config import (
+    RESPONSE_CACHE_BACKEND,
+    RESPONSE_CACHE_MAX_ENTRIES,
+    RESPONSE_CACHE_TTL,
+    RESPONSE_CACHE_SQLITE_PATH,
+)
+from metrics import registry
+
+
+def cache_key(body, model_id):
+    """
+    Hash canónico de una petición: mismo modelo y mismo body (sin importar el orden
+    de las claves) producen siempre la misma clave.
+    """
+    canonical = json.dumps({"model": model_id, "body": body}, sort_keys=True,
+                           ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Interfaz común de los cachés de respuestas del modelo. Las implementaciones
+    guardan texto por clave con caducidad (TTL) y un número máximo de entradas.
+    """
+    def __init__(self, max_entries=RESPONSE_CACHE_MAX_ENTRIES, ttl=RESPONSE_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "expired": 0}
+        self._stats_lock = threading.Lock()
+
+    def _count(self, name, amount=1):
+        with self._stats_lock:
+            self._stats[name] += amount
+
+    def _expired(self, created_at):
+        return bool(self.ttl) and time.time() - created_at > self.ttl
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, value):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+
+class MemoryResponseCache(ResponseCache):
+    """Caché LRU en memoria del proceso."""
+    def __init__(self, max_entries=RESPONSE_CACHE_MAX_ENTRIES, ttl=RESPONSE_CACHE_TTL):
+        super().__init__(max_entries, ttl)
+        self._entries = OrderedDict()  # clave -> (created_at, texto)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry[0]):
+                del self._entries[key]
+                entry = None
+                self._count("expired")
+            if entry is None:
+                self._count("misses")
+                return None
+            self._entries.move_to_end(key)
+        self._count("hits")
+        return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.time(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._count("evictions")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SqliteResponseCache(ResponseCache):
+    """Caché persistente en sqlite, compartible entre procesos del mismo servidor."""
+    def __init__(self, path=RESPONSE_CACHE_SQLITE_PATH, max_entries=RESPONSE_CACHE_MAX_ENTRIES,
+                 ttl=RESPONSE_CACHE_TTL):
+        super().__init__(max_entries, ttl)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_access ON responses(last_access)")
+        self._conn.commit()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT value, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and self._expired(row[1]):
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                row = None
+                self._count("expired")
+            if row is None:
+                self._count("misses")
+                return None
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+        self._count("hits")
+        return row[0]
+
+    def set(self, key, value):
+        now = time.time()
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)", (key, value, now, now))
+            excess = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0] - self.max_entries
+            if excess > 0:
+                self._conn.execute(
+                    "DELETE FROM responses WHERE key IN "
+                    "(SELECT key FROM responses ORDER BY last_access LIMIT ?)", (excess,)
+                )
+                self._count("evictions", excess)
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def get_response_cache():
+    """
+    Devuelve el caché de respuestas del proceso según RESPONSE_CACHE_BACKEND
+    ('memory', 'sqlite' o 'none'; con 'none' devuelve None).
+    """
+    global _default_cache
+    if RESPONSE_CACHE_BACKEND == "none":
+        return None
+    with _default_lock:
+        if _default_cache is None:
+            if RESPONSE_CACHE_BACKEND == "sqlite":
+                _default_cache = SqliteResponseCache()
+            else:
+                if RESPONSE_CACHE_BACKEND != "memory":
+                    logging.error(f"Backend de caché desconocido '{RESPONSE_CACHE_BACKEND}', se usa 'memory'.")
+                _default_cache = MemoryResponseCache()
+            registry.register_collector(
+                lambda: {f"response_cache_{name}": value for name, value in _default_cache.stats().items()}
+            )
+        return _default_cache
@@ -0,0 +1,239 @@
+# sentiment.py
+
+import functools
+import itertools
+import logging
+import re
+import unicodedata
+from collections import namedtuple
+from dataclasses import dataclass, asdict
+import numpy as np
+from config import SENTIMENT_LEXICON_PATH, SENTIMENT_NEGATION_WINDOW, SENTIMENT_BATCH_SIZE
+
+# Misma forma que TextBlob(text).sentiment, para no cambiar a quien lo consume
+Sentiment = namedtuple("Sentiment", "polarity subjectivity")
+
+# Palabras que invierten (y atenúan) la polaridad de las siguientes SENTIMENT_NEGATION_WINDOW palabras
+NEGATORS = ("no", "nunca", "jamas", "tampoco", "ni", "sin", "nada", "nadie", "ningun", "ninguno", "ninguna")
+NEGATION_FACTOR = -0.5
+# Modificadores de intensidad de la palabra siguiente
+INTENSIFIERS = {
+    "muy": 1.3, "mucho": 1.3, "mucha": 1.3, "muchisimo": 1.5, "muchisima": 1.5, "bastante": 1.2,
+    "super": 1.4, "realmente": 1.3, "totalmente": 1.4, "extremadamente": 1.5, "sumamente": 1.5,
+    "tan": 1.2, "demasiado": 1.3, "increiblemente": 1.5,
+    "poco": 0.5, "algo": 0.7, "apenas": 0.4, "ligeramente": 0.6,
+}
+# Los signos de fin de frase cortan el alcance de negaciones e intensificadores
+_TOKEN_RE = re.compile(r"[a-z]+|[.!?;:]")
+_STOP_TOKEN = "<fin>"
+
+
+def fold(text):
+    """Minúsculas y sin tildes, para comparar 'difícil' con 'dificil'."""
+    decomposed = unicodedata.normalize("NFKD", text.casefold())
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+def tokenize(text):
+    return [token if token[0].isalpha() else _STOP_TOKEN for token in _TOKEN_RE.findall(fold(text or ""))]
+
+
+class Lexicon:
+    """
+    Léxico codificado en arrays de NumPy: cada palabra tiene un índice y sus valores
+    (polaridad, subjetividad, si es negación, factor de intensidad) están en arrays
+    paralelos. El índice 0 es la palabra desconocida y el 1 el fin de frase.
+    """
+    def __init__(self, entries):
+        words = ["<desconocida>", _STOP_TOKEN] + sorted(set(entries) | set(NEGATORS) | set(INTENSIFIERS))
+        self.vocabulary = {word: idx for idx, word in enumerate(words)}
+        size = len(words)
+        self.polarity = np.zeros(size)
+        self.subjectivity = np.zeros(size)
+        self.scored = np.zeros(size, dtype=bool)
+        self.negator = np.zeros(size, dtype=bool)
+        self.stop = np.zeros(size, dtype=bool)
+        self.intensity = np.ones(size)
+        for word, (polarity, subjectivity) in entries.items():
+            idx = self.vocabulary[word]
+            self.polarity[idx] = polarity
+            self.subjectivity[idx] = subjectivity
+            self.scored[idx] = True
+        for word in NEGATORS:
+            self.negator[self.vocabulary[word]] = True
+        for word, factor in INTENSIFIERS.items():
+            self.intensity[self.vocabulary[word]] = factor
+        self.stop[self.vocabulary[_STOP_TOKEN]] = True
+
+    def __len__(self):
+        return len(self.vocabulary)
+
+    def encode(self, tokens):
+        get = self.vocabulary.get
+        return [get(token, 0) for token in tokens]
+
+
+@functools.lru_cache(maxsize=4)
+def load_lexicon(path=SENTIMENT_LEXICON_PATH):
+    """
+    Carga el léxico (TSV: palabra, polaridad, subjetividad) una sola vez por proceso.
+    """
+    entries = {}
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip() or line.startswith("#"):
+                continue
+            try:
+                word, polarity, subjectivity = line.rstrip("\n").split("\t")
+                entries[fold(word)] = (float(polarity), float(subjectivity))
+            except ValueError:
+                logging.error(f"Línea {line_number} del léxico de sentimiento ignorada: {line.strip()}")
+    logging.info(f"Léxico de sentimiento cargado: {len(entries)} palabras.")
+    return Lexicon(entries)
+
+
+def _score_chunk(texts, lexicon, window):
+    n = len(texts)
+    encoded = [lexicon.encode(tokenize(text)) for text in texts]
+    lengths = np.fromiter((len(ids) for ids in encoded), dtype=np.int64, count=n)
+    ids = np.fromiter(itertools.chain.from_iterable(encoded), dtype=np.int64, count=int(lengths.sum()))
+    docs = np.repeat(np.arange(n), lengths)
+    if not len(ids):
+        return np.zeros(n), np.zeros(n)
+
+    # Frase a la que pertenece cada token: cambia en cada signo de fin y en cada texto nuevo
+    doc_start = np.zeros(len(ids), dtype=bool)
+    doc_start[np.cumsum(lengths)[:-1][lengths[1:] > 0]] = True
+    sentence = np.cumsum(lexicon.stop[ids] | doc_start)
+
+    polarity = lexicon.polarity[ids]
+    subjectivity = lexicon.subjectivity[ids]
+    # La palabra anterior de la misma frase puede intensificar o atenuar la actual
+    factor = np.ones(len(ids))
+    factor[1:] = np.where(sentence[1:] == sentence[:-1], lexicon.intensity[ids[:-1]], 1.0)
+    # Negación: alguna de las 'window' palabras anteriores de la misma frase es un negador
+    negator = lexicon.negator[ids]
+    negated = np.zeros(len(ids), dtype=bool)
+    for k in range(1, min(window, len(ids) - 1) + 1):
+        negated[k:] |= negator[:-k] & (sentence[k:] == sentence[:-k])
+
+    polarity = np.clip(polarity * factor, -1.0, 1.0)
+    polarity = np.where(negated, polarity * NEGATION_FACTOR, polarity)
+    subjectivity = np.clip(subjectivity * factor, 0.0, 1.0)
+
+    # Media por texto de las palabras con sentimiento
+    scored = lexicon.scored[ids]
+    counts = np.bincount(docs[scored], minlength=n)
+    polarity_sum = np.bincount(docs[scored], weights=polarity[scored], minlength=n)
+    subjectivity_sum = np.bincount(docs[scored], weights=subjectivity[scored], minlength=n)
+    has_words = counts > 0
+    return (np.divide(polarity_sum, counts, out=np.zeros(n), where=has_words),
+            np.divide(subjectivity_sum, counts, out=np.zeros(n), where=has_words))
+
+
+def score_batch(texts, lexicon=None, window=SENTIMENT_NEGATION_WINDOW, batch_size=SENTIMENT_BATCH_SIZE):
+    """
+    Calcula la polaridad [-1, 1] y la subjetividad [0, 1] de una lista de textos.
+    Devuelve dos arrays de NumPy. Los textos se procesan por bloques de 'batch_size'
+    para acotar la memoria con colecciones grandes.
+    """
+    lexicon = lexicon or load_lexicon()
+    texts = list(texts)
+    polarity = np.zeros(len(texts))
+    subjectivity = np.zeros(len(texts))
+    for start in range(0, len(texts), batch_size):
+        chunk = texts[start:start + batch_size]
+        polarity[start:start + len(chunk)], subjectivity[start:start + len(chunk)] = \
+            _score_chunk(chunk, lexicon, window)
+    return polarity, subjectivity
+
+
+def analyze_many(texts, lexicon=None):
+    """Como score_batch, pero devuelve una lista de Sentiment(polarity, subjectivity)."""
+    polarity, subjectivity = score_batch(texts, lexicon)
+    return [Sentiment(float(p), float(s)) for p, s in zip(polarity, subjectivity)]
+
+
+def analyze(text, lexicon=None):
+    return analyze_many([text], lexicon)[0]
+
+
+# ==============================
+# Agregados de polaridad por entrevista
+# ==============================
+
+@dataclass
+class SentimentAggregate:
+    """
+    Media, varianza y tendencia (pendiente de la recta de regresión frente al número
+    de respuesta) de la polaridad de una entrevista, actualizadas en O(1) por respuesta.
+    """
+    count: int = 0
+    mean: float = 0.0
+    m2: float = 0.0      # Suma de cuadrados de las desviaciones (algoritmo de Welford)
+    sum_xy: float = 0.0  # Suma de número_de_respuesta * polaridad
+
+    def update(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        self.sum_xy += self.count * value
+        return self
+
+    @property
+    def variance(self):
+        return self.m2 / self.count if self.count else 0.0
+
+    @property
+    def trend(self):
+        n = self.count
+        if n < 2:
+            return 0.0
+        sum_x = n * (n + 1) / 2
+        sum_xx = n * (n + 1) * (2 * n + 1) / 6
+        return (n * self.sum_xy - sum_x * self.mean * n) / (n * sum_xx - sum_x ** 2)
+
+    def summary(self):
+        return {"count": self.count, "mean": self.mean, "variance": self.variance, "trend": self.trend}
+
+    def to_dict(self):
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**{key: data[key] for key in cls.__dataclass_fields__ if key in data})
+
+    @classmethod
+    def from_values(cls, values):
+        aggregate = cls()
+        for value in values:
+            aggregate.update(value)
+        return aggregate
+
+
+def aggregate_by_interview(interview_ids, polarity):
+    """
+    Agregados vectorizados para análisis por lotes: recibe el id de entrevista y la
+    polaridad de cada respuesta (en orden cronológico dentro de cada entrevista) y
+    devuelve un diccionario de arrays con id, count, mean, variance y trend.
+    """
+    interview_ids = np.asarray(interview_ids)
+    polarity = np.asarray(polarity, dtype=float)
+    order = np.argsort(interview_ids, kind="stable")
+    ids, starts, inverse, counts = np.unique(interview_ids[order], return_index=True,
+                                             return_inverse=True, return_counts=True)
+    values = polarity[order]
+    # Número de respuesta (1, 2, ...) dentro de cada entrevista
+    x = np.arange(len(values)) - np.repeat(starts, counts) + 1
+    sum_y = np.bincount(inverse, weights=values)
+    sum_yy = np.bincount(inverse, weights=values * values)
+    sum_xy = np.bincount(inverse, weights=x * values)
+    mean = sum_y / counts
+    variance = np.maximum(sum_yy / counts - mean ** 2, 0.0)
+    sum_x = counts * (counts + 1) / 2
+    sum_xx = counts * (counts + 1) * (2 * counts + 1) / 6
+    denominator = counts * sum_xx - sum_x ** 2
+    trend = np.divide(counts * sum_xy - sum_x * sum_y, denominator,
+                      out=np.zeros(len(ids)), where=denominator > 0)
+    return {"id": ids, "count": counts, "mean": mean, "variance": variance, "trend": trend}
@@ -0,0 +1,634 @@
+# session_store.py
+
+import atexit
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+try:
+    import fcntl
+except ImportError:  # Windows: el bloqueo entre procesos no está disponible
+    fcntl = None
+from config import (
+    SESSION_STORE_BACKEND,
+    SESSION_DIR,
+    SESSION_SQLITE_PATH,
+    SESSION_REDIS_URL,
+    SESSION_TTL,
+    SESSION_FLUSH_INTERVAL,
+    SESSION_IDLE_TIMEOUT,
+    ANALYTICS_ENABLED,
+)
+from interview_session import InterviewSession
+from metrics import registry
+
+
+def encode_state(data):
+    """Serialización compacta del estado: JSON sin espacios comprimido con zlib."""
+    raw = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return zlib.compress(raw, 6)
+
+
+def decode_state(blob):
+    return json.loads(zlib.decompress(blob).decode("utf-8"))
+
+
+# ==============================
+# Backends de almacenamiento
+# ==============================
+
+class SessionStore:
+    """
+    Interfaz común de los almacenes de sesiones. Guardan el estado ya serializado
+    (bytes) por id de sesión.
+    """
+    def load(self, session_id):
+        raise NotImplementedError
+
+    def save_many(self, items):
+        """Guarda de una vez un diccionario {session_id: bytes}."""
+        raise NotImplementedError
+
+    def save(self, session_id, blob):
+        self.save_many({session_id: blob})
+
+    def load_version(self, session_id):
+        """
+        Versión (InterviewState.version) de la sesión guardada, o None si no existe.
+        SessionManager la consulta en cada get(), así que los backends la guardan aparte
+        para leerla sin descargar ni descomprimir el estado.
+        """
+        raise NotImplementedError
+
+    def save_versioned(self, items):
+        """
+        Guarda un diccionario {session_id: (versión, bytes)} pero descarta las sesiones
+        cuya versión guardada es igual o posterior (las ha escrito otro worker). Devuelve
+        el conjunto de ids descartados. La comprobación y la escritura deben ser atómicas
+        para que dos workers no pasen a la vez la comprobación.
+        """
+        raise NotImplementedError
+
+    def delete(self, session_id):
+        raise NotImplementedError
+
+    def list_ids(self):
+        """Devuelve los ids de todas las sesiones guardadas (exportaciones y tareas por lotes)."""
+        raise NotImplementedError
+
+    def prune(self, max_age=SESSION_TTL):
+        """Elimina las sesiones sin actividad en 'max_age' segundos. Devuelve cuántas."""
+        return 0
+
+
+class MemorySessionStore(SessionStore):
+    """Almacén en memoria del proceso (sin persistencia; útil en pruebas)."""
+    def __init__(self):
+        self._items = {}
+        self._lock = threading.Lock()
+
+    def load(self, session_id):
+        with self._lock:
+            entry = self._items.get(session_id)
+        return entry[1] if entry else None
+
+    def load_version(self, session_id):
+        with self._lock:
+            entry = self._items.get(session_id)
+        return entry[2] if entry else None
+
+    def save_many(self, items):
+        now = time.time()
+        versions = {session_id: decode_state(blob).get("version", 0) for session_id, blob in items.items()}
+        with self._lock:
+            for session_id, blob in items.items():
+                self._items[session_id] = (now, blob, versions[session_id])
+
+    def save_versioned(self, items):
+        now = time.time()
+        rejected = set()
+        with self._lock:
+            for session_id, (version, blob) in items.items():
+                entry = self._items.get(session_id)
+                if entry is not None and entry[2] >= version:
+                    rejected.add(session_id)
+                else:
+                    self._items[session_id] = (now, blob, version)
+        return rejected
+
+    def delete(self, session_id):
+        with self._lock:
+            self._items.pop(session_id, None)
+
+    def list_ids(self):
+        with self._lock:
+            return list(self._items)
+
+    def prune(self, max_age=SESSION_TTL):
+        if not max_age:
+            return 0
+        limit = time.time() - max_age
+        with self._lock:
+            expired = [key for key, entry in self._items.items() if entry[0] < limit]
+            for key in expired:
+                del self._items[key]
+        return len(expired)
+
+
+class FileSessionStore(SessionStore):
+    """
+    Un fichero comprimido por sesión en 'directory', escrito de forma atómica, y al lado
+    un fichero '.version' con su versión. Las escrituras versionadas se serializan entre
+    procesos con un bloqueo sobre el fichero '.lock' del directorio.
+    """
+    def __init__(self, directory=SESSION_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._lock_path = os.path.join(directory, ".lock")
+        self._lock = threading.Lock()
+
+    def _path(self, session_id, suffix=".session"):
+        # Los ids se generan con uuid4().hex; se descartan separadores por seguridad
+        safe_id = "".join(ch for ch in session_id if ch.isalnum() or ch in "-_")
+        return os.path.join(self.directory, f"{safe_id}{suffix}")
+
+    def _write(self, path, data):
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def load(self, session_id):
+        try:
+            with open(self._path(session_id), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def load_version(self, session_id):
+        try:
+            with open(self._path(session_id, ".version"), "rb") as f:
+                return int(f.read())
+        except (FileNotFoundError, ValueError):
+            # Sesiones guardadas antes de versionar (o escritura a medias): se lee del estado
+            blob = self.load(session_id)
+            return None if blob is None else decode_state(blob).get("version", 0)
+
+    def _save(self, session_id, version, blob):
+        # Primero el estado y después la versión: un lector nunca ve una versión sin su estado
+        self._write(self._path(session_id), blob)
+        self._write(self._path(session_id, ".version"), str(version).encode("ascii"))
+
+    def save_many(self, items):
+        for session_id, blob in items.items():
+            self._save(session_id, decode_state(blob).get("version", 0), blob)
+
+    def save_versioned(self, items):
+        rejected = set()
+        with self._lock, open(self._lock_path, "a+b") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            # Se vuelve a leer la versión con el bloqueo tomado
+            for session_id, (version, blob) in items.items():
+                current = self.load_version(session_id)
+                if current is not None and current >= version:
+                    rejected.add(session_id)
+                else:
+                    self._save(session_id, version, blob)
+        return rejected
+
+    def delete(self, session_id):
+        for suffix in (".session", ".version"):
+            try:
+                os.remove(self._path(session_id, suffix))
+            except FileNotFoundError:
+                pass
+
+    def list_ids(self):
+        return [name[:-len(".session")] for name in os.listdir(self.directory) if name.endswith(".session")]
+
+    def prune(self, max_age=SESSION_TTL):
+        if not max_age:
+            return 0
+        limit = time.time() - max_age
+        removed = 0
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if name.endswith(".session") and os.path.getmtime(path) < limit:
+                    self.delete(name[:-len(".session")])
+                    removed += 1
+            except OSError:
+                continue
+        return removed
+
+
+class SqliteSessionStore(SessionStore):
+    """Almacén en sqlite (modo WAL), compartible entre los procesos de un mismo servidor."""
+    def __init__(self, path=SESSION_SQLITE_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, data BLOB NOT NULL, updated_at REAL NOT NULL, "
+            "version INTEGER NOT NULL DEFAULT 0)"
+        )
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(sessions)")]
+        if "version" not in columns:
+            # Bases de datos creadas antes de versionar las sesiones
+            self._conn.execute("ALTER TABLE sessions ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+        self._conn.commit()
+        self._lock = threading.Lock()
+
+    def load(self, session_id):
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        return row[0] if row else None
+
+    def load_version(self, session_id):
+        with self._lock:
+            row = self._conn.execute("SELECT version FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        return row[0] if row else None
+
+    def save_many(self, items):
+        now = time.time()
+        rows = [(session_id, blob, now, decode_state(blob).get("version", 0)) for session_id, blob in items.items()]
+        with self._lock:
+            # Una sola transacción para todo el lote
+            self._conn.executemany("INSERT OR REPLACE INTO sessions (id, data, updated_at, version) "
+                                   "VALUES (?, ?, ?, ?)", rows)
+            self._conn.commit()
+
+    def save_versioned(self, items):
+        now = time.time()
+        rejected = set()
+        with self._lock:
+            # Una sola transacción; la condición sobre la versión se evalúa en la propia escritura
+            for session_id, (version, blob) in items.items():
+                cursor = self._conn.execute(
+                    "INSERT INTO sessions (id, data, updated_at, version) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at, "
+                    "version = excluded.version WHERE sessions.version < excluded.version",
+                    (session_id, blob, now, version),
+                )
+                if cursor.rowcount == 0:
+                    rejected.add(session_id)
+            self._conn.commit()
+        return rejected
+
+    def delete(self, session_id):
+        with self._lock:
+            self._conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+            self._conn.commit()
+
+    def list_ids(self):
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT id FROM sessions ORDER BY updated_at")]
+
+    def prune(self, max_age=SESSION_TTL):
+        if not max_age:
+            return 0
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM sessions WHERE updated_at < ?", (time.time() - max_age,))
+            self._conn.commit()
+        return cursor.rowcount
+
+
+class RedisSessionStore(SessionStore):
+    """
+    Almacén en Redis (o cualquier servidor compatible). Las sesiones caducan solas
+    con SESSION_TTL. Se puede inyectar un cliente ya creado, por ejemplo fake_redis.FakeRedis.
+    La versión de cada sesión va en su propia clave ('<prefijo><id>:version') y las
+    escrituras versionadas se hacen con WATCH/MULTI sobre esas claves.
+    """
+    def __init__(self, client=None, url=SESSION_REDIS_URL, prefix="entrevista:", ttl=SESSION_TTL,
+                 max_watch_retries=10):
+        if client is None:
+            import redis  # Dependencia opcional, solo necesaria con este backend
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+        self.max_watch_retries = max_watch_retries
+
+    def _version_key(self, session_id):
+        return f"{self.prefix}{session_id}:version"
+
+    def load(self, session_id):
+        return self.client.get(self.prefix + session_id)
+
+    def load_version(self, session_id):
+        version = self.client.get(self._version_key(session_id))
+        if version is not None:
+            return int(version)
+        # Sesiones guardadas antes de versionar: se lee del estado
+        blob = self.load(session_id)
+        return None if blob is None else decode_state(blob).get("version", 0)
+
+    def _queue_save(self, pipe, session_id, version, blob):
+        pipe.set(self.prefix + session_id, blob, ex=self.ttl or None)
+        pipe.set(self._version_key(session_id), version, ex=self.ttl or None)
+
+    def save_many(self, items):
+        # Un único viaje de red para todo el lote
+        pipe = self.client.pipeline()
+        for session_id, blob in items.items():
+            self._queue_save(pipe, session_id, decode_state(blob).get("version", 0), blob)
+        pipe.execute()
+
+    def save_versioned(self, items):
+        keys = [self._version_key(session_id) for session_id in items]
+        for _ in range(self.max_watch_retries):
+            pipe = self.client.pipeline()
+            try:
+                # Tras WATCH el pipeline ejecuta al momento hasta multi(); si otro cliente
+                # cambia una de las versiones vigiladas, execute() falla y se repite
+                pipe.watch(*keys)
+                current = pipe.mget(keys)
+                rejected = set()
+                pipe.multi()
+                for (session_id, (version, blob)), stored in zip(items.items(), current):
+                    if stored is not None and int(stored) >= version:
+                        rejected.add(session_id)
+                    else:
+                        self._queue_save(pipe, session_id, version, blob)
+                pipe.execute()
+                return rejected
+            except Exception as e:
+                if type(e).__name__ != "WatchError":
+                    raise
+            finally:
+                pipe.reset()
+        raise RuntimeError(f"No se pudo guardar el lote de {len(items)} sesiones: "
+                           f"otros workers lo modificaron {self.max_watch_retries} veces seguidas.")
+
+    def delete(self, session_id):
+        self.client.delete(self.prefix + session_id, self._version_key(session_id))
+
+    def list_ids(self):
+        ids = []
+        for key in self.client.scan_iter(match=self.prefix + "*"):
+            key = key.decode("utf-8") if isinstance(key, bytes) else key
+            if not key.endswith(":version"):
+                ids.append(key[len(self.prefix):])
+        return ids
+
+
+def create_session_store(backend=SESSION_STORE_BACKEND):
+    """Crea el almacén indicado: 'memory', 'file', 'sqlite' o 'redis'."""
+    if backend == "file":
+        return FileSessionStore()
+    if backend == "sqlite":
+        return SqliteSessionStore()
+    if backend == "redis":
+        return RedisSessionStore()
+    if backend != "memory":
+        logging.error(f"Almacén de sesiones desconocido '{backend}', se usa 'memory'.")
+    return MemorySessionStore()
+
+
+# ==============================
+# Gestor de sesiones activas con escritura diferida
+# ==============================
+
+def _record_finished(state):
+    import analytics  # Importación diferida: carga NumPy y sqlite solo al terminar una entrevista
+    analytics.record_finished(state)
+
+
+class SessionManager:
+    """
+    Mantiene en memoria las sesiones activas y las persiste en un SessionStore.
+    - Escritura diferida: save() serializa el estado y lo deja pendiente; un hilo en
+      segundo plano escribe los pendientes en lotes cada 'flush_interval' segundos
+      (varias escrituras de la misma sesión se agrupan en una).
+    - Las sesiones sin actividad durante 'idle_timeout' se descargan de memoria y se
+      vuelven a cargar desde el almacén la próxima vez que se piden.
+    - Cada escritura incrementa InterviewState.version. El gestor recuerda la versión
+      que leyó o escribió por última vez en el almacén; si en get() el almacén tiene una
+      posterior, otro worker ha avanzado la sesión: se recarga y las escrituras
+      pendientes sobre la versión superada se descartan en lugar de pisar sus turnos.
+    - Con 'analytics' (por defecto, ANALYTICS_ENABLED) las entrevistas se registran al
+      finalizar en el almacén analítico (analytics.py).
+    """
+    def __init__(self, store=None, flush_interval=SESSION_FLUSH_INTERVAL, idle_timeout=SESSION_IDLE_TIMEOUT,
+                 interviewer_factory=None, background=True, analytics=ANALYTICS_ENABLED):
+        self.store = store or create_session_store()
+        self.analytics = analytics
+        self.flush_interval = flush_interval
+        self.idle_timeout = idle_timeout
+        self.interviewer_factory = interviewer_factory
+        self._active = {}   # session_id -> (último acceso, InterviewSession)
+        self._pending = {}  # session_id -> (versión, bytes) pendientes de escribir
+        self._flushing = {}  # session_id -> (versión, bytes) del lote que se está escribiendo
+        self._synced = {}   # session_id -> última versión leída o escrita en el almacén
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stats = {"loaded": 0, "created": 0, "evicted": 0, "flushed": 0, "batches": 0,
+                       "reloaded": 0, "conflicts": 0}
+        self._stop = threading.Event()
+        if background:
+            threading.Thread(target=self._run, name="session-writer", daemon=True).start()
+            atexit.register(self.close)
+
+    def _new_session(self, state=None):
+        interviewer = self.interviewer_factory() if self.interviewer_factory else None
+        on_finish = _record_finished if self.analytics else None
+        if state is None:
+            return InterviewSession(interviewer=interviewer, on_finish=on_finish)
+        return InterviewSession.from_dict(state, interviewer=interviewer, on_finish=on_finish)
+
+    def create(self):
+        """Crea una sesión nueva y la registra como activa."""
+        session = self._new_session()
+        with self._lock:
+            self._active[session.session_id] = (time.monotonic(), session)
+            self._stats["created"] += 1
+        return session
+
+    def get(self, session_id):
+        """
+        Devuelve la sesión activa con ese id, cargándola del almacén si no está en
+        memoria o si el almacén tiene una versión posterior (la sesión ha pasado por
+        otro worker). Devuelve None si no existe.
+        """
+        with self._lock:
+            entry = self._active.get(session_id)
+            pending = self._pending.get(session_id) or self._flushing.get(session_id)
+        stale = None
+        if entry is not None:
+            session = entry[1]
+            if not self._is_stale(session_id):
+                with self._lock:
+                    self._active[session_id] = (time.monotonic(), session)
+                return session
+            stale = session
+            with self._lock:
+                # La copia local está superada: se descarta junto con su escritura pendiente
+                if self._active.get(session_id, (None, None))[1] is session:
+                    del self._active[session_id]
+                if session_id in self._pending:
+                    del self._pending[session_id]
+                    self._stats["conflicts"] += 1
+                    logging.error(f"La sesión {session_id} se modificó en otro worker; se descartan los cambios locales.")
+                self._stats["reloaded"] += 1
+            blob = None
+        else:
+            blob = pending[1] if pending is not None else None
+        from_store = blob is None
+        if from_store:
+            try:
+                blob = self.store.load(session_id)
+            except Exception as e:
+                logging.error(f"Error cargando la sesión {session_id}: {e}")
+                return None
+        if blob is None:
+            return None
+        session = self._new_session(decode_state(blob))
+        if stale is not None:
+            # La precarga en curso se conserva si sigue correspondiendo a la pregunta actual
+            session.adopt_runtime(stale)
+        with self._lock:
+            # Otro hilo pudo haberla cargado mientras tanto
+            entry = self._active.setdefault(session_id, (time.monotonic(), session))
+            if from_store and entry[1] is session:
+                self._synced[session_id] = max(self._synced.get(session_id, 0), session.state.version)
+            self._stats["loaded"] += 1
+        return entry[1]
+
+    def _is_stale(self, session_id):
+        """
+        True si el almacén guarda una versión posterior a la última que este gestor leyó
+        o escribió. Mientras la sesión se está escribiendo no se compara: save_versioned
+        ya detecta el conflicto y la versión leída podría ser la que se acaba de escribir.
+        """
+        try:
+            current = self.store.load_version(session_id)
+        except Exception as e:
+            logging.error(f"Error comprobando la versión de la sesión {session_id}: {e}")
+            return False
+        with self._lock:
+            if current is None or session_id in self._flushing:
+                return False
+            synced = self._synced.get(session_id)
+        return synced is not None and current > synced
+
+    def get_or_create(self, session_id=None):
+        session = self.get(session_id) if session_id else None
+        return session or self.create()
+
+    def save(self, session):
+        """Marca la sesión para guardarse en la próxima escritura por lotes."""
+        session.state.version += 1
+        blob = encode_state(session.to_dict())
+        with self._lock:
+            self._pending[session.session_id] = (session.state.version, blob)
+            self._active[session.session_id] = (time.monotonic(), session)
+
+    def delete(self, session_id):
+        with self._lock:
+            self._active.pop(session_id, None)
+            self._pending.pop(session_id, None)
+            self._synced.pop(session_id, None)
+        self.store.delete(session_id)
+
+    def flush(self):
+        """Escribe en el almacén todas las sesiones pendientes en un solo lote."""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+                self._flushing = batch
+            if not batch:
+                return 0
+            try:
+                rejected = self.store.save_versioned(batch)
+            except Exception as e:
+                logging.error(f"Error guardando {len(batch)} sesiones: {e}")
+                with self._lock:
+                    # Se reintenta en el siguiente ciclo sin pisar escrituras más recientes
+                    for session_id, item in batch.items():
+                        self._pending.setdefault(session_id, item)
+                    self._flushing = {}
+                return 0
+            with self._lock:
+                self._flushing = {}
+                for session_id, (version, _) in batch.items():
+                    if session_id not in rejected:
+                        self._synced[session_id] = max(self._synced.get(session_id, 0), version)
+                for session_id in rejected:
+                    # Otro worker guardó antes una versión igual o posterior: se descarta la
+                    # copia local para que el siguiente get() la recargue del almacén
+                    logging.error(f"Escritura de la sesión {session_id} rechazada: el almacén ya tiene la versión "
+                                  f"{batch[session_id][0]} o una posterior.")
+                    entry = self._active.get(session_id)
+                    if entry is not None and entry[1].state.version <= batch[session_id][0] \
+                            and session_id not in self._pending:
+                        del self._active[session_id]
+                        self._synced.pop(session_id, None)
+                self._stats["conflicts"] += len(rejected)
+                self._stats["flushed"] += len(batch) - len(rejected)
+                self._stats["batches"] += 1
+            return len(batch) - len(rejected)
+
+    def evict_idle(self):
+        """Descarga de memoria las sesiones inactivas (se guardan antes si hay cambios)."""
+        if not self.idle_timeout:
+            return 0
+        limit = time.monotonic() - self.idle_timeout
+        with self._lock:
+            idle = [session_id for session_id, (accessed, _) in self._active.items() if accessed < limit]
+        if not idle:
+            return 0
+        self.flush()
+        evicted = 0
+        with self._lock:
+            for session_id in idle:
+                entry = self._active.get(session_id)
+                # Se conservan las que se han usado o modificado desde la comprobación
+                if entry and entry[0] < limit and session_id not in self._pending:
+                    del self._active[session_id]
+                    self._synced.pop(session_id, None)
+                    evicted += 1
+            self._stats["evicted"] += evicted
+        return evicted
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, active=len(self._active), pending=len(self._pending))
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+                self.evict_idle()
+            except Exception as e:
+                logging.error(f"Error en el guardado de sesiones en segundo plano: {e}")
+
+    def close(self):
+        self._stop.set()
+        self.flush()
+
+
+_default_manager = None
+_default_lock = threading.Lock()
+
+
+def get_session_manager():
+    """Devuelve el gestor de sesiones compartido por todo el proceso."""
+    global _default_manager
+    with _default_lock:
+        if _default_manager is None:
+            _default_manager = SessionManager()
+            try:
+                removed = _default_manager.store.prune()
+                if removed:
+                    logging.info(f"Eliminadas {removed} sesiones caducadas del almacén.")
+            except Exception as e:
+                logging.error(f"Error limpiando sesiones caducadas: {e}")
+            registry.register_collector(
+                lambda: {f"sessions_{name}": value for name, value in _default_manager.stats().items()}
+            )
+        return _default_manager
@@ -0,0 +1,136 @@
+# startup.py
+
+import argparse
+import importlib
+import json
+import logging
+import statistics
+import subprocess
+import sys
+import threading
+from config import BASE_DIR, STARTUP_IMPORT_BUDGET, STARTUP_WARMUP
+
+# Dependencias pesadas que no deben cargarse al importar app.py (se importan al usarse)
+HEAVY_MODULES = ("boto3", "botocore", "plotly", "numpy", "PyPDF2", "fpdf", "streamlit_lottie", "requests")
+# Módulos que se precargan en segundo plano tras pintar la primera pantalla
+WARMUP_MODULES = ("boto3", "PyPDF2", "sentiment", "plotly.express", "fpdf", "streamlit_lottie")
+
+_COLD_START_SNIPPET = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "modules": sorted(sys.modules)}}))
+"""
+
+
+def profile_imports(module="app", top=15, python=sys.executable):
+    """
+    Importa 'module' en un intérprete nuevo con '-X importtime' y devuelve
+    (segundos totales, [(módulo, acumulado_s, propio_s), ...]) con los 'top' más lentos.
+    """
+    result = subprocess.run([python, "-X", "importtime", "-c", f"import {module}"],
+                            capture_output=True, text=True, cwd=BASE_DIR, timeout=120)
+    rows = []
+    for line in result.stderr.splitlines():
+        # Formato: "import time:  self [us] | cumulative | imported package"
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        try:
+            own, cumulative, name = line[len("import time:"):].split("|")
+            rows.append((name.strip(), int(cumulative) / 1e6, int(own) / 1e6))
+        except ValueError:
+            continue
+    total = next((cumulative for name, cumulative, _ in rows if name == module), 0.0)
+    rows.sort(key=lambda row: row[1], reverse=True)
+    return total, rows[:top]
+
+
+def measure_cold_start(module="app", runs=3, python=sys.executable, budget=STARTUP_IMPORT_BUDGET):
+    """
+    Mide en 'runs' intérpretes nuevos cuánto tarda en importarse 'module' e indica qué
+    dependencias pesadas se cargaron de forma anticipada.
+    """
+    timings = []
+    loaded = set()
+    for _ in range(runs):
+        result = subprocess.run([python, "-c", _COLD_START_SNIPPET.format(module=module)],
+                                capture_output=True, text=True, cwd=BASE_DIR, timeout=120)
+        try:
+            # La última línea es la del fragmento; antes puede haber avisos del módulo importado
+            report = json.loads(result.stdout.strip().splitlines()[-1])
+        except (IndexError, json.JSONDecodeError):
+            raise RuntimeError(f"No se pudo importar {module}: {result.stderr.strip()[-500:]}")
+        timings.append(report["seconds"])
+        loaded.update(name for name in report["modules"] if name.split(".")[0] in HEAVY_MODULES)
+    median = statistics.median(timings)
+    return {
+        "module": module,
+        "runs": runs,
+        "median": round(median, 4),
+        "min": round(min(timings), 4),
+        "max": round(max(timings), 4),
+        "budget": budget,
+        "within_budget": median <= budget,
+        "heavy_modules_loaded": sorted({name.split(".")[0] for name in loaded}),
+    }
+
+
+_warmup_started = False
+_warmup_lock = threading.Lock()
+
+
+def _warm_up():
+    for name in WARMUP_MODULES:
+        try:
+            importlib.import_module(name)
+        except Exception as e:
+            logging.error(f"No se pudo precargar {name}: {e}")
+    try:
+        import sentiment
+        sentiment.load_lexicon()
+    except Exception as e:
+        logging.error(f"No se pudo precargar el léxico de sentimiento: {e}")
+    try:
+        from bedrock_client import get_bedrock_client
+        get_bedrock_client()
+    except Exception as e:
+        logging.error(f"No se pudo precargar el cliente de Bedrock: {e}")
+
+
+def warm_up_in_background():
+    """
+    Precarga una sola vez por proceso, en un hilo aparte, las dependencias pesadas y el
+    cliente de Bedrock, para que la primera pregunta no pague su inicialización.
+    """
+    global _warmup_started
+    if not STARTUP_WARMUP:
+        return
+    with _warmup_lock:
+        if _warmup_started:
+            return
+        _warmup_started = True
+    threading.Thread(target=_warm_up, name="startup-warmup", daemon=True).start()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Perfil de importación y presupuesto de arranque en frío.")
+    parser.add_argument("--module", default="app", help="Módulo a importar (por defecto, app)")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=15, help="Número de imports más lentos a mostrar")
+    parser.add_argument("--budget", type=float, default=STARTUP_IMPORT_BUDGET, help="Presupuesto en segundos")
+    args = parser.parse_args(argv)
+
+    total, rows = profile_imports(args.module, args.top)
+    print(f"Perfil de importación de '{args.module}' ({total:.3f}s acumulados):")
+    for name, cumulative, own in rows:
+        print(f"  {cumulative:8.3f}s  {own:8.3f}s  {name}")
+    result = measure_cold_start(args.module, args.runs, budget=args.budget)
+    print(json.dumps(result, indent=2))
+    if result["heavy_modules_loaded"]:
+        print(f"Aviso: dependencias pesadas cargadas al importar: {', '.join(result['heavy_modules_loaded'])}")
+    return 0 if result["within_budget"] else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,73 @@
+# test_batch_evaluation.py
+
+import json
+from batch_evaluation import _stub_reply, batch_interviewer, evaluate_with_retry, load_results, run_batch
+from config import CIRCUIT_FAILURE_THRESHOLD
+from fake_bedrock import FakeBedrockClient
+from invocation import ModelThrottledError
+
+REPLY = '{"puntuacion": 7, "justificacion": "Bien."}'
+
+
+class FlakyInterviewer:
+    """Falla con throttling las primeras 'failures' llamadas y después responde."""
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.calls = 0
+
+    def evaluate_response(self, question, answer):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise ModelThrottledError("ThrottlingException")
+        return REPLY
+
+
+class NoLimit:
+    def acquire(self):
+        pass
+
+
+def write_jsonl(path, rows):
+    path.write_text("".join(json.dumps(row) + "\n" for row in rows), encoding="utf-8")
+
+
+def test_retries_are_bounded_by_max_retries():
+    interviewer = FlakyInterviewer(failures=10)
+    record = {"id": "1", "question": "¿Por qué?", "answer": "Porque sí."}
+    result = evaluate_with_retry(interviewer, record, NoLimit(), max_retries=2, backoff_base=0)
+    assert result["error"] and result["attempts"] == 3
+    assert interviewer.calls == 3
+
+
+def test_resume_keeps_one_line_per_id(tmp_path):
+    input_path, output_path = tmp_path / "input.jsonl", tmp_path / "output.jsonl"
+    write_jsonl(input_path, [{"id": "a", "question": "q1", "answer": "r1"},
+                             {"id": "b", "question": "q2", "answer": "r2"}])
+    # Ejecución anterior: 'a' correcto, 'b' fallido y una línea truncada al final
+    output_path.write_text(
+        json.dumps({"id": "a", "score": 8, "error": None}) + "\n"
+        + json.dumps({"id": "b", "score": None, "error": "ModelThrottledError: x"}) + "\n"
+        + '{"id": "b", "sco', encoding="utf-8")
+
+    interviewer = FlakyInterviewer()
+    stats = run_batch(interviewer, str(input_path), str(output_path), concurrency=1, rate=0, max_retries=0)
+    assert stats["skipped"] == 1 and stats["evaluated"] == 1 and interviewer.calls == 1
+
+    lines = output_path.read_text(encoding="utf-8").splitlines()
+    assert sorted(json.loads(line)["id"] for line in lines) == ["a", "b"]
+    results = load_results(str(output_path))
+    assert results["a"]["score"] == 8 and results["b"]["score"] == 7 and results["b"]["error"] is None
+
+
+def test_throttling_burst_does_not_fail_the_batch(tmp_path):
+    input_path, output_path = tmp_path / "input.jsonl", tmp_path / "output.jsonl"
+    records = [{"id": str(n), "question": f"q{n}", "answer": f"r{n}"} for n in range(20)]
+    write_jsonl(input_path, records)
+    # Ráfaga más larga que el umbral del circuit breaker del invocador compartido
+    burst = CIRCUIT_FAILURE_THRESHOLD + 1
+    client = FakeBedrockClient(reply=_stub_reply, faults=["ThrottlingException"] * burst)
+
+    stats = run_batch(batch_interviewer(client), str(input_path), str(output_path), concurrency=4,
+                      rate=0, max_retries=burst, backoff_base=0.001, backoff_max=0.001)
+    assert stats["evaluated"] == len(records) and stats["failed"] == 0
+    assert len(client.calls) == len(records) + burst
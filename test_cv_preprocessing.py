@@ -0,0 +1,49 @@
+# test_cv_preprocessing.py
+
+from cv_preprocessing import preprocess_cv
+
+PAGE_1 = """Ana Pérez - ana@example.com
+Madrid
+EXPERIENCIA
+Empresa A
+Desarrolladora backend
+2019
+Responsabilidades:
+- APIs en Python
+Tecnologías: Python
+- Mentoría de nuevas incorporaciones
+- Revisión de código
+Curriculum vitae
+1"""
+
+PAGE_2 = """Ana Pérez - ana@example.com
+- Documentación técnica
+Empresa B
+Desarrolladora backend
+Responsabilidades:
+- Migración a la nube
+Tecnologías: Python
+Tecnologías: Python
+- Guardias de producción
+- Automatización de despliegues
+Curriculum vitae
+Página 2 de 2"""
+
+
+def test_page_numbers_and_repeated_headers_are_removed():
+    compact = preprocess_cv([PAGE_1, PAGE_2])
+    assert compact.sections["cabecera"] == ["Ana Pérez - ana@example.com", "Madrid"]
+    experience = compact.sections["experiencia"]
+    assert "1" not in experience and "Página 2 de 2" not in experience
+    assert "Ana Pérez - ana@example.com" not in experience
+    assert "Curriculum vitae" not in experience
+
+
+def test_content_repeated_across_jobs_is_kept():
+    experience = preprocess_cv([PAGE_1, PAGE_2]).sections["experiencia"]
+    # Un año en una línea propia no es un número de página
+    assert "2019" in experience
+    assert experience.count("Desarrolladora backend") == 2
+    assert experience.count("Responsabilidades:") == 2
+    # Solo se descartan las líneas repetidas seguidas
+    assert experience.count("Tecnologías: Python") == 2
@@ -0,0 +1,21 @@
+# test_evaluation.py
+
+import pytest
+from evaluation import parse_evaluation
+
+
+@pytest.mark.parametrize("raw, expected", [("0", 1.0), ("11", 10.0), ("10.5", 10.0), ("-3", 1.0), ("7", 7.0),
+                                           ('"7,5"', 7.5)])
+def test_scores_are_clamped_to_range(raw, expected):
+    evaluation = parse_evaluation(f'{{"puntuacion": {raw}, "dimensiones": {{"claridad": {raw}}}}}')
+    assert evaluation.structured
+    assert evaluation.score == expected
+    assert evaluation.dimensions == {"claridad": expected}
+
+
+def test_free_text_score_is_clamped():
+    assert parse_evaluation("Puntuación: 12/10. Excelente.").score == 10.0
+
+
+def test_non_numeric_score_is_dropped():
+    assert parse_evaluation('{"puntuacion": "alta", "justificacion": "Bien."}').score is None
@@ -0,0 +1,80 @@
+# test_interview_session.py
+
+import json
+from types import SimpleNamespace
+from fake_bedrock import FakeBedrockClient
+from interview_session import InterviewSession
+from interviewer import Interviewer
+from invocation import CircuitBreaker, ModelInvocationError, ResilientInvoker
+
+EVALUATION_REPLY = '"puntuacion": 8, "justificacion": "Respuesta concreta."}'
+
+
+def reply(body):
+    # Las evaluaciones piden el JSON de EVALUATION_FORMAT; el resto son preguntas
+    if "justificacion" in json.dumps(body, ensure_ascii=False):
+        return EVALUATION_REPLY
+    return "¿Qué proyecto te ha enseñado más?"
+
+
+def make_session(faults=None):
+    client = FakeBedrockClient(reply=reply, faults=faults)
+    invoker = ResilientInvoker(max_attempts=1, breaker=CircuitBreaker(failure_threshold=float("inf")))
+    session = InterviewSession(interviewer=Interviewer(client=client, invoker=invoker), prefetch=False)
+    session.start("Ana Pérez. Desarrolladora backend con cinco años de experiencia en Python.", "Backend")
+    return session, client
+
+
+def test_evaluation_is_on_the_turn_when_the_stream_is_closed_early():
+    session, _ = make_session()
+    session.next_question()
+    chunks = session.submit_answer_stream("Migré un monolito a microservicios.")
+    evaluation = next(chunks)
+    chunks.close()
+    turn = session.state.conversation.turns[-1]
+    assert turn.evaluation == evaluation
+    assert session.state.evaluations == [evaluation]
+    assert session.state.evaluation_results[0]["score"] == 8
+
+
+def test_failed_evaluation_keeps_results_aligned_with_turns():
+    session, client = make_session()
+    session.next_question()
+    session.submit_answer("Primera respuesta.")
+    session.next_question()
+    client.faults = ["ValidationException"]
+    try:
+        session.submit_answer("Segunda respuesta.")
+    except ModelInvocationError:
+        pass
+    session.next_question()
+    session.submit_answer("Tercera respuesta.")
+
+    state = session.state
+    assert [bool(text) for text in state.evaluations] == [True, False, True]
+    assert [result["score"] for result in state.evaluation_results] == [8, None, 8]
+    assert [turn.evaluation for turn in state.conversation.turns] == state.evaluations
+    assert session.score_summary()["count"] == 2
+
+
+def test_charts_keep_question_numbers_when_sentiment_fails(monkeypatch):
+    import interview_session
+    from pdf_report import iter_report_blocks, render_report
+    polarities = iter([SimpleNamespace(polarity=0.5, subjectivity=0.5), None,
+                       SimpleNamespace(polarity=-0.25, subjectivity=0.5)])
+    monkeypatch.setattr(interview_session, "sentiment_analysis", lambda answer: next(polarities))
+    session, client = make_session()
+    for n, fault in enumerate([None, "ValidationException", None], start=1):
+        session.next_question()
+        client.faults = [fault]
+        try:
+            session.submit_answer(f"Respuesta {n}.")
+        except ModelInvocationError:
+            pass
+
+    state = session.state
+    assert state.polarity_by_question() == [(1, 0.5), (3, -0.25)]
+    assert state.scores_by_question() == [(1, 8), (3, 8)]
+    charts = [payload for kind, payload in iter_report_blocks(state) if kind == "chart"]
+    assert charts == [[(1, 0.5), (3, -0.25)]]
+    assert render_report(state).startswith(b"%PDF")
@@ -0,0 +1,192 @@
+# test_invocation.py
+
+import json
+import threading
+import time
+import pytest
+from fake_bedrock import FakeBedrockClient, FakeClientError
+from interviewer import Interviewer
+from invocation import (
+    AdaptiveConcurrencyLimiter,
+    CircuitBreaker,
+    CircuitOpenError,
+    ConcurrencyLimitError,
+    ModelRequestError,
+    ModelThrottledError,
+    ModelUnavailableError,
+    ResilientInvoker,
+)
+
+
+class Flaky:
+    """Lanza los errores de 'codes' (None = éxito) llamada a llamada y después responde 'ok'."""
+    def __init__(self, *codes):
+        self.codes = list(codes)
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        code = self.codes.pop(0) if self.codes else None
+        if code:
+            raise FakeClientError(code, 429 if code == "ThrottlingException" else 400)
+        return "ok"
+
+
+def make_invoker(**kwargs):
+    sleeps = []
+    kwargs.setdefault("breaker", CircuitBreaker(failure_threshold=100))
+    invoker = ResilientInvoker(sleep=sleeps.append, **kwargs)
+    return invoker, sleeps
+
+
+def test_transient_errors_are_retried_with_capped_backoff():
+    invoker, sleeps = make_invoker(max_attempts=4, backoff_base=0.5, backoff_max=1.0)
+    call = Flaky("ThrottlingException", "ServiceUnavailableException", "ThrottlingException")
+    assert invoker.call(call) == "ok"
+    assert call.calls == 4
+    assert len(sleeps) == 3 and all(0 <= delay <= 1.0 for delay in sleeps)
+    stats = invoker.stats()
+    assert stats["retries"] == 3 and stats["throttled"] == 2 and stats["failures"] == 0
+
+
+def test_gives_up_after_max_attempts():
+    invoker, sleeps = make_invoker(max_attempts=3)
+    call = Flaky(*["ThrottlingException"] * 5)
+    with pytest.raises(ModelThrottledError):
+        invoker.call(call)
+    assert call.calls == 3 and len(sleeps) == 2
+    assert invoker.stats()["failures"] == 1
+
+
+def test_non_retryable_errors_fail_at_once():
+    invoker, sleeps = make_invoker(max_attempts=4)
+    call = Flaky("ValidationException")
+    with pytest.raises(ModelRequestError):
+        invoker.call(call)
+    assert call.calls == 1 and sleeps == []
+    # Un error de la petición no cuenta como fallo del servicio
+    assert invoker.breaker.failures == 0
+
+
+def test_deadline_stops_retries():
+    invoker, sleeps = make_invoker(max_attempts=10, backoff_base=5, backoff_max=5, deadline=0.001)
+    call = Flaky("ThrottlingException", "ThrottlingException")
+    # El jitter puede dar una espera de 0; se fuerza una espera mayor que el plazo
+    invoker._backoff = lambda attempt: 1.0
+    with pytest.raises(ModelThrottledError):
+        invoker.call(call)
+    assert call.calls == 1 and sleeps == []
+
+
+def test_breaker_opens_after_consecutive_failures_and_rejects_without_calling():
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=60)
+    invoker, _ = make_invoker(max_attempts=1, breaker=breaker)
+    for _ in range(3):
+        with pytest.raises(ModelUnavailableError):
+            invoker.call(Flaky("ServiceUnavailableException"))
+    assert breaker.state == CircuitBreaker.OPEN
+    call = Flaky()
+    with pytest.raises(CircuitOpenError):
+        invoker.call(call)
+    assert call.calls == 0 and invoker.stats()["rejected"] == 1
+
+
+def test_success_resets_the_failure_count():
+    breaker = CircuitBreaker(failure_threshold=2)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_breaker_half_opens_with_a_single_trial_call():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.01)
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    time.sleep(0.02)
+    breaker.before_call()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    # Mientras la llamada de prueba está en curso se rechaza el resto
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.before_call()
+
+
+def test_failed_trial_reopens_the_breaker():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.01)
+    breaker.record_failure()
+    time.sleep(0.02)
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_neutral_result_releases_the_trial():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.01)
+    breaker.record_failure()
+    time.sleep(0.02)
+    breaker.before_call()
+    breaker.record_neutral()
+    breaker.before_call()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+
+
+def test_limiter_halves_on_throttling_and_recovers_additively():
+    limiter = AdaptiveConcurrencyLimiter(initial=8, minimum=1, maximum=8)
+    limiter.acquire()
+    limiter.release(throttled=True)
+    assert limiter.limit == 4
+    for _ in range(3):
+        limiter.acquire()
+        limiter.release(throttled=True)
+    assert limiter.limit == 1
+    for _ in range(20):
+        limiter.acquire()
+        limiter.release()
+    assert 4 < limiter.limit <= 8
+    for _ in range(200):
+        limiter.acquire()
+        limiter.release()
+    assert limiter.limit == 8
+
+
+def test_limiter_blocks_at_the_limit_and_times_out():
+    limiter = AdaptiveConcurrencyLimiter(initial=1, minimum=1, maximum=1)
+    limiter.acquire()
+    with pytest.raises(ConcurrencyLimitError):
+        limiter.acquire(timeout=0.01)
+    # Al liberar el hueco, una espera en curso lo obtiene
+    acquired = threading.Event()
+    waiter = threading.Thread(target=lambda: (limiter.acquire(timeout=1), acquired.set()))
+    waiter.start()
+    limiter.release()
+    waiter.join()
+    assert acquired.is_set() and limiter.in_flight == 1
+
+
+def test_throttling_from_fake_bedrock_is_retried_and_shrinks_the_limit():
+    client = FakeBedrockClient(reply='"puntuacion": 7}', faults=["ThrottlingException"] * 2)
+    limiter = AdaptiveConcurrencyLimiter(initial=8, minimum=1, maximum=8)
+    invoker, sleeps = make_invoker(max_attempts=4, limiter=limiter)
+    interviewer = Interviewer(client=client, invoker=invoker, cache_evaluations=False)
+    assert json.loads("{" + interviewer.evaluate_response("¿Por qué?", "Porque sí."))["puntuacion"] == 7
+    assert len(client.calls) == 3 and len(sleeps) == 2
+    assert limiter.limit < 8 and limiter.in_flight == 0
+
+
+def test_fault_rate_with_default_breaker_opens_the_circuit():
+    client = FakeBedrockClient(fault_rate=1.0, fault_code="ServiceUnavailableException", seed=1)
+    invoker, _ = make_invoker(max_attempts=1, breaker=CircuitBreaker(failure_threshold=2, reset_timeout=60))
+    interviewer = Interviewer(client=client, invoker=invoker)
+    errors = []
+    for _ in range(4):
+        try:
+            interviewer.evaluate_response("¿Por qué?", "Porque sí.")
+        except (ModelUnavailableError, CircuitOpenError) as e:
+            errors.append(type(e).__name__)
+    assert errors == ["ModelUnavailableError", "ModelUnavailableError", "CircuitOpenError", "CircuitOpenError"]
+    assert len(client.calls) == 2
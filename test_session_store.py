@@ -0,0 +1,181 @@
+# test_session_store.py
+
+import threading
+import time
+import pytest
+from fake_redis import FakeRedis
+from session_store import (
+    FileSessionStore,
+    MemorySessionStore,
+    RedisSessionStore,
+    SessionManager,
+    SqliteSessionStore,
+    decode_state,
+    encode_state,
+)
+
+
+def make_store(kind, tmp_path):
+    if kind == "sqlite":
+        return SqliteSessionStore(str(tmp_path / "sessions.sqlite3"))
+    if kind == "file":
+        return FileSessionStore(str(tmp_path / "sessions"))
+    if kind == "redis":
+        return RedisSessionStore(client=FakeRedis())
+    return MemorySessionStore()
+
+
+@pytest.fixture(params=["memory", "sqlite", "file", "redis"])
+def store(request, tmp_path):
+    return make_store(request.param, tmp_path)
+
+
+def make_manager(store):
+    return SessionManager(store=store, background=False, analytics=False)
+
+
+def test_session_moves_between_workers(store):
+    worker_a, worker_b = make_manager(store), make_manager(store)
+
+    # La entrevista empieza en el worker A
+    session = worker_a.create()
+    session.state.position = "Backend"
+    session.state.num_questions = 1
+    worker_a.save(session)
+    worker_a.flush()
+
+    # Pasa al worker B, que registra un turno más
+    moved = worker_b.get(session.session_id)
+    assert moved.state.num_questions == 1
+    moved.state.num_questions = 2
+    worker_b.save(moved)
+    worker_b.flush()
+
+    # De vuelta en A: se recarga la versión del almacén en lugar de la copia en memoria
+    back = worker_a.get(session.session_id)
+    assert back is not session
+    assert back.state.num_questions == 2
+    back.state.num_questions = 3
+    worker_a.save(back)
+    worker_a.flush()
+    assert decode_state(store.load(session.session_id))["num_questions"] == 3
+    assert worker_a.stats()["reloaded"] == 1
+
+
+def test_stale_write_does_not_overwrite_newer_version(store):
+    worker_a, worker_b = make_manager(store), make_manager(store)
+    session = worker_a.create()
+    session.state.num_questions = 1
+    worker_a.save(session)
+    worker_a.flush()
+
+    moved = worker_b.get(session.session_id)
+    moved.state.num_questions = 2
+    worker_b.save(moved)
+    worker_b.flush()
+
+    # A sigue escribiendo sobre su copia antigua sin volver a pedirla
+    session.state.num_questions = 99
+    worker_a.save(session)
+    assert worker_a.flush() == 0
+    assert worker_a.stats()["conflicts"] == 1
+    assert decode_state(store.load(session.session_id))["num_questions"] == 2
+    assert worker_a.get(session.session_id).state.num_questions == 2
+
+
+def test_pending_write_is_discarded_when_store_is_newer(store):
+    worker_a, worker_b = make_manager(store), make_manager(store)
+    session = worker_a.create()
+    worker_a.save(session)
+    worker_a.flush()
+
+    moved = worker_b.get(session.session_id)
+    moved.state.num_questions = 5
+    worker_b.save(moved)
+    worker_b.flush()
+
+    # A tiene un cambio sin escribir basado en la versión anterior
+    session.state.num_questions = 1
+    worker_a.save(session)
+    assert worker_a.get(session.session_id).state.num_questions == 5
+    assert worker_a.flush() == 0
+    assert decode_state(store.load(session.session_id))["num_questions"] == 5
+
+
+def test_get_does_not_report_a_conflict_while_flushing(store):
+    manager = make_manager(store)
+    session = manager.create()
+    manager.save(session)
+    manager.flush()
+    seen = []
+
+    class ReadDuringWrite:
+        # Un get() de otro hilo llega justo después de escribir y antes de que flush termine
+        def __getattr__(self, name):
+            return getattr(store, name)
+
+        def save_versioned(self, items):
+            rejected = store.save_versioned(items)
+            seen.append(manager.get(session.session_id))
+            return rejected
+
+    manager.store = ReadDuringWrite()
+    manager.save(session)
+    assert manager.flush() == 1
+    assert seen == [session]
+    assert manager.get(session.session_id) is session
+    assert manager.stats()["conflicts"] == 0 and manager.stats()["reloaded"] == 0
+
+
+def test_reload_keeps_prefetched_work(store):
+    worker_a, worker_b = make_manager(store), make_manager(store)
+    session = worker_a.create()
+    worker_a.save(session)
+    worker_a.flush()
+    moved = worker_b.get(session.session_id)
+    worker_b.save(moved)
+    worker_b.flush()
+
+    prefetched = object()
+    session._prefetched = prefetched
+    assert worker_a.get(session.session_id)._prefetched is prefetched
+
+
+@pytest.mark.parametrize("kind", ["memory", "sqlite", "file", "redis"])
+def test_concurrent_versioned_writes_accept_one(kind, tmp_path):
+    store = make_store(kind, tmp_path)
+    store.save_versioned({"s": (1, encode_state({"version": 1, "writer": "base"}))})
+    if kind == "redis":
+        # Se ensancha la ventana entre leer la versión y escribir
+        mget = store.client.mget
+        store.client.mget = lambda keys: (mget(keys), time.sleep(0.01))[0]
+    writers = 8
+    barrier = threading.Barrier(writers)
+    accepted = []
+
+    def write(n):
+        blob = encode_state({"version": 2, "writer": n})
+        barrier.wait()
+        if not store.save_versioned({"s": (2, blob)}):
+            accepted.append(n)
+
+    threads = [threading.Thread(target=write, args=(n,)) for n in range(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(accepted) == 1
+    assert store.load_version("s") == 2
+    assert decode_state(store.load("s"))["writer"] == accepted[0]
+
+
+def test_redis_version_check_does_not_fetch_the_state():
+    client = FakeRedis()
+    store = RedisSessionStore(client=client)
+    store.save_versioned({"s": (3, encode_state({"version": 3, "cv_text": "x" * 10000}))})
+    fetched = []
+    get = client.get
+    client.get = lambda key: fetched.append(key) or get(key)
+    assert store.load_version("s") == 3
+    assert fetched == ["entrevista:s:version"]
+    assert store.list_ids() == ["s"]